@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""
+Multi-Workload Backup Orchestrator
+Runs the SharePoint, Exchange and Dataverse backups in one process instead of
+three separate jobs. The workloads share:
+- one pool of work slots (--max-concurrency); a work item is one mailbox, one
+  SharePoint site or the Dataverse environment, and free slots go to the highest
+  priority class still waiting (by default mailboxes, Dataverse, sites, then
+  archive sites)
+- one download bandwidth budget (--max-bandwidth)
+- one Graph transport: pooled HTTP session, adaptive rate limiter and access token
+Each run writes one consolidated report (orchestrator_report_<timestamp>.json).
+
+Usage:
+    python3 backup_orchestrator.py [--workloads sharepoint,exchange,dataverse] [--type incremental]
+                                   [--max-concurrency 8] [--max-bandwidth 50]
+                                   [--priority mailbox,dataverse,site,archive]
+"""
+
+import os
+import sys
+import json
+import queue
+import re
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from loguru import logger
+from graph_throttle import get_graph_limiter, get_bandwidth_limiter, set_bandwidth_limit
+from mailbox_scheduler import DEFAULT_PER_MAILBOX_CONCURRENCY
+from sharepoint_incremental_optimized import OptimizedSharePointBackup, configure_logging
+from exchange_incremental_optimized import OptimizedExchangeBackup
+
+WORKLOADS = ('sharepoint', 'exchange', 'dataverse')
+
+# Default order in which waiting work items get free slots
+PRIORITY_CLASSES = ('mailbox', 'dataverse', 'site', 'archive')
+
+# Work items running at the same time across all workloads
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Sites whose name or URL matches are scheduled as 'archive'
+DEFAULT_ARCHIVE_PATTERN = r'archive|arkiv'
+
+# Credentials each workload needs
+REQUIRED_ENV = {
+    'sharepoint': ('SHAREPOINT_CLIENT_ID', 'SHAREPOINT_CLIENT_SECRET', 'SHAREPOINT_TENANT_ID'),
+    'exchange': ('EXCHANGE_CLIENT_ID', 'EXCHANGE_CLIENT_SECRET', 'EXCHANGE_TENANT_ID'),
+    'dataverse': ('DATAVERSE_ENVIRONMENT_URL', 'DATAVERSE_TENANT_ID', 'DATAVERSE_CLIENT_ID',
+                  'DATAVERSE_CLIENT_SECRET'),
+}
+
+
+@dataclass
+class WorkItem:
+    """One schedulable unit of a workload."""
+    workload: str
+    priority_class: str
+    name: str
+    run: Callable[[], Optional[Dict[str, Any]]]
+    size: int = 0  # Larger items start first within their class
+
+
+class PriorityWorkPool:
+    """
+    Fixed number of worker threads taking work items by priority class.
+
+    A worker that becomes free always takes the highest class still waiting
+    (largest first within a class), so lower classes only get slots that higher
+    classes leave unused.
+    """
+
+    def __init__(self, max_concurrency: int, priority_order: Sequence[str]):
+        """
+        Initialize work pool.
+
+        Args:
+            max_concurrency: Work items running at the same time
+            priority_order: Priority classes, most urgent first
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.rank = {name: i for i, name in enumerate(priority_order)}
+
+    def run(self, items: List[WorkItem]) -> List[Dict[str, Any]]:
+        """
+        Run all work items.
+
+        Returns:
+            Timeline entries in start order (status, timing and the counters each item returned)
+        """
+        pending: queue.PriorityQueue = queue.PriorityQueue()
+        for seq, item in enumerate(items):
+            pending.put((self.rank.get(item.priority_class, len(self.rank)), -item.size, seq, item))
+
+        run_start = time.monotonic()
+        timeline: List[Dict[str, Any]] = []
+        timeline_lock = threading.Lock()
+
+        def worker():
+            while True:
+                try:
+                    item = pending.get_nowait()[-1]
+                except queue.Empty:
+                    return
+
+                entry = {
+                    'workload': item.workload,
+                    'priority_class': item.priority_class,
+                    'name': item.name,
+                    'size_estimate': item.size or None,
+                    'start_offset': round(time.monotonic() - run_start, 2),
+                    'start_time': datetime.now().isoformat(),
+                    'status': 'completed',
+                    'error': None
+                }
+                try:
+                    result = item.run()
+                    if result:
+                        entry.update(result)
+                except Exception as e:
+                    logger.error(f"{item.workload} '{item.name}' failed: {str(e)}")
+                    entry['status'] = 'failed'
+                    entry['error'] = str(e)
+
+                entry['end_offset'] = round(time.monotonic() - run_start, 2)
+                entry['duration_seconds'] = round(entry['end_offset'] - entry['start_offset'], 2)
+                with timeline_lock:
+                    timeline.append(entry)
+                    done = len(timeline)
+                logger.info(f"[{done}/{len(items)}] {'✓' if entry['status'] == 'completed' else '✗'} "
+                            f"{item.priority_class} '{item.name}' in {entry['duration_seconds']:.1f}s")
+
+        threads = [threading.Thread(target=worker, name=f"orchestrator-{i}", daemon=True)
+                   for i in range(min(self.max_concurrency, len(items)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        timeline.sort(key=lambda entry: entry['start_offset'])
+        return timeline
+
+
+def build_graph_session(pool_size: int) -> requests.Session:
+    """
+    HTTP session shared by all Graph engines; 429/503 are left to the shared rate limiter.
+
+    Args:
+        pool_size: Connections kept per host (all concurrent requests of all workloads)
+    """
+    retry_strategy = Retry(
+        total=3,
+        backoff_factor=1,
+        status_forcelist=[500, 502, 504],
+        allowed_methods=["GET", "POST", "PUT", "DELETE"],
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def configured_workloads() -> List[str]:
+    """Workloads whose credentials are set in the environment."""
+    return [name for name in WORKLOADS if all(os.environ.get(var) for var in REQUIRED_ENV[name])]
+
+
+class BackupOrchestrator:
+    """Runs several backup workloads in one process under one budget."""
+
+    def __init__(self, workloads: Sequence[str], backup_type: str = 'incremental',
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 priority_order: Sequence[str] = PRIORITY_CLASSES,
+                 archive_pattern: str = DEFAULT_ARCHIVE_PATTERN,
+                 max_bandwidth: Optional[float] = None, report_dir: Optional[str] = None,
+                 site_workers: int = 2, max_downloads: int = 16,
+                 per_mailbox_concurrency: int = DEFAULT_PER_MAILBOX_CONCURRENCY):
+        """
+        Initialize orchestrator.
+
+        Args:
+            workloads: Workloads to run (see WORKLOADS)
+            backup_type: 'full' or 'incremental'
+            max_concurrency: Work items (mailboxes, sites, Dataverse) running at the same time
+            priority_order: Priority classes, most urgent first (see PRIORITY_CLASSES)
+            archive_pattern: Regular expression; matching site names or URLs are 'archive' sites
+            max_bandwidth: Combined download rate of all workloads in bytes/second (None = unlimited)
+            report_dir: Directory for the run report (defaults to BACKUP_DIR or "backup")
+            site_workers: Document libraries backed up in parallel within a site
+            max_downloads: Cap on simultaneous SharePoint downloads across all sites
+            per_mailbox_concurrency: In-flight Graph requests per mailbox
+        """
+        self.workloads = list(workloads)
+        self.backup_type = backup_type
+        self.max_concurrency = max(1, max_concurrency)
+        self.priority_order = list(priority_order)
+        self.archive_pattern = re.compile(archive_pattern, re.IGNORECASE)
+        self.report_dir = Path(report_dir or os.environ.get('BACKUP_DIR', 'backup'))
+        self.site_workers = max(1, site_workers)
+        self.max_downloads = max(1, max_downloads)
+        self.per_mailbox_concurrency = max(1, per_mailbox_concurrency)
+
+        self.pool = PriorityWorkPool(self.max_concurrency, self.priority_order)
+
+        # Shared by every workload: Graph requests, downloads and Dataverse pages
+        self.limiter = get_graph_limiter()
+        self.bandwidth = set_bandwidth_limit(max_bandwidth) if max_bandwidth else get_bandwidth_limiter()
+        self.session = build_graph_session(
+            max(10, self.max_downloads * 4 + self.max_concurrency * self.per_mailbox_concurrency))
+
+        self.sharepoint: Optional[OptimizedSharePointBackup] = None
+        self.exchange: Optional[OptimizedExchangeBackup] = None
+        self.dataverse = None
+        self.workload_status: Dict[str, Dict[str, Any]] = {}
+        self.timeline: List[Dict[str, Any]] = []
+        self.start_time = datetime.now()
+
+    def _plan_sharepoint(self) -> List[WorkItem]:
+        """Create the SharePoint engine and one work item per site."""
+        self.sharepoint = OptimizedSharePointBackup(
+            os.environ['SHAREPOINT_CLIENT_ID'], os.environ['SHAREPOINT_CLIENT_SECRET'],
+            os.environ['SHAREPOINT_TENANT_ID'],
+            max_concurrent_downloads=self.max_downloads,
+            session=self.session
+        )
+
+        items = []
+        for i, site in enumerate(self.sharepoint.get_sites(), 1):
+            site_id = site['id']
+            site_name = site.get('displayName', f"Site_{i}")
+            is_archive = self.archive_pattern.search(f"{site_name} {site.get('webUrl', '')}")
+
+            def run(site_id=site_id, site_name=site_name):
+                self.sharepoint.backup_site(site_id, site_name, self.backup_type, self.site_workers)
+
+            items.append(WorkItem('sharepoint', 'archive' if is_archive else 'site', site_name, run))
+        return items
+
+    def _plan_exchange(self) -> List[WorkItem]:
+        """Create the Exchange engine and one work item per mailbox, with its size estimate."""
+        self.exchange = OptimizedExchangeBackup(
+            os.environ['EXCHANGE_CLIENT_ID'], os.environ['EXCHANGE_CLIENT_SECRET'],
+            os.environ['EXCHANGE_TENANT_ID'],
+            max_mailboxes=self.max_concurrency,
+            per_mailbox_concurrency=self.per_mailbox_concurrency,
+            session=self.session
+        )
+
+        users = self.exchange.get_users()
+
+        def size(user: Dict[str, Any]) -> int:
+            try:
+                return self.exchange.estimate_mailbox_size(user) or 0
+            except Exception:
+                return 0
+
+        # Size probes are single requests; run them with the same parallelism
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            sizes = list(executor.map(size, users))
+
+        items = []
+        for user, mailbox_size in zip(users, sizes):
+            def run(user=user):
+                return self.exchange.backup_mailbox(user, self.backup_type)
+
+            name = user.get('userPrincipalName', user.get('mail', user.get('id', 'Unknown')))
+            items.append(WorkItem('exchange', 'mailbox', name, run, mailbox_size))
+        return items
+
+    def _plan_dataverse(self) -> List[WorkItem]:
+        """Create the Dataverse engine; the whole environment is one work item."""
+        # Imported here: only Dataverse needs msal
+        from dataverse_backup import DataverseBackup, config_from_env
+
+        self.dataverse = DataverseBackup(**config_from_env())
+
+        def run():
+            self.dataverse.backup_all()
+            return {'tables': len(self.dataverse.table_summary),
+                    'records': sum(t['RecordCount'] for t in self.dataverse.table_summary)}
+
+        return [WorkItem('dataverse', 'dataverse', self.dataverse.environment_url, run)]
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Plan and run all workloads, then write the consolidated report.
+
+        Returns:
+            The report
+        """
+        logger.info(f"Starting {self.backup_type.upper()} backup of {', '.join(self.workloads)}")
+        logger.info(f"Budget: {self.max_concurrency} concurrent work items, "
+                    + (f"{self.bandwidth.rate / (1024 * 1024):.1f} MB/s" if self.bandwidth else "unlimited bandwidth"))
+        logger.info(f"Priority: {' > '.join(self.priority_order)}")
+        logger.info("=" * 60)
+
+        planners = {'sharepoint': self._plan_sharepoint, 'exchange': self._plan_exchange,
+                    'dataverse': self._plan_dataverse}
+        items: List[WorkItem] = []
+        for workload in self.workloads:
+            try:
+                planned = planners[workload]()
+                items.extend(planned)
+                self.workload_status[workload] = {'status': 'running', 'error': None, 'items': len(planned)}
+                logger.info(f"{workload}: {len(planned)} work items")
+            except Exception as e:
+                logger.error(f"Could not start {workload}: {str(e)}")
+                self.workload_status[workload] = {'status': 'failed', 'error': str(e), 'items': 0}
+
+        # Graph engines record a backup session in their databases, as when run on their own
+        sessions = {}
+        if self.sharepoint is not None:
+            sessions['sharepoint'] = (self.sharepoint, self.sharepoint.start_run(self.backup_type))
+        if self.exchange is not None:
+            sessions['exchange'] = (self.exchange, self.exchange.start_run(self.backup_type))
+
+        try:
+            self.timeline = self.pool.run(items)
+        finally:
+            for engine, session_id in sessions.values():
+                engine.finish_run(session_id)
+            if self.sharepoint is not None:
+                self.sharepoint.db.close()
+
+        for workload, status in self.workload_status.items():
+            if status['status'] == 'running':
+                failed = sum(1 for e in self.timeline if e['workload'] == workload and e['status'] == 'failed')
+                status['failed_items'] = failed
+                status['status'] = 'partial' if failed else 'completed'
+
+        report = self._build_report()
+        self._write_report(report)
+        self._print_summary(report)
+        return report
+
+    def _build_report(self) -> Dict[str, Any]:
+        """Consolidated report of the run."""
+        end_time = datetime.now()
+
+        workloads = {}
+        for workload, status in self.workload_status.items():
+            entry = dict(status)
+            if workload == 'sharepoint' and self.sharepoint is not None:
+                entry['stats'] = {k: v for k, v in self.sharepoint.stats.items() if k != 'start_time'}
+            elif workload == 'exchange' and self.exchange is not None:
+                entry['stats'] = {k: v for k, v in self.exchange.stats.items() if k != 'start_time'}
+            elif workload == 'dataverse' and self.dataverse is not None:
+                entry['stats'] = {
+                    'tables': len(self.dataverse.table_summary),
+                    'records': sum(t['RecordCount'] for t in self.dataverse.table_summary),
+                    'backup_path': str(self.dataverse.backup_path)
+                }
+            workloads[workload] = entry
+
+        classes = {}
+        for name in self.priority_order:
+            entries = [e for e in self.timeline if e['priority_class'] == name]
+            if entries:
+                classes[name] = {
+                    'items': len(entries),
+                    'failed': sum(1 for e in entries if e['status'] == 'failed'),
+                    'first_start_offset': min(e['start_offset'] for e in entries),
+                    'last_end_offset': max(e['end_offset'] for e in entries),
+                    'busy_seconds': round(sum(e['duration_seconds'] for e in entries), 2)
+                }
+
+        # SharePoint and Exchange share one provider when they use the same app registration
+        providers = {id(engine.token_provider): engine.token_provider
+                     for engine in (self.sharepoint, self.exchange, self.dataverse) if engine is not None}
+        transport = {
+            'graph_requests': self.limiter.stats['requests'],
+            'graph_throttled': self.limiter.stats['throttled'],
+            'graph_wait_seconds': round(self.limiter.stats['waited_seconds'], 2),
+            'graph_rate': round(self.limiter.rate, 2),
+            'token_fetches': sum(p.stats['fetches'] for p in providers.values()),
+            'token_refreshes_coalesced': sum(p.stats['coalesced'] for p in providers.values())
+        }
+        if self.bandwidth is not None:
+            transport.update({
+                'bandwidth_limit': self.bandwidth.rate,
+                'bandwidth_bytes': self.bandwidth.stats['bytes'],
+                'bandwidth_wait_seconds': round(self.bandwidth.stats['waited_seconds'], 2)
+            })
+
+        return {
+            'run': {
+                'backup_type': self.backup_type,
+                'start_time': self.start_time.isoformat(),
+                'end_time': end_time.isoformat(),
+                'duration_seconds': round((end_time - self.start_time).total_seconds(), 2),
+                'max_concurrency': self.max_concurrency,
+                'priority_order': self.priority_order
+            },
+            'workloads': workloads,
+            'priority_classes': classes,
+            'transport': transport,
+            'timeline': self.timeline
+        }
+
+    def _write_report(self, report: Dict[str, Any]):
+        """Write the report to <report_dir>/orchestrator_report_<timestamp>.json."""
+        self.report_dir.mkdir(parents=True, exist_ok=True)
+        report_file = self.report_dir / f"orchestrator_report_{self.start_time.strftime('%Y%m%d_%H%M%S')}.json"
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        logger.info(f"Run report: {report_file}")
+
+    def _print_summary(self, report: Dict[str, Any]):
+        """Print the consolidated summary."""
+        logger.info("=" * 60)
+        logger.info("ORCHESTRATED BACKUP SUMMARY")
+        logger.info("=" * 60)
+        logger.info(f"Duration: {report['run']['duration_seconds']:.1f}s")
+
+        for workload, entry in report['workloads'].items():
+            line = f"{workload}: {entry['status']}, {entry['items']} items"
+            if entry.get('failed_items'):
+                line += f" ({entry['failed_items']} failed)"
+            if entry.get('error'):
+                line += f" - {entry['error']}"
+            logger.info(line)
+
+        for name, entry in report['priority_classes'].items():
+            logger.info(f"  {name}: {entry['items']} items, started {entry['first_start_offset']:.1f}s, "
+                        f"finished {entry['last_end_offset']:.1f}s")
+
+        transport = report['transport']
+        logger.info(f"Graph: {transport['graph_requests']:,} requests, {transport['graph_throttled']} throttled, "
+                    f"{transport['graph_wait_seconds']:.1f}s waited; {transport['token_fetches']} token fetches")
+        if 'bandwidth_bytes' in transport:
+            logger.info(f"Downloads: {transport['bandwidth_bytes']:,} bytes, "
+                        f"{transport['bandwidth_wait_seconds']:.1f}s waited for bandwidth")
+        logger.info("=" * 60)
+
+
+def main():
+    """Command-line interface."""
+    # The engines leave loguru alone at import; one console sink serves every workload
+    configure_logging()
+
+    # Try to load environment variables from .env file
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+        logger.info("Loaded environment variables from .env file")
+    except ImportError:
+        logger.warning("python-dotenv not installed. Using system environment variables.")
+    except Exception as e:
+        logger.warning(f"Failed to load .env file: {str(e)}")
+
+    parser = argparse.ArgumentParser(
+        description='Run SharePoint, Exchange and Dataverse backups in one process'
+    )
+
+    parser.add_argument('--workloads', default=None,
+                        help=f'Comma-separated workloads out of {",".join(WORKLOADS)} '
+                             '(default: every workload whose credentials are set)')
+
+    parser.add_argument('--type', choices=['full', 'incremental'], default='incremental',
+                        help='Backup type for SharePoint and Exchange (default: incremental)')
+
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help='Work items (mailboxes, sites, Dataverse) running at the same time '
+                             f'(default: {DEFAULT_MAX_CONCURRENCY})')
+
+    parser.add_argument('--max-bandwidth', type=float, default=None,
+                        help='Combined download bandwidth of all workloads in MB/s '
+                             '(default: BACKUP_MAX_BYTES_PER_SECOND or unlimited)')
+
+    parser.add_argument('--priority', default=','.join(PRIORITY_CLASSES),
+                        help=f'Priority classes, most urgent first (default: {",".join(PRIORITY_CLASSES)})')
+
+    parser.add_argument('--archive-pattern', default=DEFAULT_ARCHIVE_PATTERN,
+                        help='Regular expression for site names or URLs scheduled as archive sites '
+                             f'(default: {DEFAULT_ARCHIVE_PATTERN})')
+
+    parser.add_argument('--site-workers', type=int, default=2,
+                        help='Document libraries backed up in parallel within each site (default: 2)')
+
+    parser.add_argument('--max-downloads', type=int, default=16,
+                        help='Maximum concurrent SharePoint downloads across all sites (default: 16)')
+
+    parser.add_argument('--per-mailbox', type=int, default=DEFAULT_PER_MAILBOX_CONCURRENCY,
+                        help=f'Concurrent requests per mailbox (default: {DEFAULT_PER_MAILBOX_CONCURRENCY})')
+
+    parser.add_argument('--report-dir', default=None,
+                        help='Directory for the run report (default: BACKUP_DIR or backup)')
+
+    args = parser.parse_args()
+
+    priority_order = [name.strip() for name in args.priority.split(',') if name.strip()]
+    if sorted(priority_order) != sorted(PRIORITY_CLASSES):
+        parser.error(f"--priority must list each of {', '.join(PRIORITY_CLASSES)} once")
+
+    available = configured_workloads()
+    if args.workloads:
+        workloads = [name.strip() for name in args.workloads.split(',') if name.strip()]
+        unknown = [name for name in workloads if name not in WORKLOADS]
+        if unknown:
+            parser.error(f"Unknown workloads: {', '.join(unknown)}")
+        missing = [name for name in workloads if name not in available]
+        if missing:
+            for name in missing:
+                logger.error(f"Missing credentials for {name}! Set {', '.join(REQUIRED_ENV[name])}")
+            sys.exit(1)
+    else:
+        workloads = available
+        if not workloads:
+            logger.error("No workload is configured! Set the SHAREPOINT_*, EXCHANGE_* or DATAVERSE_* credentials")
+            sys.exit(1)
+
+    try:
+        orchestrator = BackupOrchestrator(
+            workloads,
+            backup_type=args.type,
+            max_concurrency=args.max_concurrency,
+            priority_order=priority_order,
+            archive_pattern=args.archive_pattern,
+            max_bandwidth=args.max_bandwidth * 1024 * 1024 if args.max_bandwidth else None,
+            report_dir=args.report_dir,
+            site_workers=args.site_workers,
+            max_downloads=args.max_downloads,
+            per_mailbox_concurrency=args.per_mailbox
+        )
+        report = orchestrator.run()
+
+    except Exception as e:
+        logger.error(f"Backup failed: {str(e)}")
+        sys.exit(1)
+
+    sys.exit(0 if all(w['status'] == 'completed' for w in report['workloads'].values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Blob Store
+Stores backed-up file contents once per SHA-256 under <backup_dir>/.blobs and
+describes each backup session with a manifest (path -> hash). Identical files
+across sites, versions and sessions take space once, and consolidating sessions
+is a manifest merge instead of a file copy.
+
+Usage:
+    python3 blob_store.py restore <session_dir> <destination> [--store DIR] [--link]
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Directory name of the store inside the backup directory
+BLOB_DIR_NAME = '.blobs'
+
+# Manifest file written into each session directory
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+class BlobStore:
+    """Files stored by SHA-256 as <root>/<first two hex digits>/<sha256>."""
+
+    def __init__(self, root: Path):
+        """
+        Initialize blob store.
+
+        Args:
+            root: Store directory (usually <backup_dir>/.blobs)
+        """
+        self.root = Path(root)
+        self.incoming_dir = self.root / 'incoming'
+
+    def blob_path(self, sha256: str) -> Path:
+        """Path of the blob with the given hash (whether or not it exists)."""
+        return self.root / sha256[:2] / sha256
+
+    def __contains__(self, sha256: str) -> bool:
+        return self.blob_path(sha256).is_file()
+
+    def incoming_path(self, name: str) -> Path:
+        """
+        Scratch path for a download whose hash is not known yet.
+
+        Lives inside the store so put_file() is a rename on the same filesystem.
+        """
+        self.incoming_dir.mkdir(parents=True, exist_ok=True)
+        return self.incoming_dir / name
+
+    def put_file(self, src_path: Path, sha256: str) -> int:
+        """
+        Move a file into the store.
+
+        Args:
+            src_path: File to store; it is moved (or deleted if the content is already stored)
+            sha256: SHA-256 of the file content
+
+        Returns:
+            Bytes newly written to the store (0 if the content was a duplicate)
+        """
+        blob_path = self.blob_path(sha256)
+
+        if blob_path.is_file():
+            Path(src_path).unlink()
+            # A fresh mtime keeps the blob out of garbage collection's grace window
+            os.utime(blob_path)
+            return 0
+
+        size = Path(src_path).stat().st_size
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src_path, blob_path)
+        return size
+
+    def materialize(self, sha256: str, dest_path: Path, link: bool = False):
+        """
+        Write a blob to dest_path.
+
+        Args:
+            sha256: Blob hash
+            dest_path: Target file
+            link: Hard-link instead of copying (the restored file then shares the blob's
+                  inode, so editing it would alter the backup)
+        """
+        blob_path = self.blob_path(sha256)
+        if not blob_path.is_file():
+            raise FileNotFoundError(f"Blob {sha256} is missing from {self.root}")
+
+        dest_path = Path(dest_path)
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+
+        if link:
+            try:
+                os.link(blob_path, dest_path)
+                return
+            except OSError:
+                pass  # Different filesystem or no hard-link support: copy instead
+
+        shutil.copyfile(blob_path, dest_path)
+
+    def iter_blobs(self) -> Iterator[Tuple[str, Path]]:
+        """Yield (sha256, path) for every stored blob."""
+        if not self.root.is_dir():
+            return
+
+        for prefix_dir in self.root.iterdir():
+            if len(prefix_dir.name) != 2 or not prefix_dir.is_dir():
+                continue
+            for blob_path in prefix_dir.iterdir():
+                if blob_path.is_file():
+                    yield blob_path.name, blob_path
+
+    def collect_garbage(self, referenced: Set[str], grace_seconds: float = 86400,
+                        dry_run: bool = False) -> Tuple[int, int]:
+        """
+        Delete blobs no manifest refers to.
+
+        Blobs touched within grace_seconds are kept, so a backup that is still
+        running (and has not written its manifest yet) does not lose its files.
+
+        Args:
+            referenced: Hashes referenced by all manifests that are kept
+            grace_seconds: Minimum age of a blob before it can be deleted
+            dry_run: Only count what would be deleted
+
+        Returns:
+            Tuple of (blobs removed, bytes freed)
+        """
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        freed = 0
+
+        for sha256, blob_path in self.iter_blobs():
+            if sha256 in referenced:
+                continue
+            try:
+                stat = blob_path.stat()
+                if stat.st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    blob_path.unlink()
+                removed += 1
+                freed += stat.st_size
+            except OSError as e:
+                logger.warning(f"Could not remove blob {sha256}: {e}")
+
+        return removed, freed
+
+
+class SessionManifest:
+    """Path -> content hash listing of one backup session (thread-safe)."""
+
+    def __init__(self, metadata: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            metadata: Session information stored alongside the file list (site, date, ...)
+        """
+        self.metadata: Dict[str, Any] = dict(metadata or {})
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def add(self, rel_path: str, sha256: str, size: int, **info):
+        """
+        Record a file.
+
+        Args:
+            rel_path: Path within the session, '/'-separated (e.g. "Documents/Reports/Q1.xlsx")
+            sha256: Content hash (blob key)
+            size: Content size in bytes
+            **info: Extra fields kept with the entry (eTag, item_path, last_modified, ...)
+        """
+        with self._lock:
+            self.files[rel_path] = {'sha256': sha256, 'size': size, **info}
+
+    def merge_older(self, older: 'SessionManifest') -> int:
+        """
+        Add the entries of an older session that this manifest does not have yet.
+
+        Returns:
+            Number of entries added
+        """
+        added = 0
+        with self._lock:
+            for rel_path, entry in older.files.items():
+                if rel_path not in self.files:
+                    self.files[rel_path] = entry
+                    added += 1
+        return added
+
+    def hashes(self) -> Set[str]:
+        """All content hashes referenced by this manifest."""
+        with self._lock:
+            return {entry['sha256'] for entry in self.files.values()}
+
+    def save(self, path: Path):
+        """Write the manifest atomically."""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+
+        # Held while writing: drives of one session save the same file concurrently
+        with self._lock:
+            data = {
+                'version': MANIFEST_VERSION,
+                'saved': datetime.now().isoformat(),
+                'metadata': self.metadata,
+                'files': dict(sorted(self.files.items()))
+            }
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> 'SessionManifest':
+        """Read a manifest written by save()."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        manifest = cls(data.get('metadata'))
+        manifest.files = data.get('files', {})
+        return manifest
+
+
+def open_blob_store(root: Path) -> BlobStore:
+    """Open an existing store, with chunk support if it holds chunked files."""
+    from chunk_store import ChunkedBlobStore, CHUNK_INDEX_NAME      # imports this module
+
+    if (Path(root) / CHUNK_INDEX_NAME).is_file():
+        return ChunkedBlobStore(root)
+    return BlobStore(root)
+
+
+def find_blob_store(session_dir: Path) -> Optional[BlobStore]:
+    """
+    Locate the store for a session (<backup_dir>/<site>/<session>/ -> <backup_dir>/.blobs).
+
+    Returns:
+        BlobStore, or None if there is no store next to the session's site directory
+    """
+    for parent in Path(session_dir).resolve().parents:
+        candidate = parent / BLOB_DIR_NAME
+        if candidate.is_dir():
+            return open_blob_store(candidate)
+    return None
+
+
+def restore_session(manifest: SessionManifest, store: BlobStore, dest_dir: Path,
+                    link: bool = False) -> Tuple[int, int]:
+    """
+    Recreate a session's file tree from its manifest.
+
+    Returns:
+        Tuple of (files restored, files missing from the store)
+    """
+    restored = 0
+    missing = 0
+
+    for rel_path, entry in manifest.files.items():
+        try:
+            store.materialize(entry['sha256'], Path(dest_dir) / rel_path, link=link)
+            restored += 1
+        except FileNotFoundError as e:
+            logger.error(f"Cannot restore {rel_path}: {e}")
+            missing += 1
+
+    return restored, missing
+
+
+def main():
+    """Command-line interface."""
+    parser = argparse.ArgumentParser(description='Restore backups from the content-addressed blob store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    restore_parser = subparsers.add_parser('restore', help='Recreate the files of a backup session')
+    restore_parser.add_argument('session_dir', help='Session directory containing manifest.json')
+    restore_parser.add_argument('destination', help='Directory to restore into')
+    restore_parser.add_argument('--store', default=None,
+                                help='Blob store directory (default: nearest .blobs above the session)')
+    restore_parser.add_argument('--link', action='store_true',
+                                help='Hard-link files from the store instead of copying them')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    session_dir = Path(args.session_dir)
+    manifest_path = session_dir / MANIFEST_NAME
+    if not manifest_path.is_file():
+        logger.error(f"No {MANIFEST_NAME} in {session_dir}")
+        sys.exit(1)
+
+    store = open_blob_store(Path(args.store)) if args.store else find_blob_store(session_dir)
+    if store is None:
+        logger.error(f"No {BLOB_DIR_NAME} store found for {session_dir}; use --store")
+        sys.exit(1)
+
+    manifest = SessionManifest.load(manifest_path)
+    restored, missing = restore_session(manifest, store, Path(args.destination), link=args.link)
+    logger.info(f"Restored {restored} files to {args.destination}" +
+                (f", {missing} missing from the store" if missing else ""))
+    sys.exit(1 if missing else 0)
+
+
+if __name__ == "__main__":
+    main()
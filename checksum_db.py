@@ -7,30 +7,261 @@ Manages SQLite database to track file checksums and backup history.
 import sqlite3
 import json
 import logging
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, Iterable, List, Tuple
 import hashlib
 
 logger = logging.getLogger(__name__)
 
 
+class FileChangeIndex:
+    """
+    In-memory snapshot of the stored (eTag, size) per file for one site or drive.
+    
+    Built by BackupChecksumDB.load_change_index() with a single query so a crawl
+    can classify every file without a database round trip per file.
+    """
+    
+    def __init__(self, prefix: str = ""):
+        """
+        Args:
+            prefix: Common file_path prefix, stripped from keys to keep the index small
+        """
+        self.prefix = prefix
+        self._entries: Dict[str, Tuple[Optional[str], int]] = {}
+    
+    def _key(self, file_path: str) -> str:
+        if self.prefix and file_path.startswith(self.prefix):
+            return file_path[len(self.prefix):]
+        return file_path
+    
+    def add(self, file_path: str, eTag: Optional[str], file_size: int):
+        """Add a stored file record to the index."""
+        self._entries[self._key(file_path)] = (eTag, file_size)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __contains__(self, file_path: str) -> bool:
+        return self._key(file_path) in self._entries
+    
+    def has_changed(self, file_path: str, eTag: Optional[str], file_size: int) -> bool:
+        """
+        Check a file against the stored record.
+        
+        Returns:
+            True if the file is new or its eTag or size differs from the stored record
+        """
+        stored = self._entries.get(self._key(file_path))
+        if stored is None:
+            return True  # New file
+        
+        return stored != (eTag, file_size)
+    
+    def missing(self, seen_paths) -> List[str]:
+        """
+        Get stored files that were not seen in a complete listing.
+        
+        Args:
+            seen_paths: Iterable of file_paths found by the crawl
+            
+        Returns:
+            Full file_paths of stored files absent from seen_paths (i.e. deleted)
+        """
+        seen = {self._key(path) for path in seen_paths}
+        return [self.prefix + key for key in self._entries.keys() - seen]
+
+
+class FileStatCache:
+    """
+    SHA-256 of files already hashed, keyed by (path, size, mtime_ns, inode).
+    
+    Kept in a table of any SQLite database so a rebuild or verify of a large
+    backup tree only hashes files that are new or were modified since the last
+    run. Entries are loaded into memory once and written back with save().
+    """
+    
+    def __init__(self, db_path: str, readonly: bool = False):
+        """
+        Args:
+            db_path: SQLite database holding the file_stat_cache table
+            readonly: Only use existing entries; save() writes nothing
+        """
+        self.db_path = db_path
+        self.readonly = readonly
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, Tuple[int, int, int, str]] = {}
+        self._dirty: Dict[str, Tuple[int, int, int, str]] = {}
+        self._seen: set = set()
+        
+        if readonly and not Path(db_path).is_file():
+            return
+        
+        conn = sqlite3.connect(db_path)
+        try:
+            with conn:
+                if not readonly:
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS file_stat_cache (
+                            path TEXT PRIMARY KEY,
+                            size INTEGER NOT NULL,
+                            mtime_ns INTEGER NOT NULL,
+                            inode INTEGER NOT NULL,
+                            sha256 TEXT NOT NULL
+                        )
+                    ''')
+                for path, size, mtime_ns, inode, sha256 in conn.execute(
+                        'SELECT path, size, mtime_ns, inode, sha256 FROM file_stat_cache'):
+                    self._entries[path] = (size, mtime_ns, inode, sha256)
+        except sqlite3.OperationalError:
+            pass  # Read-only on a database without the table: empty cache
+        finally:
+            conn.close()
+        
+        logger.debug(f"Loaded {len(self._entries)} stat cache entries from {db_path}")
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def lookup(self, path: str, stat_result) -> Optional[str]:
+        """
+        Get the cached hash of a file if it is unchanged.
+        
+        Args:
+            path: File path (as stored)
+            stat_result: os.stat() of the file now
+            
+        Returns:
+            SHA-256 hex digest, or None if the file is new or its size, mtime or inode differ
+        """
+        self._seen.add(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry[:3] == (stat_result.st_size, stat_result.st_mtime_ns,
+                                               stat_result.st_ino):
+            self.hits += 1
+            return entry[3]
+        
+        self.misses += 1
+        return None
+    
+    def store(self, path: str, size: int, mtime_ns: int, inode: int, sha256: str):
+        """Remember the hash of a file that was just hashed."""
+        self._seen.add(path)
+        entry = (size, mtime_ns, inode, sha256)
+        if self._entries.get(path) != entry:
+            self._entries[path] = entry
+            self._dirty[path] = entry
+    
+    def save(self, prune: bool = True) -> int:
+        """
+        Write new and changed entries in one transaction.
+        
+        Args:
+            prune: Also drop entries of files not looked up or stored in this run
+                   (i.e. files that no longer exist in the tree)
+            
+        Returns:
+            Number of entries written
+        """
+        if self.readonly:
+            return 0
+        
+        stale = [(path,) for path in self._entries.keys() - self._seen] if prune else []
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO file_stat_cache (path, size, mtime_ns, inode, sha256) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    [(path, *entry) for path, entry in self._dirty.items()]
+                )
+                conn.executemany('DELETE FROM file_stat_cache WHERE path = ?', stale)
+        finally:
+            conn.close()
+        
+        for (path,) in stale:
+            del self._entries[path]
+        written = len(self._dirty)
+        self._dirty = {}
+        
+        logger.debug(f"Stat cache: wrote {written} entries, pruned {len(stale)}")
+        return written
+
+
 class BackupChecksumDB:
     """SQLite database for tracking file checksums and backup history."""
     
-    def __init__(self, db_path: str = "backup_checksums.db"):
+    def __init__(self, db_path: str = "backup_checksums.db", persistent: bool = False,
+                 batch_size: int = 500, flush_interval: float = 2.0):
         """
         Initialize checksum database.
         
         Args:
             db_path: Path to SQLite database file
+            persistent: Keep one long-lived WAL connection per thread instead of
+                        connecting on every call, and enable queue_file_record batching
+            batch_size: Queued file records that trigger a flush (persistent mode)
+            flush_interval: Seconds after which queued file records are flushed (persistent mode)
         """
         self.db_path = Path(db_path)
+        self.persistent = persistent
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], Tuple] = {}
+        self._pending_lock = threading.Lock()
+        # Held from taking queued records until they are committed (see save_delta_link)
+        self._flush_lock = threading.RLock()
+        self._last_flush = time.monotonic()
+        
         self._init_db()
     
+    @contextmanager
+    def _connect(self, write: bool = False):
+        """
+        Yield a connection inside a transaction.
+        
+        In persistent mode the calling thread's connection is reused and writes are
+        serialized; otherwise a fresh connection is opened and closed per call.
+        """
+        if not self.persistent:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+            return
+        
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        
+        if write:
+            with self._write_lock, conn:
+                yield conn
+        else:
+            with conn:
+                yield conn
+    
     def _init_db(self):
         """Initialize database schema."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect(write=True) as conn:
             cursor = conn.cursor()
             
             # Create backup_files table with eTag and cTag support
@@ -64,6 +295,12 @@ class BackupChecksumDB:
             except sqlite3.OperationalError:
                 pass  # Column already exists
             
+            try:
+                cursor.execute("ALTER TABLE backup_files ADD COLUMN deleted_timestamp TIMESTAMP")
+                logger.debug("Added deleted_timestamp column to existing table")
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+            
             # Create backup_history table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS backup_history (
@@ -109,6 +346,17 @@ class BackupChecksumDB:
             except sqlite3.OperationalError:
                 pass  # Column already exists
             
+            # Create drive_delta_links table for Graph delta query state per drive
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS drive_delta_links (
+                    site_id TEXT NOT NULL,
+                    drive_id TEXT NOT NULL,
+                    delta_link TEXT NOT NULL,
+                    updated_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (site_id, drive_id)
+                )
+            ''')
+            
             # Create indexes for performance
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_site_file ON backup_files (site_id, file_path)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_checksum ON backup_files (checksum_sha256)')
@@ -129,9 +377,9 @@ class BackupChecksumDB:
         Returns:
             Dictionary with file record or None if not found
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._connect() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             
             if site_id:
                 # Backward compatibility mode
@@ -170,66 +418,252 @@ class BackupChecksumDB:
         Returns:
             File ID in database
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._connect(write=True) as conn:
+            return self._upsert_file_record(conn.cursor(), site_id, file_path, file_name,
+                                            file_size, last_modified, checksum, eTag, cTag)
+    
+    def queue_file_record(self, site_id: str, file_path: str, file_name: str, 
+                          file_size: int, last_modified: str, checksum: str,
+                          eTag: str = None, cTag: str = None):
+        """
+        Buffer a file record and write it with the next batch.
+        
+        Takes the same arguments as update_file_record(). In persistent mode records
+        are committed in one transaction once batch_size records are queued or
+        flush_interval seconds have passed, and become visible to reads after that
+        flush. Without persistent mode the record is written immediately.
+        """
+        if not self.persistent:
+            self.update_file_record(site_id, file_path, file_name, file_size,
+                                    last_modified, checksum, eTag, cTag)
+            return
+        
+        with self._pending_lock:
+            self._pending[(site_id, file_path)] = (
+                site_id, file_path, file_name, file_size, last_modified, checksum, eTag, cTag
+            )
+            due = (len(self._pending) >= self.batch_size or
+                   time.monotonic() - self._last_flush >= self.flush_interval)
+        
+        if due:
+            self.flush()
+    
+    def flush(self) -> int:
+        """
+        Write all queued file records in a single transaction.
+        
+        If the write fails the records stay queued for the next flush.
+        
+        Returns:
+            Number of records written
+        """
+        with self._flush_lock:
+            with self._pending_lock:
+                pending = self._pending
+                self._pending = {}
+                self._last_flush = time.monotonic()
             
-            # Check if file exists
+            if not pending:
+                return 0
+            
+            rows = list(pending.values())
+            try:
+                with self._connect(write=True) as conn:
+                    cursor = conn.cursor()
+                    for row in rows:
+                        self._upsert_file_record(cursor, *row)
+            except Exception:
+                with self._pending_lock:
+                    # Records queued for the same path in the meantime are newer
+                    for key, row in pending.items():
+                        self._pending.setdefault(key, row)
+                raise
+        
+        logger.debug(f"Flushed {len(rows)} queued file records")
+        return len(rows)
+    
+    def bulk_upsert_file_records(self, records: Iterable[Tuple]) -> int:
+        """
+        Write final file records in one transaction with executemany.
+        
+        For rebuilding the database from disk, where every path is written once
+        with its final state: unlike update_file_record(), no file_history row is
+        archived and the version is not bumped. An eTag/cTag of None keeps the
+        stored value.
+        
+        Args:
+            records: Tuples of (site_id, file_path, file_name, file_size,
+                     last_modified, checksum, eTag, cTag)
+            
+        Returns:
+            Number of records written
+        """
+        rows = list(records)
+        if not rows:
+            return 0
+        
+        with self._connect(write=True) as conn:
+            conn.executemany('''
+                INSERT INTO backup_files
+                (site_id, file_path, file_name, file_size, last_modified, checksum_sha256, eTag, cTag)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(site_id, file_path) DO UPDATE SET
+                    file_name = excluded.file_name,
+                    file_size = excluded.file_size,
+                    last_modified = excluded.last_modified,
+                    checksum_sha256 = excluded.checksum_sha256,
+                    eTag = COALESCE(excluded.eTag, backup_files.eTag),
+                    cTag = COALESCE(excluded.cTag, backup_files.cTag),
+                    backup_timestamp = CURRENT_TIMESTAMP,
+                    deleted_timestamp = NULL
+            ''', rows)
+        
+        return len(rows)
+    
+    def close(self):
+        """Flush queued records and close persistent connections."""
+        self.flush()
+        
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+    
+    def _upsert_file_record(self, cursor: sqlite3.Cursor, site_id: str, file_path: str,
+                            file_name: str, file_size: int, last_modified: str, checksum: str,
+                            eTag: str = None, cTag: str = None) -> int:
+        """Insert or version-bump a file record using an open cursor."""
+        
+        # Check if file exists
+        cursor.execute('''
+            SELECT id, version FROM backup_files 
+            WHERE site_id = ? AND file_path = ?
+        ''', (site_id, file_path))
+        
+        existing = cursor.fetchone()
+        
+        if existing:
+            file_id, version = existing
+            
+            # Archive old version to history with eTag/cTag
             cursor.execute('''
-                SELECT id, version FROM backup_files 
-                WHERE site_id = ? AND file_path = ?
-            ''', (site_id, file_path))
+                INSERT INTO file_history (file_id, version, checksum_sha256, file_size, last_modified, eTag, cTag)
+                SELECT id, version, checksum_sha256, file_size, last_modified, eTag, cTag
+                FROM backup_files WHERE id = ?
+            ''', (file_id,))
             
-            existing = cursor.fetchone()
+            # Update file record with new version including eTag/cTag
+            if eTag is not None and cTag is not None:
+                cursor.execute('''
+                    UPDATE backup_files 
+                    SET file_name = ?, file_size = ?, last_modified = ?, 
+                        checksum_sha256 = ?, eTag = ?, cTag = ?,
+                        backup_timestamp = CURRENT_TIMESTAMP, deleted_timestamp = NULL,
+                        version = version + 1
+                    WHERE id = ?
+                ''', (file_name, file_size, last_modified, checksum, eTag, cTag, file_id))
+            else:
+                cursor.execute('''
+                    UPDATE backup_files 
+                    SET file_name = ?, file_size = ?, last_modified = ?, 
+                        checksum_sha256 = ?, backup_timestamp = CURRENT_TIMESTAMP,
+                        deleted_timestamp = NULL, version = version + 1
+                    WHERE id = ?
+                ''', (file_name, file_size, last_modified, checksum, file_id))
             
-            if existing:
-                file_id, version = existing
-                
-                # Archive old version to history with eTag/cTag
+            logger.debug(f"Updated file record: {file_path} (v{version + 1})")
+            return file_id
+        else:
+            # Insert new file record
+            if eTag is not None and cTag is not None:
                 cursor.execute('''
-                    INSERT INTO file_history (file_id, version, checksum_sha256, file_size, last_modified, eTag, cTag)
-                    SELECT id, version, checksum_sha256, file_size, last_modified, eTag, cTag
-                    FROM backup_files WHERE id = ?
-                ''', (file_id,))
-                
-                # Update file record with new version including eTag/cTag
-                if eTag is not None and cTag is not None:
-                    cursor.execute('''
-                        UPDATE backup_files 
-                        SET file_name = ?, file_size = ?, last_modified = ?, 
-                            checksum_sha256 = ?, eTag = ?, cTag = ?,
-                            backup_timestamp = CURRENT_TIMESTAMP,
-                            version = version + 1
-                        WHERE id = ?
-                    ''', (file_name, file_size, last_modified, checksum, eTag, cTag, file_id))
-                else:
-                    cursor.execute('''
-                        UPDATE backup_files 
-                        SET file_name = ?, file_size = ?, last_modified = ?, 
-                            checksum_sha256 = ?, backup_timestamp = CURRENT_TIMESTAMP,
-                            version = version + 1
-                        WHERE id = ?
-                    ''', (file_name, file_size, last_modified, checksum, file_id))
-                
-                logger.debug(f"Updated file record: {file_path} (v{version + 1})")
-                return file_id
+                    INSERT INTO backup_files 
+                    (site_id, file_path, file_name, file_size, last_modified, checksum_sha256, eTag, cTag)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (site_id, file_path, file_name, file_size, last_modified, checksum, eTag, cTag))
             else:
-                # Insert new file record
-                if eTag is not None and cTag is not None:
-                    cursor.execute('''
-                        INSERT INTO backup_files 
-                        (site_id, file_path, file_name, file_size, last_modified, checksum_sha256, eTag, cTag)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (site_id, file_path, file_name, file_size, last_modified, checksum, eTag, cTag))
-                else:
-                    cursor.execute('''
-                        INSERT INTO backup_files 
-                        (site_id, file_path, file_name, file_size, last_modified, checksum_sha256)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (site_id, file_path, file_name, file_size, last_modified, checksum))
-                
-                file_id = cursor.lastrowid
-                logger.debug(f"Created new file record: {file_path} (id: {file_id})")
-                return file_id
+                cursor.execute('''
+                    INSERT INTO backup_files 
+                    (site_id, file_path, file_name, file_size, last_modified, checksum_sha256)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (site_id, file_path, file_name, file_size, last_modified, checksum))
+            
+            file_id = cursor.lastrowid
+            logger.debug(f"Created new file record: {file_path} (id: {file_id})")
+            return file_id
+    
+    def load_change_index(self, site_id: str, drive_id: str = None) -> FileChangeIndex:
+        """
+        Load the stored eTag and size of every live file in a site or drive.
+        
+        Args:
+            site_id: SharePoint site ID
+            drive_id: Optional drive ID; limits the index to /drives/{drive_id}/items/ paths
+            
+        Returns:
+            FileChangeIndex for the site or drive (files marked deleted are excluded)
+        """
+        # Queued records must be visible to the query
+        self.flush()
+        
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            
+            if drive_id:
+                # Range scan on the (site_id, file_path) index instead of LIKE
+                prefix = f"/drives/{drive_id}/items/"
+                upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+                cursor.execute('''
+                    SELECT file_path, eTag, file_size FROM backup_files
+                    WHERE site_id = ? AND file_path >= ? AND file_path < ?
+                      AND deleted_timestamp IS NULL
+                ''', (site_id, prefix, upper))
+            else:
+                prefix = ""
+                cursor.execute('''
+                    SELECT file_path, eTag, file_size FROM backup_files
+                    WHERE site_id = ? AND deleted_timestamp IS NULL
+                ''', (site_id,))
+            
+            index = FileChangeIndex(prefix)
+            for file_path, eTag, file_size in cursor:
+                index.add(file_path, eTag, file_size)
+        
+        logger.debug(f"Loaded change index with {len(index)} files for site {site_id}")
+        return index
+    
+    def mark_files_deleted(self, site_id: str, file_paths: List[str]) -> int:
+        """
+        Flag file records whose source file no longer exists in SharePoint.
+        
+        Records are kept (with their history) and are un-flagged if the file is
+        backed up again.
+        
+        Args:
+            site_id: SharePoint site ID
+            file_paths: File paths to mark as deleted
+            
+        Returns:
+            Number of records newly marked as deleted
+        """
+        if not file_paths:
+            return 0
+        
+        self.flush()
+        
+        with self._connect(write=True) as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany('''
+                UPDATE backup_files SET deleted_timestamp = CURRENT_TIMESTAMP
+                WHERE site_id = ? AND file_path = ? AND deleted_timestamp IS NULL
+            ''', [(site_id, path) for path in file_paths])
+            
+            marked = cursor.rowcount
+        
+        logger.info(f"Marked {marked} files as deleted for site {site_id}")
+        return marked
     
     def is_file_unchanged(self, site_id: str, file_path: str, 
                          current_checksum: str, current_size: int) -> Tuple[bool, Optional[Dict]]:
@@ -290,6 +724,71 @@ class BackupChecksumDB:
         # File unchanged based on metadata
         return True, record
     
+    def get_delta_link(self, site_id: str, drive_id: str) -> Optional[str]:
+        """
+        Get the stored Graph delta link for a drive.
+        
+        Args:
+            site_id: SharePoint site ID
+            drive_id: Drive (document library) ID
+            
+        Returns:
+            The @odata.deltaLink from the last completed scan, or None
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT delta_link FROM drive_delta_links 
+                WHERE site_id = ? AND drive_id = ?
+            ''', (site_id, drive_id))
+            
+            row = cursor.fetchone()
+            return row[0] if row else None
+    
+    def save_delta_link(self, site_id: str, drive_id: str, delta_link: str):
+        """
+        Store the Graph delta link for a drive, replacing any previous one.
+        
+        Args:
+            site_id: SharePoint site ID
+            drive_id: Drive (document library) ID
+            delta_link: @odata.deltaLink returned by the last delta page
+        """
+        # Files covered by this link must be recorded before the link moves on,
+        # including those another thread is flushing right now
+        with self._flush_lock:
+            self.flush()
+            
+            with self._connect(write=True) as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT OR REPLACE INTO drive_delta_links 
+                    (site_id, drive_id, delta_link, updated_timestamp)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (site_id, drive_id, delta_link))
+                
+                logger.debug(f"Saved delta link for drive {drive_id}")
+    
+    def clear_delta_link(self, site_id: str, drive_id: str):
+        """
+        Remove the stored delta link for a drive (e.g. after the token expired).
+        
+        Args:
+            site_id: SharePoint site ID
+            drive_id: Drive (document library) ID
+        """
+        with self._connect(write=True) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                DELETE FROM drive_delta_links 
+                WHERE site_id = ? AND drive_id = ?
+            ''', (site_id, drive_id))
+            
+            logger.debug(f"Cleared delta link for drive {drive_id}")
+    
     def start_backup_session(self, backup_type: str, site_id: str = None) -> int:
         """
         Start a new backup session and return session ID.
@@ -301,7 +800,7 @@ class BackupChecksumDB:
         Returns:
             Backup session ID
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect(write=True) as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -327,7 +826,9 @@ class BackupChecksumDB:
             status: 'completed', 'failed', or 'partial'
             error_message: Error message if failed
         """
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush()
+        
+        with self._connect(write=True) as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -355,9 +856,9 @@ class BackupChecksumDB:
         Returns:
             Dictionary with backup statistics
         """
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._connect() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             
             # Get overall stats
             cursor.execute('''
@@ -404,7 +905,7 @@ class BackupChecksumDB:
         Args:
             keep_days: Keep records newer than this many days
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect(write=True) as conn:
             cursor = conn.cursor()
             
             # Count records to be deleted
@@ -447,11 +948,10 @@ class BackupChecksumDB:
             'backup_history': []
         }
         
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            
+        with self._connect() as conn:
             # Export backup_files
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             cursor.execute('SELECT * FROM backup_files ORDER BY site_id, file_path')
             data['backup_files'] = [dict(row) for row in cursor.fetchall()]
             
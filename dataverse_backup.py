@@ -7,57 +7,112 @@ Backs up an entire Microsoft Dataverse (Power Platform) database including:
 - Table metadata and schemas
 - Choice/picklist definitions
 - Custom attributes
+
+Table records are streamed to disk page by page (see dataverse_export.py), as
+pretty-printed JSON (default), NDJSON (optionally gzip/zstd) or Parquet.
+
+In incremental mode, tables with change tracking are exported in full once per
+snapshot period and otherwise only their new, updated and deleted rows are
+written, as delta files (see dataverse_incremental.py, which also restores).
+
+Tables are exported by a pool of workers sharing one HTTP session, largest
+tables (by RetrieveTotalRecordCount) first.
+
+Attribute metadata of all tables is fetched up front with $expand=Attributes,
+a batch of tables per request, and cached in <backup_dir> under the
+environment's metadata version stamp, so unchanged schemas are not fetched again.
 """
 
 import os
 import sys
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from msal import ConfidentialClientApplication
 
+from graph_throttle import get_bandwidth_limiter
+from token_provider import get_token_provider
+
+from dataverse_export import open_table_writer, check_export_format
+from dataverse_incremental import (DataverseStateDB, STATE_DB_NAME, DEFAULT_FULL_SNAPSHOT_DAYS,
+                                   is_deleted_record)
+
 # Import loguru for enhanced logging
 from loguru import logger
 
-# Configure loguru with custom levels and formatting
-# Remove default handler
-logger.remove()
 
-# Add custom levels
-logger.level("TRACE", color="<cyan>", icon="🔍")
-logger.level("DEBUG", color="<blue>", icon="🐛")
-logger.level("INFO", color="<green>", icon="ℹ️")
-logger.level("SUCCESS", color="<bold><green>", icon="✅")
-logger.level("WARNING", color="<yellow>", icon="⚠️")
-logger.level("ERROR", color="<red>", icon="❌")
-logger.level("CRITICAL", color="<bold><red>", icon="💥")
+def configure_logging():
+    """
+    Set up the console and dataverse_backup.log sinks.
+
+    Called from main() rather than at import, so importing the engine (e.g. from
+    backup_orchestrator) leaves the caller's sinks alone.
+    """
+    # Remove default handler
+    logger.remove()
+
+    # Add custom levels
+    logger.level("TRACE", color="<cyan>", icon="🔍")
+    logger.level("DEBUG", color="<blue>", icon="🐛")
+    logger.level("INFO", color="<green>", icon="ℹ️")
+    logger.level("SUCCESS", color="<bold><green>", icon="✅")
+    logger.level("WARNING", color="<yellow>", icon="⚠️")
+    logger.level("ERROR", color="<red>", icon="❌")
+    logger.level("CRITICAL", color="<bold><red>", icon="💥")
+
+    # Add console handler with custom format
+    logger.add(
+        sys.stdout,
+        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
+        level="INFO",  # Default level
+        colorize=True
+    )
+
+    # Add file handler for detailed logging
+    logger.add(
+        "dataverse_backup.log",
+        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+        level="TRACE",  # Log everything to file
+        rotation="10 MB",  # Rotate when file reaches 10 MB
+        retention="30 days",  # Keep logs for 30 days
+        compression="zip"  # Compress rotated logs
+    )
+
 
-# Add console handler with custom format
-logger.add(
-    sys.stdout,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    level="INFO",  # Default level
-    colorize=True
-)
+# Tables exported at the same time by default
+DEFAULT_TABLE_WORKERS = 4
 
-# Add file handler for detailed logging
-logger.add(
-    "dataverse_backup.log",
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-    level="TRACE",  # Log everything to file
-    rotation="10 MB",  # Rotate when file reaches 10 MB
-    retention="30 days",  # Keep logs for 30 days
-    compression="zip"  # Compress rotated logs
-)
+# Table names per RetrieveTotalRecordCount call (keeps the URL short)
+_COUNT_BATCH_SIZE = 100
+
+# A large table logs its progress every this many records
+_PROGRESS_RECORDS = 100000
+
+# Attribute metadata cache kept in the backup directory
+METADATA_CACHE_NAME = 'dataverse_metadata_cache.json'
+
+# Tables per EntityDefinitions?$expand=Attributes request
+_METADATA_BATCH_SIZE = 50
+
+# Attribute properties kept in the backup
+ATTRIBUTE_SELECT = ("LogicalName,SchemaName,DisplayName,AttributeType,IsCustomAttribute,"
+                    "IsPrimaryId,IsPrimaryName,RequiredLevel,Description")
 
 
 class DataverseBackup:
     """Handles backup operations for Dataverse databases."""
     
     def __init__(self, environment_url: str, tenant_id: str, client_id: str, 
-                 client_secret: str, backup_dir: str = "backup"):
+                 client_secret: str, backup_dir: str = "backup", export_format: str = "json",
+                 compression: str = "none", page_size: int = 5000, incremental: bool = False,
+                 full_snapshot_days: float = DEFAULT_FULL_SNAPSHOT_DAYS,
+                 max_workers: int = DEFAULT_TABLE_WORKERS):
         """
         Initialize Dataverse backup client.
         
@@ -67,13 +122,37 @@ class DataverseBackup:
             client_id: Azure AD App Client ID
             client_secret: Azure AD App Client Secret
             backup_dir: Directory where backups will be stored
+            export_format: Table file format: json, ndjson or parquet
+            compression: Compression of ndjson files: none, gzip or zstd
+            page_size: Records per Web API page (odata.maxpagesize); memory use is bounded by one page
+            incremental: Export only changes of tables with change tracking, using delta links
+                         kept in <backup_dir>/dataverse_state.db
+            full_snapshot_days: Age after which an incremental table is exported in full again
+            max_workers: Tables exported in parallel
         """
+        # Fail before authenticating if the format's package is missing
+        check_export_format(export_format, compression)
+        self.export_format = export_format
+        self.compression = compression
+        self.page_size = page_size
+        self.max_workers = max(1, max_workers)
+        
+        # Approximate record count per table, used for scheduling and progress
+        self.record_counts: Dict[str, int] = {}
+        
+        # Simplified attributes per table, filled by prefetch_attributes()
+        self.attribute_cache: Dict[str, List[Dict]] = {}
+        
+        # Per-table results collected during the backup, for the summary
+        self.table_summary: List[Dict[str, Any]] = []
+        
         self.environment_url = environment_url.rstrip('/')
         self.tenant_id = tenant_id
         self.client_id = client_id
         self.client_secret = client_secret
         
         self.backup_dir = Path(backup_dir)
+        self.full_snapshot_days = full_snapshot_days
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.backup_path = self.backup_dir / f"dataverse_backup_{self.timestamp}"
         
@@ -81,103 +160,185 @@ class DataverseBackup:
         self.backup_path.mkdir(parents=True, exist_ok=True)
         logger.info(f"Backup directory created: {self.backup_path}")
         
+        # Change-tracking state shared by all runs in backup_dir
+        self.state_db = DataverseStateDB(self.backup_dir / STATE_DB_NAME) if incremental else None
+        
+        # One pooled session for all workers
+        self._setup_session()
+        
         # Authentication
-        self.access_token = None
+        self.token_provider = None
         self.authenticate()
     
+    def _setup_session(self):
+        """Setup HTTP session with retry logic; 429 responses wait for Retry-After."""
+        retry_strategy = Retry(
+            total=5,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False
+        )
+        
+        # Each worker holds one connection at a time; leave room for metadata calls
+        pool_size = max(10, self.max_workers * 2)
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+    
     def authenticate(self):
-        """Authenticate with Azure AD and get access token."""
+        """Authenticate with Azure AD; the shared provider renews the token before it expires."""
         logger.info("Authenticating to Dataverse...")
         
-        authority = f"https://login.microsoftonline.com/{self.tenant_id}"
-        scope = [f"{self.environment_url}/.default"]
+        scope = f"{self.environment_url}/.default"
+        self.token_provider = get_token_provider(self.tenant_id, self.client_id, self.client_secret,
+                                                 scope, fetch=self._acquire_token,
+                                                 name='Dataverse access token')
+        self.token_provider.get_token()
+        logger.info("Authentication successful")
+    
+    def _acquire_token(self) -> Dict[str, Any]:
+        """
+        Request a new access token (token endpoint response with expires_in).
         
+        A fresh application object is used each time, so a token rejected with
+        401 is not served again from MSAL's in-memory cache.
+        """
         app = ConfidentialClientApplication(
             client_id=self.client_id,
             client_credential=self.client_secret,
-            authority=authority
+            authority=f"https://login.microsoftonline.com/{self.tenant_id}"
         )
         
-        result = app.acquire_token_for_client(scopes=scope)
+        result = app.acquire_token_for_client(scopes=[f"{self.environment_url}/.default"])
         
-        if "access_token" in result:
-            self.access_token = result["access_token"]
-            logger.info("Authentication successful")
-        else:
+        if "access_token" not in result:
             error = result.get("error_description", result.get("error"))
             raise Exception(f"Authentication failed: {error}")
+        return result
     
-    def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
+    def _headers(self, max_page_size: Optional[int] = None, track_changes: bool = False) -> Dict[str, str]:
+        """
+        Web API request headers.
+        
+        Args:
+            max_page_size: Records per page to ask for (odata.maxpagesize)
+            track_changes: Ask for a delta link (odata.track-changes)
+        """
+        prefer = "odata.include-annotations=*"
+        if max_page_size:
+            prefer += f",odata.maxpagesize={max_page_size}"
+        if track_changes:
+            prefer += ",odata.track-changes"
+        
+        return {
+            "Authorization": self.token_provider.authorization(),
+            "Accept": "application/json",
+            "OData-MaxVersion": "4.0",
+            "OData-Version": "4.0",
+            "Prefer": prefer
+        }
+    
+    def _get(self, url: str, params: Optional[Dict], max_page_size: Optional[int],
+             track_changes: bool) -> Dict:
+        """GET a Web API URL, retrying once with a new token after a 401."""
+        headers = self._headers(max_page_size, track_changes)
+        response = self.session.get(url, headers=headers, params=params)
+        
+        if response.status_code == 401:
+            # Coalesced: only the first worker to see the rejected token fetches a new one
+            self.token_provider.invalidate(headers["Authorization"][len("Bearer "):])
+            response = self.session.get(url, headers=self._headers(max_page_size, track_changes),
+                                        params=params)
+        
+        response.raise_for_status()
+        
+        # Pages count towards the process-wide download bandwidth, if one is set
+        bandwidth = get_bandwidth_limiter()
+        if bandwidth is not None:
+            bandwidth.consume(len(response.content))
+        return response.json()
+    
+    def _make_request(self, endpoint: str, params: Optional[Dict] = None,
+                      max_page_size: Optional[int] = None, track_changes: bool = False) -> Dict:
         """
         Make authenticated request to Dataverse Web API.
         
         Args:
             endpoint: API endpoint (relative to base URL)
             params: Query parameters
+            max_page_size: Records per page to ask for (odata.maxpagesize)
+            track_changes: Ask for a delta link (odata.track-changes)
             
         Returns:
             Response JSON data
         """
         url = f"{self.environment_url}/api/data/v9.2/{endpoint}"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Accept": "application/json",
-            "OData-MaxVersion": "4.0",
-            "OData-Version": "4.0",
-            "Prefer": "odata.include-annotations=*"
-        }
         
         try:
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            return response.json()
+            return self._get(url, params, max_page_size, track_changes)
         except requests.exceptions.RequestException as e:
             logger.error(f"Request failed for {endpoint}: {str(e)}")
             if hasattr(e.response, 'text'):
                 logger.error(f"Response: {e.response.text}")
             raise
     
-    def _get_all_pages(self, endpoint: str, params: Optional[Dict] = None) -> List[Dict]:
+    def _iter_pages(self, endpoint: str, params: Optional[Dict] = None,
+                    max_page_size: Optional[int] = None, track_changes: bool = False,
+                    start_link: Optional[str] = None,
+                    page_info: Optional[Dict[str, Any]] = None) -> Iterator[List[Dict]]:
         """
-        Retrieve all pages of data from paginated API endpoint.
+        Yield the records of a paginated API endpoint one page at a time.
         
         Args:
             endpoint: API endpoint
             params: Query parameters
+            max_page_size: Records per page to ask for (odata.maxpagesize)
+            track_changes: Ask for a delta link (odata.track-changes)
+            start_link: Full URL to start from instead of endpoint (e.g. a stored delta link)
+            page_info: If given, receives 'delta_link' from the last page
             
-        Returns:
-            List of all records across all pages
+        Yields:
+            List of records of each page
         """
-        all_records = []
-        next_link = None
+        next_link = start_link
+        total = 0
         
         while True:
             if next_link:
                 # Use the full URL for next page
-                url = next_link
-                headers = {
-                    "Authorization": f"Bearer {self.access_token}",
-                    "Accept": "application/json",
-                    "OData-MaxVersion": "4.0",
-                    "OData-Version": "4.0",
-                    "Prefer": "odata.include-annotations=*"
-                }
-                response = requests.get(url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
+                data = self._get(next_link, None, max_page_size, track_changes)
             else:
-                data = self._make_request(endpoint, params)
+                data = self._make_request(endpoint, params, max_page_size, track_changes)
             
             records = data.get('value', [])
-            all_records.extend(records)
+            total += len(records)
+            yield records
             
             # Check for next page
             next_link = data.get('@odata.nextLink')
             if not next_link:
+                if page_info is not None:
+                    page_info['delta_link'] = data.get('@odata.deltaLink')
                 break
             
-            logger.debug(f"Fetching next page... (total so far: {len(all_records)})")
+            logger.debug(f"Fetching next page... (total so far: {total})")
+    
+    def _get_all_pages(self, endpoint: str, params: Optional[Dict] = None) -> List[Dict]:
+        """
+        Retrieve all pages of data from paginated API endpoint.
         
+        Args:
+            endpoint: API endpoint
+            params: Query parameters
+            
+        Returns:
+            List of all records across all pages
+        """
+        all_records = []
+        for records in self._iter_pages(endpoint, params):
+            all_records.extend(records)
         return all_records
     
     def backup_all(self):
@@ -194,6 +355,9 @@ class DataverseBackup:
             # Save tables metadata
             self.save_tables_metadata(tables)
             
+            # Fetch (or load cached) attribute metadata of all tables at once
+            self.prefetch_attributes(tables)
+            
             # Backup each table's data
             self.backup_all_tables(tables)
             
@@ -220,7 +384,7 @@ class DataverseBackup:
         
         # Get entity definitions
         params = {
-            "$select": "LogicalName,DisplayName,SchemaName,IsCustomEntity,IsManaged,PrimaryIdAttribute,PrimaryNameAttribute,EntitySetName,Description",
+            "$select": "LogicalName,DisplayName,SchemaName,IsCustomEntity,IsManaged,PrimaryIdAttribute,PrimaryNameAttribute,EntitySetName,Description,ChangeTrackingEnabled",
             "$filter": "IsValidForAdvancedFind eq true and IsPrivate eq false"
         }
         
@@ -277,10 +441,43 @@ class DataverseBackup:
         
         logger.info(f"Tables metadata saved to {metadata_path}")
     
+    def get_record_counts(self, tables: List[Dict]) -> Dict[str, int]:
+        """
+        Get approximate record counts of tables with RetrieveTotalRecordCount.
+        
+        The counts come from a snapshot the service refreshes periodically, so the
+        call is cheap but may lag behind; they are only used to schedule the
+        largest tables first and to report progress.
+        
+        Args:
+            tables: List of table metadata
+            
+        Returns:
+            LogicalName -> record count (tables the service has no count for are missing)
+        """
+        names = [t['LogicalName'] for t in tables if t.get('LogicalName') and t.get('EntitySetName')]
+        counts: Dict[str, int] = {}
+        
+        for start in range(0, len(names), _COUNT_BATCH_SIZE):
+            batch = names[start:start + _COUNT_BATCH_SIZE]
+            entity_names = "[" + ",".join(f"'{name}'" for name in batch) + "]"
+            try:
+                data = self._make_request("RetrieveTotalRecordCount(EntityNames=@p1)", {"@p1": entity_names})
+                collection = data.get('EntityRecordCountCollection', {})
+                counts.update(zip(collection.get('Keys', []), collection.get('Values', [])))
+            except Exception as e:
+                logger.warning(f"Could not retrieve record counts, tables keep their order: {str(e)}")
+                break
+        
+        return counts
+    
     def backup_all_tables(self, tables: List[Dict]):
         """
         Backup data from all tables.
         
+        Tables run on max_workers threads, largest first, so the longest exports
+        start right away instead of being left for the end.
+        
         Args:
             tables: List of table metadata
         """
@@ -292,7 +489,8 @@ class DataverseBackup:
         success_count = 0
         error_count = 0
         
-        for idx, table in enumerate(tables, 1):
+        jobs = []
+        for table in tables:
             logical_name = table.get('LogicalName')
             entity_set_name = table.get('EntitySetName')
             
@@ -308,109 +506,367 @@ class DataverseBackup:
                 logger.warning(f"Skipping {logical_name} - no EntitySetName")
                 continue
             
-            logger.info(f"[{idx}/{len(tables)}] Backing up table: {display_name} ({logical_name})")
+            jobs.append((table, display_name))
+        
+        if self.max_workers > 1:
+            self.record_counts = self.get_record_counts([table for table, _ in jobs])
+            jobs.sort(key=lambda job: self.record_counts.get(job[0].get('LogicalName'), -1), reverse=True)
+            logger.info(f"Exporting {len(jobs)} tables with {self.max_workers} workers, largest first")
+        
+        def run(table: Dict, display_name: str):
+            started = time.monotonic()
+            logger.info(f"Backing up table: {display_name} ({table.get('LogicalName')})")
+            entry = self.backup_table(table, display_name, tables_dir)
+            return entry, time.monotonic() - started
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(run, table, display_name): (table, display_name)
+                       for table, display_name in jobs}
+            
+            for done, future in enumerate(as_completed(futures), 1):
+                table, display_name = futures[future]
+                logical_name = table.get('LogicalName')
+                try:
+                    entry, elapsed = future.result()
+                    logger.info(f"[{done}/{len(jobs)}] ✓ {display_name} ({logical_name}): "
+                                f"{entry['RecordCount']:,} records in {elapsed:.1f}s")
+                    success_count += 1
+                except Exception as e:
+                    logger.error(f"[{done}/{len(jobs)}] ✗ Failed to backup table '{logical_name}': {str(e)}")
+                    error_count += 1
+        
+        logger.info(f"Table backup completed: {success_count} successful, {error_count} errors")
+    
+    def _log_progress(self, logical_name: str, before: int, after: int):
+        """Log when a table's export passes another _PROGRESS_RECORDS records."""
+        if after // _PROGRESS_RECORDS == before // _PROGRESS_RECORDS:
+            return
+        expected = self.record_counts.get(logical_name)
+        if expected:
+            logger.info(f"  {logical_name}: {after:,} / ~{expected:,} records ({min(after / expected, 1):.0%})")
+        else:
+            logger.info(f"  {logical_name}: {after:,} records")
+    
+    def backup_table(self, table: Dict, display_name: str, tables_dir: Path) -> Dict[str, Any]:
+        """
+        Export one table: a delta of its changes in incremental mode when a delta
+        link is available, otherwise all of its records.
+        
+        Args:
+            table: Table metadata from get_tables()
+            display_name: Name for logs and the summary
+            tables_dir: Directory of the table files
+            
+        Returns:
+            The table's summary entry (also appended to self.table_summary)
+        """
+        logical_name = table.get('LogicalName')
+        entity_set_name = table.get('EntitySetName')
+        tracked = self.state_db is not None and bool(table.get('ChangeTrackingEnabled'))
+        
+        # Safe filename
+        safe_name = logical_name.replace('/', '_').replace('\\', '_')
+        metadata = {
+            'LogicalName': logical_name,
+            'DisplayName': display_name,
+            'SchemaName': table.get('SchemaName'),
+            'EntitySetName': entity_set_name,
+            'BackupDate': datetime.now().isoformat(),
+            'IsCustomEntity': table.get('IsCustomEntity'),
+            'PrimaryIdAttribute': table.get('PrimaryIdAttribute'),
+            'PrimaryNameAttribute': table.get('PrimaryNameAttribute')
+        }
+        
+        if tracked and not self.state_db.needs_snapshot(logical_name, self.full_snapshot_days):
+            state = self.state_db.get_table_state(logical_name)
+            try:
+                entry = self._backup_table_delta(logical_name, state['delta_link'], safe_name,
+                                                 tables_dir, dict(metadata, Kind='delta'))
+                entry['DisplayName'] = display_name
+                self.table_summary.append(entry)
+                return entry
+            except requests.exceptions.HTTPError as e:
+                # Expired or invalid delta token: start over with a full snapshot
+                logger.warning(f"  Delta link of {logical_name} was rejected ({e}), taking a full snapshot")
+                self.state_db.set_delta_link(logical_name, None)
+        
+        # Get table attributes/columns metadata
+        attributes = self.get_table_attributes(logical_name)
+        writer = open_table_writer(tables_dir, safe_name, self.export_format,
+                                   self.compression, attributes)
+        page_info: Dict[str, Any] = {}
+        
+        # Stream the table data page by page
+        try:
+            for records in self._iter_pages(entity_set_name, max_page_size=self.page_size,
+                                             track_changes=tracked, page_info=page_info):
+                before = writer.record_count
+                writer.write_page(records)
+                self._log_progress(logical_name, before, writer.record_count)
+            
+            kind = 'snapshot' if self.state_db is not None else 'full'
+            table_file = writer.close(dict(metadata, Kind=kind))
+        except BaseException:
+            writer.abort()
+            raise
+        
+        if self.state_db is not None:
+            delta_link = page_info.get('delta_link') if tracked else None
+            if tracked and not delta_link:
+                logger.warning(f"  No delta link returned for {logical_name}; it will be exported in full again")
+            self.state_db.record_snapshot(logical_name, entity_set_name, table.get('PrimaryIdAttribute'),
+                                          table_file, writer.record_count, delta_link)
+        
+        entry = {
+            'LogicalName': logical_name,
+            'DisplayName': display_name,
+            'Kind': kind,
+            'RecordCount': writer.record_count,
+            'DeletedCount': 0,
+            'FileName': table_file.name
+        }
+        self.table_summary.append(entry)
+        
+        logger.debug(f"  Saved {writer.record_count} records to {table_file.name}")
+        return entry
+    
+    def _backup_table_delta(self, logical_name: str, delta_link: str, safe_name: str,
+                            tables_dir: Path, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Write the rows changed since the last sync to <table>.delta.ndjson[.gz|.zst].
+        
+        Deleted rows are kept as the service's $deletedEntity markers. When nothing
+        changed, no file is written and only the delta link moves forward.
+        
+        Returns:
+            Summary entry for the table
+        """
+        writer = open_table_writer(tables_dir, f"{safe_name}.delta", 'ndjson', self.compression)
+        page_info: Dict[str, Any] = {}
+        deleted = 0
+        
+        try:
+            for records in self._iter_pages(None, max_page_size=self.page_size, track_changes=True,
+                                             start_link=delta_link, page_info=page_info):
+                deleted += sum(1 for record in records if is_deleted_record(record))
+                writer.write_page(records)
             
+            if writer.record_count == 0:
+                writer.abort()
+                table_file = None
+            else:
+                table_file = writer.close(metadata)
+        except BaseException:
+            writer.abort()
+            raise
+        
+        new_link = page_info.get('delta_link')
+        changed = writer.record_count - deleted
+        if table_file is None:
+            self.state_db.set_delta_link(logical_name, new_link)
+        else:
+            self.state_db.record_delta(logical_name, table_file, changed, deleted, new_link)
+        
+        if not new_link:
+            logger.warning(f"  No new delta link returned for {logical_name}; it will be exported in full next time")
+        
+        logger.info(f"  {logical_name}: {changed} changed and {deleted} deleted records"
+                    + (f" saved to {table_file.name}" if table_file else " (no delta file needed)"))
+        
+        return {
+            'LogicalName': logical_name,
+            'Kind': 'delta',
+            'RecordCount': changed,
+            'DeletedCount': deleted,
+            'FileName': table_file.name if table_file else None
+        }
+    
+    def get_metadata_version(self) -> Optional[str]:
+        """
+        Get the environment's metadata version stamp.
+        
+        RetrieveMetadataChanges returns a ServerVersionStamp that changes whenever
+        any table or column definition changes; the query matches no table, so the
+        call only returns the stamp.
+        
+        Returns:
+            Version stamp, or None if the service did not provide one
+        """
+        query = {
+            "Criteria": {
+                "FilterOperator": "And",
+                "Conditions": [{
+                    "PropertyName": "LogicalName",
+                    "ConditionOperator": "Equals",
+                    "Value": {"Type": "System.String", "Value": "__metadata_version__"}
+                }]
+            },
+            "Properties": {"AllProperties": False, "PropertyNames": ["LogicalName"]}
+        }
+        
+        try:
+            data = self._make_request("RetrieveMetadataChanges(Query=@p1)", {"@p1": json.dumps(query)})
+            return data.get('ServerVersionStamp')
+        except Exception as e:
+            logger.warning(f"Could not retrieve the metadata version, attribute cache not used: {str(e)}")
+            return None
+    
+    def _load_metadata_cache(self, version: str) -> Dict[str, List[Dict]]:
+        """Cached attributes per table if the cache was written for this environment and version."""
+        cache_path = self.backup_dir / METADATA_CACHE_NAME
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        
+        if cache.get('environment_url') != self.environment_url or cache.get('version') != version:
+            return {}
+        return cache.get('attributes', {})
+    
+    def _save_metadata_cache(self, version: str):
+        """Write the attribute cache atomically."""
+        cache_path = self.backup_dir / METADATA_CACHE_NAME
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'environment_url': self.environment_url,
+                    'version': version,
+                    'saved': datetime.now().isoformat(),
+                    'attributes': self.attribute_cache
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not save metadata cache: {str(e)}")
+    
+    def prefetch_attributes(self, tables: List[Dict]):
+        """
+        Fill attribute_cache for all tables.
+        
+        Tables found in the on-disk cache for the current metadata version are
+        taken from it; the rest are fetched with EntityDefinitions?$expand=Attributes,
+        _METADATA_BATCH_SIZE tables per request, instead of one paginated
+        request per table. Tables a batch fails for fall back to get_table_attributes.
+        
+        Args:
+            tables: List of table metadata
+        """
+        names = [t['LogicalName'] for t in tables if t.get('LogicalName') and t.get('EntitySetName')]
+        version = self.get_metadata_version()
+        
+        cached = self._load_metadata_cache(version) if version else {}
+        self.attribute_cache.update({name: cached[name] for name in names if name in cached})
+        missing = [name for name in names if name not in self.attribute_cache]
+        
+        if not missing:
+            logger.info(f"Attribute metadata of {len(names)} tables loaded from cache (version {version})")
+            return
+        
+        logger.info(f"Fetching attribute metadata of {len(missing)} tables "
+                    f"({len(names) - len(missing)} cached)...")
+        
+        for start in range(0, len(missing), _METADATA_BATCH_SIZE):
+            batch = missing[start:start + _METADATA_BATCH_SIZE]
+            params = {
+                "$select": "LogicalName",
+                "$filter": " or ".join(f"LogicalName eq '{name}'" for name in batch),
+                "$expand": f"Attributes($select={ATTRIBUTE_SELECT})"
+            }
             try:
-                # Get table attributes/columns metadata
-                attributes = self.get_table_attributes(logical_name)
-                
-                # Get table data
-                records = self.get_table_data(entity_set_name)
-                
-                # Save to JSON
-                table_data = {
-                    'metadata': {
-                        'LogicalName': logical_name,
-                        'DisplayName': display_name,
-                        'SchemaName': table.get('SchemaName'),
-                        'EntitySetName': entity_set_name,
-                        'RecordCount': len(records),
-                        'BackupDate': datetime.now().isoformat(),
-                        'IsCustomEntity': table.get('IsCustomEntity'),
-                        'PrimaryIdAttribute': table.get('PrimaryIdAttribute'),
-                        'PrimaryNameAttribute': table.get('PrimaryNameAttribute')
-                    },
-                    'attributes': attributes,
-                    'records': records
-                }
-                
-                # Safe filename
-                safe_name = logical_name.replace('/', '_').replace('\\', '_')
-                table_file = tables_dir / f"{safe_name}.json"
-                
-                with open(table_file, 'w', encoding='utf-8') as f:
-                    json.dump(table_data, f, indent=2, ensure_ascii=False, default=str)
-                
-                logger.info(f"  ✓ Saved {len(records)} records to {safe_name}.json")
-                success_count += 1
-                
+                for entity in self._get_all_pages("EntityDefinitions", params):
+                    self.attribute_cache[entity['LogicalName']] = [
+                        self._simplify_attribute(attr) for attr in entity.get('Attributes', [])
+                    ]
             except Exception as e:
-                logger.error(f"  ✗ Failed to backup table '{logical_name}': {str(e)}")
-                error_count += 1
+                logger.warning(f"Attribute batch of {len(batch)} tables failed, "
+                               f"falling back to one request per table: {str(e)}")
         
-        logger.info(f"Table backup completed: {success_count} successful, {error_count} errors")
+        if version:
+            self._save_metadata_cache(version)
+    
+    @staticmethod
+    def _simplify_attribute(attr: Dict) -> Dict:
+        """Reduce attribute metadata to the fields kept in the backup."""
+        # Safely get DisplayName with nested access
+        display_name_obj = attr.get('DisplayName')
+        display_name = None
+        if display_name_obj and isinstance(display_name_obj, dict):
+            user_localized_label = display_name_obj.get('UserLocalizedLabel')
+            if user_localized_label and isinstance(user_localized_label, dict):
+                display_name = user_localized_label.get('Label')
+        
+        # Safely get RequiredLevel
+        required_level_obj = attr.get('RequiredLevel')
+        required_level = None
+        if required_level_obj and isinstance(required_level_obj, dict):
+            required_level = required_level_obj.get('Value')
+        
+        # Safely get Description with nested access
+        description_obj = attr.get('Description')
+        description = None
+        if description_obj and isinstance(description_obj, dict):
+            desc_user_localized_label = description_obj.get('UserLocalizedLabel')
+            if desc_user_localized_label and isinstance(desc_user_localized_label, dict):
+                description = desc_user_localized_label.get('Label')
+        
+        return {
+            'LogicalName': attr.get('LogicalName'),
+            'SchemaName': attr.get('SchemaName'),
+            'DisplayName': display_name,
+            'AttributeType': attr.get('AttributeType'),
+            'IsCustomAttribute': attr.get('IsCustomAttribute'),
+            'IsPrimaryId': attr.get('IsPrimaryId'),
+            'IsPrimaryName': attr.get('IsPrimaryName'),
+            'RequiredLevel': required_level,
+            'Description': description
+        }
     
     def get_table_attributes(self, logical_name: str) -> List[Dict]:
         """
         Get attributes/columns metadata for a table.
         
+        Served from attribute_cache when prefetch_attributes() covered the table.
+        
         Args:
             logical_name: Table logical name
             
         Returns:
             List of attribute metadata
         """
+        if logical_name in self.attribute_cache:
+            return self.attribute_cache[logical_name]
+        
         try:
             endpoint = f"EntityDefinitions(LogicalName='{logical_name}')/Attributes"
             params = {
-                "$select": "LogicalName,SchemaName,DisplayName,AttributeType,IsCustomAttribute,IsPrimaryId,IsPrimaryName,RequiredLevel,Description"
+                "$select": ATTRIBUTE_SELECT
             }
             
             attributes = self._get_all_pages(endpoint, params)
             
             # Simplify attribute metadata
-            simplified_attributes = []
-            for attr in attributes:
-                # Safely get DisplayName with nested access
-                display_name_obj = attr.get('DisplayName')
-                display_name = None
-                if display_name_obj and isinstance(display_name_obj, dict):
-                    user_localized_label = display_name_obj.get('UserLocalizedLabel')
-                    if user_localized_label and isinstance(user_localized_label, dict):
-                        display_name = user_localized_label.get('Label')
-                
-                # Safely get RequiredLevel
-                required_level_obj = attr.get('RequiredLevel')
-                required_level = None
-                if required_level_obj and isinstance(required_level_obj, dict):
-                    required_level = required_level_obj.get('Value')
-                
-                # Safely get Description with nested access
-                description_obj = attr.get('Description')
-                description = None
-                if description_obj and isinstance(description_obj, dict):
-                    desc_user_localized_label = description_obj.get('UserLocalizedLabel')
-                    if desc_user_localized_label and isinstance(desc_user_localized_label, dict):
-                        description = desc_user_localized_label.get('Label')
-                
-                simplified_attributes.append({
-                    'LogicalName': attr.get('LogicalName'),
-                    'SchemaName': attr.get('SchemaName'),
-                    'DisplayName': display_name,
-                    'AttributeType': attr.get('AttributeType'),
-                    'IsCustomAttribute': attr.get('IsCustomAttribute'),
-                    'IsPrimaryId': attr.get('IsPrimaryId'),
-                    'IsPrimaryName': attr.get('IsPrimaryName'),
-                    'RequiredLevel': required_level,
-                    'Description': description
-                })
-            
-            return simplified_attributes
+            return [self._simplify_attribute(attr) for attr in attributes]
             
         except Exception as e:
             logger.warning(f"Could not retrieve attributes for {logical_name}: {str(e)}")
             return []
     
+    def iter_table_data(self, entity_set_name: str, page_size: Optional[int] = None) -> Iterator[List[Dict]]:
+        """
+        Yield the records of a table one page at a time.
+        
+        Errors are raised, so a table that fails half-way is not saved as complete.
+        
+        Args:
+            entity_set_name: Entity set name for the table
+            page_size: Records per page (default: the backup's page_size)
+            
+        Yields:
+            List of records of each page
+        """
+        yield from self._iter_pages(entity_set_name, max_page_size=page_size or self.page_size)
+    
     def get_table_data(self, entity_set_name: str, top: int = 5000) -> List[Dict]:
         """
         Get all records from a table.
@@ -423,11 +879,9 @@ class DataverseBackup:
             List of records
         """
         try:
-            params = {
-                "$top": top
-            }
-            
-            records = self._get_all_pages(entity_set_name, params)
+            records = []
+            for page in self.iter_table_data(entity_set_name, page_size=top):
+                records.extend(page)
             return records
             
         except Exception as e:
@@ -438,28 +892,10 @@ class DataverseBackup:
         """Create a summary of the backup operation."""
         logger.info("Creating backup summary...")
         
-        # Count records in each backed up table
-        tables_dir = self.backup_path / "tables"
-        table_files = list(tables_dir.glob("*.json"))
-        
-        total_records = 0
-        table_summary = []
-        
-        for table_file in table_files:
-            try:
-                with open(table_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    record_count = len(data.get('records', []))
-                    total_records += record_count
-                    
-                    table_summary.append({
-                        'LogicalName': data['metadata']['LogicalName'],
-                        'DisplayName': data['metadata']['DisplayName'],
-                        'RecordCount': record_count,
-                        'FileName': table_file.name
-                    })
-            except Exception as e:
-                logger.warning(f"Could not read {table_file.name}: {str(e)}")
+        # Record counts were collected while the tables were written, so the
+        # (possibly huge) table files are not read back
+        table_summary = list(self.table_summary)
+        total_records = sum(t['RecordCount'] for t in table_summary)
         
         # Sort by record count
         table_summary.sort(key=lambda x: x['RecordCount'], reverse=True)
@@ -469,7 +905,11 @@ class DataverseBackup:
                 'environment_url': self.environment_url,
                 'backup_date': datetime.now().isoformat(),
                 'backup_path': str(self.backup_path.absolute()),
-                'total_tables': len(table_files),
+                'export_format': self.export_format,
+                'incremental': self.state_db is not None,
+                'delta_tables': sum(1 for t in table_summary if t.get('Kind') == 'delta'),
+                'compression': self.compression,
+                'total_tables': len(table_summary),
                 'total_records': total_records
             },
             'tables': table_summary
@@ -479,11 +919,35 @@ class DataverseBackup:
         with open(summary_path, 'w', encoding='utf-8') as f:
             json.dump(summary, f, indent=2, ensure_ascii=False)
         
-        logger.info(f"Backup summary saved: {len(table_files)} tables, {total_records:,} total records")
+        logger.info(f"Backup summary saved: {len(table_summary)} tables, {total_records:,} total records")
+
+
+def config_from_env() -> Dict[str, Any]:
+    """
+    DataverseBackup settings from the environment (also used by backup_orchestrator.py).
+    
+    Returns:
+        Keyword arguments for DataverseBackup; credentials are None when not set
+    """
+    return {
+        'environment_url': os.environ.get('DATAVERSE_ENVIRONMENT_URL'),
+        'tenant_id': os.environ.get('DATAVERSE_TENANT_ID'),
+        'client_id': os.environ.get('DATAVERSE_CLIENT_ID'),
+        'client_secret': os.environ.get('DATAVERSE_CLIENT_SECRET'),
+        'backup_dir': os.environ.get('BACKUP_DIR', 'backup'),
+        'export_format': os.environ.get('DATAVERSE_EXPORT_FORMAT', 'json'),
+        'compression': os.environ.get('DATAVERSE_COMPRESSION', 'none'),
+        'page_size': int(os.environ.get('DATAVERSE_PAGE_SIZE', '5000')),
+        'incremental': os.environ.get('DATAVERSE_INCREMENTAL', '').lower() in ('1', 'true', 'yes'),
+        'full_snapshot_days': float(os.environ.get('DATAVERSE_FULL_SNAPSHOT_DAYS', str(DEFAULT_FULL_SNAPSHOT_DAYS))),
+        'max_workers': int(os.environ.get('DATAVERSE_WORKERS', str(DEFAULT_TABLE_WORKERS)))
+    }
 
 
 def main():
     """Main entry point."""
+    configure_logging()
+
     # Try to load environment variables from .env file
     try:
         from dotenv import load_dotenv
@@ -495,11 +959,16 @@ def main():
         logger.warning(f"Failed to load .env file: {str(e)}")
     
     # Configuration - Load from environment variables
-    ENVIRONMENT_URL = os.environ.get('DATAVERSE_ENVIRONMENT_URL')
-    TENANT_ID = os.environ.get('DATAVERSE_TENANT_ID')
-    CLIENT_ID = os.environ.get('DATAVERSE_CLIENT_ID')
-    CLIENT_SECRET = os.environ.get('DATAVERSE_CLIENT_SECRET')
-    BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backup')
+    config = config_from_env()
+    ENVIRONMENT_URL = config['environment_url']
+    TENANT_ID = config['tenant_id']
+    CLIENT_ID = config['client_id']
+    CLIENT_SECRET = config['client_secret']
+    EXPORT_FORMAT = config['export_format']
+    COMPRESSION = config['compression']
+    INCREMENTAL = config['incremental']
+    FULL_SNAPSHOT_DAYS = config['full_snapshot_days']
+    WORKERS = config['max_workers']
     
     # Validate configuration
     missing_vars = []
@@ -531,16 +1000,14 @@ def main():
     logger.info(f"Tenant ID: {TENANT_ID}")
     logger.info(f"Client ID: {CLIENT_ID}")
     logger.info(f"Client Secret: {'*' * len(CLIENT_SECRET) if CLIENT_SECRET else 'NOT SET'}")
+    logger.info(f"Export format: {EXPORT_FORMAT}" + (f" ({COMPRESSION})" if COMPRESSION != 'none' else ""))
+    if INCREMENTAL:
+        logger.info(f"Incremental: change tracking, full snapshot every {FULL_SNAPSHOT_DAYS:g} days")
+    logger.info(f"Table workers: {WORKERS}")
     
     try:
         # Create backup instance and run backup
-        backup = DataverseBackup(
-            environment_url=ENVIRONMENT_URL,
-            tenant_id=TENANT_ID,
-            client_id=CLIENT_ID,
-            client_secret=CLIENT_SECRET,
-            backup_dir=BACKUP_DIR
-        )
+        backup = DataverseBackup(**config)
         backup.backup_all()
         
     except Exception as e:
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Streaming Dataverse Table Writers
+Write a table's records page by page as they arrive from the Web API, so memory
+is bounded by one page however large the table is.
+
+Formats:
+- json:    the classic {"attributes": ..., "records": [...], "metadata": ...} file
+- ndjson:  one record per line (optionally .gz or .zst)
+- parquet: columnar file typed from the table's attribute metadata (needs pyarrow)
+
+For ndjson and parquet, table metadata and attributes go to <name>.meta.json.
+"""
+
+import gzip
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, IO, Iterator, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+ZSTD_AVAILABLE = zstandard is not None
+PARQUET_AVAILABLE = pyarrow is not None
+
+EXPORT_FORMATS = ('json', 'ndjson', 'parquet')
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+# Column of a Parquet file holding (as JSON) record fields that were not in the
+# schema, e.g. annotations that first appear after the first page
+PARQUET_EXTRA_COLUMN = '_extra'
+
+
+def _suffix(export_format: str, compression: str) -> str:
+    if export_format == 'ndjson':
+        return '.ndjson' + {'gzip': '.gz', 'zstd': '.zst'}.get(compression, '')
+    return '.' + export_format
+
+
+def check_export_format(export_format: str, compression: str = 'none'):
+    """
+    Validate an export format and compression, including optional dependencies.
+
+    Raises:
+        ValueError: Unknown format/compression, or its package is not installed
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}' (choose from {', '.join(EXPORT_FORMATS)})")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}' (choose from {', '.join(COMPRESSIONS)})")
+    if compression != 'none' and export_format != 'ndjson':
+        raise ValueError("Compression is only supported for the ndjson format")
+    if compression == 'zstd' and not ZSTD_AVAILABLE:
+        raise ValueError("zstd compression needs the zstandard package (pip install zstandard)")
+    if export_format == 'parquet' and not PARQUET_AVAILABLE:
+        raise ValueError("The parquet format needs the pyarrow package (pip install pyarrow)")
+
+
+class TableWriter:
+    """
+    Base class: records are written to a temporary file that is renamed into
+    place by close(), so a failed export never leaves a truncated table behind.
+
+    Usage:
+        writer = open_table_writer(tables_dir, 'account', 'ndjson', attributes=attributes)
+        try:
+            for page in pages:
+                writer.write_page(page)
+            writer.close(metadata)
+        except Exception:
+            writer.abort()
+            raise
+    """
+
+    def __init__(self, path: Path, attributes: Optional[List[Dict]] = None):
+        """
+        Args:
+            path: Final path of the table file
+            attributes: Simplified attribute metadata of the table
+        """
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + '.tmp')
+        self.attributes = attributes or []
+        self.record_count = 0
+
+    def write_page(self, records: List[Dict]):
+        """Append one page of records."""
+        raise NotImplementedError
+
+    def close(self, metadata: Dict[str, Any]) -> Path:
+        """
+        Finish the file and move it into place.
+
+        Args:
+            metadata: Table metadata; RecordCount is filled in by the writer
+
+        Returns:
+            Path of the written table file
+        """
+        raise NotImplementedError
+
+    def abort(self):
+        """Discard the partial file."""
+        try:
+            self.tmp_path.unlink()
+        except OSError:
+            pass
+
+    def _finish(self) -> Path:
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def _write_meta(self, metadata: Dict[str, Any]):
+        """Write <name>.meta.json next to the table file."""
+        meta = {
+            'metadata': dict(metadata, RecordCount=self.record_count, DataFile=self.path.name),
+            'attributes': self.attributes
+        }
+        with open(meta_path_for(self.path), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False, default=str)
+
+
+class JsonTableWriter(TableWriter):
+    """The original one-document-per-table layout, streamed."""
+
+    def __init__(self, path: Path, attributes: Optional[List[Dict]] = None):
+        super().__init__(path, attributes)
+        self._file = open(self.tmp_path, 'w', encoding='utf-8')
+        self._file.write('{\n  "attributes": ')
+        self._file.write(self._indent(json.dumps(self.attributes, indent=2, ensure_ascii=False)))
+        self._file.write(',\n  "records": [')
+
+    @staticmethod
+    def _indent(text: str, prefix: str = '  ') -> str:
+        return text.replace('\n', '\n' + prefix)
+
+    def write_page(self, records: List[Dict]):
+        for record in records:
+            self._file.write(',\n    ' if self.record_count else '\n    ')
+            self._file.write(self._indent(json.dumps(record, indent=2, ensure_ascii=False, default=str),
+                                          '    '))
+            self.record_count += 1
+
+    def close(self, metadata: Dict[str, Any]) -> Path:
+        metadata = dict(metadata, RecordCount=self.record_count)
+        self._file.write('\n  ],\n  "metadata": ' if self.record_count else '],\n  "metadata": ')
+        self._file.write(self._indent(json.dumps(metadata, indent=2, ensure_ascii=False, default=str)))
+        self._file.write('\n}\n')
+        self._file.close()
+        return self._finish()
+
+    def abort(self):
+        self._file.close()
+        super().abort()
+
+
+class NdjsonTableWriter(TableWriter):
+    """One JSON record per line."""
+
+    def __init__(self, path: Path, attributes: Optional[List[Dict]] = None, compression: str = 'none'):
+        super().__init__(path, attributes)
+        self._raw: Optional[IO[bytes]] = None
+
+        if compression == 'gzip':
+            self._file: IO[bytes] = gzip.open(self.tmp_path, 'wb', compresslevel=6)
+        elif compression == 'zstd':
+            self._raw = open(self.tmp_path, 'wb')
+            self._file = zstandard.ZstdCompressor(level=3).stream_writer(self._raw)
+        else:
+            self._file = open(self.tmp_path, 'wb')
+
+    def write_page(self, records: List[Dict]):
+        lines = [json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str)
+                 for record in records]
+        if lines:
+            self._file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        self.record_count += len(lines)
+
+    def _close_files(self):
+        self._file.close()
+        if self._raw is not None:
+            self._raw.close()
+
+    def close(self, metadata: Dict[str, Any]) -> Path:
+        self._close_files()
+        self._write_meta(metadata)
+        return self._finish()
+
+    def abort(self):
+        self._close_files()
+        super().abort()
+
+
+# Dataverse AttributeType -> Arrow type name; anything else is stored as a string
+_PARQUET_TYPES = {
+    'Integer': 'int64',
+    'BigInt': 'int64',
+    'Picklist': 'int64',
+    'State': 'int64',
+    'Status': 'int64',
+    'Double': 'float64',
+    'Decimal': 'float64',
+    'Money': 'float64',
+    'Boolean': 'bool_',
+}
+
+
+class ParquetTableWriter(TableWriter):
+    """
+    Columnar export. Column types come from the attribute metadata; columns the
+    metadata does not describe (lookup _x_value fields, annotations) are strings.
+    The schema is fixed after the first page; fields appearing later are kept as
+    JSON in the _extra column.
+    """
+
+    def __init__(self, path: Path, attributes: Optional[List[Dict]] = None):
+        super().__init__(path, attributes)
+        self._attribute_types = {a.get('LogicalName'): a.get('AttributeType') for a in self.attributes}
+        self._writer = None
+        self._schema = None
+
+    def _arrow_type(self, column: str):
+        type_name = _PARQUET_TYPES.get(self._attribute_types.get(column), 'string')
+        return getattr(pyarrow, type_name)()
+
+    def _build_schema(self, records: List[Dict]):
+        columns: Dict[str, None] = {}
+        for attribute in self.attributes:
+            if attribute.get('LogicalName'):
+                columns[attribute['LogicalName']] = None
+        for record in records:
+            for key in record:
+                columns[key] = None
+        columns.pop(PARQUET_EXTRA_COLUMN, None)
+
+        fields = [pyarrow.field(name, self._arrow_type(name)) for name in columns]
+        fields.append(pyarrow.field(PARQUET_EXTRA_COLUMN, pyarrow.string()))
+        return pyarrow.schema(fields)
+
+    def _convert(self, value: Any, arrow_type) -> Any:
+        if value is None:
+            return None
+        if pyarrow.types.is_string(arrow_type):
+            return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+        try:
+            if pyarrow.types.is_integer(arrow_type):
+                return int(value)
+            if pyarrow.types.is_floating(arrow_type):
+                return float(value)
+            if pyarrow.types.is_boolean(arrow_type):
+                return bool(value)
+        except (TypeError, ValueError):
+            return None
+        return value
+
+    def write_page(self, records: List[Dict]):
+        if self._schema is None:
+            self._schema = self._build_schema(records)
+            self._writer = pyarrow.parquet.ParquetWriter(str(self.tmp_path), self._schema, compression='zstd')
+
+        columns: Dict[str, List[Any]] = {field.name: [] for field in self._schema}
+        known = set(columns)
+        for record in records:
+            for field in self._schema:
+                if field.name != PARQUET_EXTRA_COLUMN:
+                    columns[field.name].append(self._convert(record.get(field.name), field.type))
+            extra = {k: v for k, v in record.items() if k not in known}
+            columns[PARQUET_EXTRA_COLUMN].append(
+                json.dumps(extra, ensure_ascii=False, default=str) if extra else None)
+
+        if records:
+            self._writer.write_table(pyarrow.table(columns, schema=self._schema))
+        self.record_count += len(records)
+
+    def close(self, metadata: Dict[str, Any]) -> Path:
+        if self._writer is None:
+            self.write_page([])
+        self._writer.close()
+        self._write_meta(metadata)
+        return self._finish()
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        super().abort()
+
+
+def meta_path_for(table_path: Path) -> Path:
+    """<name>.meta.json for a table file <name>.ndjson[.gz|.zst] or <name>.parquet."""
+    table_path = Path(table_path)
+    name = table_path.name
+    for suffix in ('.ndjson.gz', '.ndjson.zst', '.ndjson', '.parquet'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return table_path.with_name(name + '.meta.json')
+
+
+def open_table_writer(directory: Path, name: str, export_format: str = 'json',
+                      compression: str = 'none', attributes: Optional[List[Dict]] = None) -> TableWriter:
+    """
+    Create the writer for one table.
+
+    Args:
+        directory: Directory of the table files
+        name: File name without suffix (the table's safe logical name)
+        export_format: One of EXPORT_FORMATS
+        compression: One of COMPRESSIONS (ndjson only)
+        attributes: Simplified attribute metadata of the table
+
+    Returns:
+        TableWriter for <directory>/<name><suffix>
+    """
+    check_export_format(export_format, compression)
+    path = Path(directory) / (name + _suffix(export_format, compression))
+
+    if export_format == 'ndjson':
+        return NdjsonTableWriter(path, attributes, compression)
+    if export_format == 'parquet':
+        return ParquetTableWriter(path, attributes)
+    return JsonTableWriter(path, attributes)
+
+
+def iter_table_records(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Read back the records of a table file written by any of the writers.
+
+    NDJSON and Parquet files are streamed; a classic JSON file is loaded whole.
+    Parquet columns that held JSON-encoded values stay strings, and _extra is
+    merged back into each record.
+
+    Yields:
+        One record dict at a time
+    """
+    path = Path(path)
+    name = path.name
+
+    if name.endswith('.parquet'):
+        if not PARQUET_AVAILABLE:
+            raise ValueError("Reading parquet files needs the pyarrow package (pip install pyarrow)")
+        for batch in pyarrow.parquet.ParquetFile(str(path)).iter_batches():
+            for row in batch.to_pylist():
+                extra = row.pop(PARQUET_EXTRA_COLUMN, None)
+                if extra:
+                    row.update(json.loads(extra))
+                yield row
+        return
+
+    if '.ndjson' in name:
+        if name.endswith('.zst'):
+            if not ZSTD_AVAILABLE:
+                raise ValueError("Reading .zst files needs the zstandard package (pip install zstandard)")
+            f = zstandard.open(path, 'rb')
+        elif name.endswith('.gz'):
+            f = gzip.open(path, 'rb')
+        else:
+            f = open(path, 'rb')
+        with f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from json.load(f).get('records', [])
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Dataverse Incremental Backup State
+Keeps the change-tracking delta link of every table in a small SQLite database,
+together with the list of snapshot and delta files written for it, and restores
+a table by replaying its deltas over the last full snapshot.
+
+Usage:
+    python3 dataverse_incremental.py restore <backup_dir> <destination> [--table NAME ...]
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dataverse_export import iter_table_records
+
+logger = logging.getLogger(__name__)
+
+# State database kept in the backup directory (next to the timestamped backups)
+STATE_DB_NAME = 'dataverse_state.db'
+
+# A table gets a new full snapshot when its last one is older than this
+DEFAULT_FULL_SNAPSHOT_DAYS = 7
+
+
+def is_deleted_record(record: Dict[str, Any]) -> bool:
+    """True for a change-tracking deletion marker ({"@odata.context": ".../$deletedEntity", "id": ...})."""
+    return record.get('@odata.context', '').endswith('$deletedEntity') or (
+        record.get('reason') == 'deleted' and 'id' in record)
+
+
+def record_id(record: Dict[str, Any], primary_id: str) -> Optional[str]:
+    """Primary key of a record or deletion marker."""
+    if is_deleted_record(record):
+        return record.get('id')
+    return record.get(primary_id)
+
+
+class DataverseStateDB:
+    """Delta links and the snapshot/delta file chain of each table."""
+
+    def __init__(self, db_path: Path):
+        """
+        Initialize state database.
+
+        Args:
+            db_path: SQLite file; file paths inside it are relative to its directory
+        """
+        self.db_path = Path(db_path)
+        self.base_dir = self.db_path.parent
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        """Yield a short-lived connection inside a transaction (safe from any thread)."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        """Initialize database schema."""
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS table_state (
+                    logical_name TEXT PRIMARY KEY,
+                    entity_set_name TEXT,
+                    primary_id_attribute TEXT,
+                    delta_link TEXT,
+                    last_snapshot TIMESTAMP,
+                    last_sync TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS table_files (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    logical_name TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    created TIMESTAMP NOT NULL,
+                    record_count INTEGER DEFAULT 0,
+                    deleted_count INTEGER DEFAULT 0
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_table_files_name ON table_files(logical_name, id)')
+
+    def _relative(self, file_path: Path) -> str:
+        try:
+            return Path(file_path).resolve().relative_to(self.base_dir.resolve()).as_posix()
+        except ValueError:
+            return str(Path(file_path).resolve())
+
+    def get_table_state(self, logical_name: str) -> Optional[Dict[str, Any]]:
+        """Stored state of a table, or None if it was never backed up incrementally."""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM table_state WHERE logical_name = ?', (logical_name,)).fetchone()
+        return dict(row) if row else None
+
+    def needs_snapshot(self, logical_name: str, full_snapshot_days: float = DEFAULT_FULL_SNAPSHOT_DAYS) -> bool:
+        """
+        Check whether a table must be exported in full.
+
+        Returns:
+            True if there is no delta link, or the last snapshot is older than full_snapshot_days
+        """
+        state = self.get_table_state(logical_name)
+        if not state or not state['delta_link'] or not state['last_snapshot']:
+            return True
+        last_snapshot = datetime.fromisoformat(state['last_snapshot'])
+        return datetime.now() - last_snapshot >= timedelta(days=full_snapshot_days)
+
+    def record_snapshot(self, logical_name: str, entity_set_name: str, primary_id: Optional[str],
+                        file_path: Path, record_count: int, delta_link: Optional[str]):
+        """
+        Record a full export; it becomes the base for the following deltas.
+
+        Args:
+            delta_link: Link for the next delta, or None if the table has no change tracking
+        """
+        now = datetime.now().isoformat()
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT INTO table_state (logical_name, entity_set_name, primary_id_attribute,
+                                         delta_link, last_snapshot, last_sync)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(logical_name) DO UPDATE SET
+                    entity_set_name = excluded.entity_set_name,
+                    primary_id_attribute = excluded.primary_id_attribute,
+                    delta_link = excluded.delta_link,
+                    last_snapshot = excluded.last_snapshot,
+                    last_sync = excluded.last_sync
+            ''', (logical_name, entity_set_name, primary_id, delta_link, now, now))
+            conn.execute('''
+                INSERT INTO table_files (logical_name, kind, file_path, created, record_count)
+                VALUES (?, 'snapshot', ?, ?, ?)
+            ''', (logical_name, self._relative(file_path), now, record_count))
+
+    def record_delta(self, logical_name: str, file_path: Path, changed_count: int, deleted_count: int,
+                     delta_link: Optional[str]):
+        """Record a delta file and move the table's delta link forward."""
+        now = datetime.now().isoformat()
+        with self._connect() as conn:
+            conn.execute('UPDATE table_state SET delta_link = ?, last_sync = ? WHERE logical_name = ?',
+                         (delta_link, now, logical_name))
+            conn.execute('''
+                INSERT INTO table_files (logical_name, kind, file_path, created, record_count, deleted_count)
+                VALUES (?, 'delta', ?, ?, ?, ?)
+            ''', (logical_name, self._relative(file_path), now, changed_count, deleted_count))
+
+    def set_delta_link(self, logical_name: str, delta_link: Optional[str]):
+        """
+        Move a table's delta link forward without a delta file (no changes), or
+        clear it with None (e.g. expired), forcing a full snapshot next time.
+        """
+        with self._connect() as conn:
+            conn.execute('UPDATE table_state SET delta_link = ?, last_sync = ? WHERE logical_name = ?',
+                         (delta_link, datetime.now().isoformat(), logical_name))
+
+    def tables(self) -> List[str]:
+        """Logical names of all tables with at least one snapshot."""
+        with self._connect() as conn:
+            rows = conn.execute('''
+                SELECT DISTINCT logical_name FROM table_files WHERE kind = 'snapshot' ORDER BY logical_name
+            ''').fetchall()
+        return [row['logical_name'] for row in rows]
+
+    def restore_chain(self, logical_name: str) -> Tuple[Optional[Path], List[Path]]:
+        """
+        Files needed to rebuild the current state of a table.
+
+        Returns:
+            Tuple of (last snapshot file or None, delta files after it, oldest first)
+        """
+        with self._connect() as conn:
+            rows = conn.execute('''
+                SELECT kind, file_path FROM table_files
+                WHERE logical_name = ? AND id >= COALESCE(
+                    (SELECT MAX(id) FROM table_files WHERE logical_name = ? AND kind = 'snapshot'), 0)
+                ORDER BY id
+            ''', (logical_name, logical_name)).fetchall()
+
+        if not rows or rows[0]['kind'] != 'snapshot':
+            return None, []
+        paths = [self.base_dir / row['file_path'] for row in rows]
+        return paths[0], paths[1:]
+
+
+def merge_table(snapshot_path: Path, delta_paths: List[Path], primary_id: str) -> Iterator[Dict[str, Any]]:
+    """
+    Replay deltas over a snapshot.
+
+    Only the changed records of the deltas are held in memory; the snapshot is
+    streamed, so memory is bounded by the size of the changes, not the table.
+
+    Args:
+        snapshot_path: Full export of the table
+        delta_paths: Delta files written after it, oldest first
+        primary_id: Primary key attribute of the table
+
+    Yields:
+        Current records: unchanged snapshot records first, then new and updated ones
+    """
+    # id -> latest record, or None once deleted
+    changes: Dict[str, Optional[Dict[str, Any]]] = {}
+    for delta_path in delta_paths:
+        for record in iter_table_records(delta_path):
+            key = record_id(record, primary_id)
+            if key is None:
+                continue
+            changes[key] = None if is_deleted_record(record) else record
+
+    for record in iter_table_records(snapshot_path):
+        if record.get(primary_id) not in changes:
+            yield record
+
+    for record in changes.values():
+        if record is not None:
+            yield record
+
+
+def restore_tables(backup_dir: Path, destination: Path, tables: Optional[List[str]] = None) -> Tuple[int, int]:
+    """
+    Rebuild the current state of tables as NDJSON files (<destination>/<table>.ndjson).
+
+    Returns:
+        Tuple of (tables restored, tables that could not be restored)
+    """
+    state_db = DataverseStateDB(Path(backup_dir) / STATE_DB_NAME)
+    destination = Path(destination)
+    destination.mkdir(parents=True, exist_ok=True)
+
+    restored = 0
+    failed = 0
+    for logical_name in tables or state_db.tables():
+        state = state_db.get_table_state(logical_name)
+        snapshot_path, delta_paths = state_db.restore_chain(logical_name)
+        if state is None or snapshot_path is None:
+            logger.error(f"No snapshot recorded for table {logical_name}")
+            failed += 1
+            continue
+
+        missing = [p for p in [snapshot_path] + delta_paths if not p.is_file()]
+        if missing:
+            logger.error(f"Cannot restore {logical_name}, missing: {', '.join(str(p) for p in missing)}")
+            failed += 1
+            continue
+
+        out_path = destination / f"{logical_name}.ndjson"
+        count = 0
+        with open(out_path, 'w', encoding='utf-8') as f:
+            for record in merge_table(snapshot_path, delta_paths, state['primary_id_attribute']):
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str) + '\n')
+                count += 1
+
+        logger.info(f"Restored {logical_name}: {count:,} records from 1 snapshot and "
+                    f"{len(delta_paths)} deltas -> {out_path}")
+        restored += 1
+
+    return restored, failed
+
+
+def main():
+    """Command-line interface."""
+    parser = argparse.ArgumentParser(description='Restore Dataverse tables from incremental backups')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    restore_parser = subparsers.add_parser('restore', help='Merge the last snapshot of each table with its deltas')
+    restore_parser.add_argument('backup_dir', help=f'Backup directory containing {STATE_DB_NAME}')
+    restore_parser.add_argument('destination', help='Directory to write <table>.ndjson files into')
+    restore_parser.add_argument('--table', action='append', dest='tables',
+                                help='Restore only this table (logical name); can be repeated')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if not (Path(args.backup_dir) / STATE_DB_NAME).is_file():
+        logger.error(f"No {STATE_DB_NAME} in {args.backup_dir}")
+        sys.exit(1)
+
+    restored, failed = restore_tables(Path(args.backup_dir), Path(args.destination), args.tables)
+    logger.info(f"Restored {restored} tables" + (f", {failed} failed" if failed else ""))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
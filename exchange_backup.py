@@ -14,16 +14,14 @@ import sys
 import json
 import logging
 import hashlib
-import time
 import re
+import threading
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Dict, Any, List, Tuple
 from email.message import EmailMessage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 from email.header import decode_header
 import base64
 import mimetypes
@@ -34,7 +32,19 @@ from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 # Exchange checksum database
-from exchange_checksum_db import ExchangeChecksumDB, calculate_email_checksum, calculate_attachment_checksum
+from exchange_checksum_db import ExchangeChecksumDB, calculate_email_checksum
+
+# Concurrent mailbox scheduling and adaptive Graph rate limiting
+from mailbox_scheduler import MailboxScheduler, DEFAULT_PER_MAILBOX_CONCURRENCY, format_timeline
+from graph_throttle import get_graph_limiter
+from token_provider import get_token_provider, client_credentials_fetcher, GRAPH_SCOPE
+
+# Streaming EML output (attachments never held in memory)
+from streaming_eml import StreamingEmlWriter, StreamedAttachment, hash_stream, CHUNK_SIZE
+from ranged_download import iter_resumable, range_header
+
+# Attachments up to this size are embedded (base64) in JSON backups
+JSON_EMBED_LIMIT = 1024 * 1024
 
 # Configure logging
 logging.basicConfig(
@@ -78,9 +88,13 @@ class ExchangeBackup:
         # Graph API settings
         self.graph_endpoint = config.get('EXCHANGE_GRAPH_ENDPOINT', 'https://graph.microsoft.com/v1.0')
         self.batch_size = config.get('EXCHANGE_BATCH_SIZE', 20)
-        self.rate_limit_delay = config.get('EXCHANGE_RATE_LIMIT_DELAY', 1)
         self.max_retries = config.get('EXCHANGE_MAX_RETRIES', 3)
         
+        # Concurrency: mailboxes backed up in parallel, requests in flight per mailbox
+        self.max_concurrent_mailboxes = config.get('EXCHANGE_MAX_CONCURRENT_MAILBOXES', 4)
+        self.per_mailbox_concurrency = config.get('EXCHANGE_PER_MAILBOX_CONCURRENCY', DEFAULT_PER_MAILBOX_CONCURRENCY)
+        self.scheduler = MailboxScheduler(self.max_concurrent_mailboxes, self.per_mailbox_concurrency)
+        
         # Filtering
         self.filter_date_from = config.get('EXCHANGE_FILTER_DATE_FROM')
         self.filter_date_to = config.get('EXCHANGE_FILTER_DATE_TO')
@@ -102,8 +116,7 @@ class ExchangeBackup:
         self.max_attachment_size = None  # No size limit
         
         # Internal state
-        self.access_token = None
-        self.token_obtained_time = None
+        self.token_provider = None
         self.session = None
         self.backup_path = None
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -118,6 +131,10 @@ class ExchangeBackup:
             'end_time': None,
             'users_processed': 0
         }
+        self._stats_lock = threading.Lock()
+        
+        # Request pacing adapts to Graph throttling instead of sleeping a fixed delay
+        self.limiter = get_graph_limiter()
         
         # Checksum database
         self.checksum_db = ExchangeChecksumDB(self.checksum_db)
@@ -129,62 +146,46 @@ class ExchangeBackup:
         self._setup_backup_directory()
     
     def _setup_session(self):
-        """Setup HTTP session with retry logic."""
+        """Setup HTTP session with retry logic (429/503 are handled by the rate limiter)."""
         retry_strategy = Retry(
             total=self.max_retries,
             backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
+            status_forcelist=[500, 502, 504],
             allowed_methods=["GET", "POST"]
         )
         
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # Size the pool for all mailbox workers sharing this session
+        pool_size = max(10, self.max_concurrent_mailboxes * self.per_mailbox_concurrency)
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=pool_size, pool_maxsize=pool_size)
         self.session = requests.Session()
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
     
     def _authenticate(self):
-        """Authenticate with Azure AD to get access token."""
+        """Authenticate with Azure AD; the shared provider keeps the token fresh afterwards."""
         logger.info("Authenticating with Azure AD...")
         
-        token_url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
-        
-        token_data = {
-            'client_id': self.client_id,
-            'client_secret': self.client_secret,
-            'scope': 'https://graph.microsoft.com/.default',
-            'grant_type': 'client_credentials'
-        }
+        # Shared with every other Graph engine of this app in this process
+        self.token_provider = get_token_provider(
+            self.tenant_id, self.client_id, self.client_secret, GRAPH_SCOPE,
+            fetch=client_credentials_fetcher(self.tenant_id, self.client_id, self.client_secret,
+                                             GRAPH_SCOPE, session=self.session,
+                                             timeout=self.request_timeout),
+            name='Graph access token'
+        )
         
         try:
-            response = self.session.post(token_url, data=token_data, timeout=self.request_timeout)
-            response.raise_for_status()
-            
-            token_response = response.json()
-            self.access_token = token_response.get('access_token')
-            self.token_obtained_time = datetime.now()
-            
-            if not self.access_token:
-                raise ValueError("No access token received")
-            
+            self.token_provider.get_token()
             logger.info("Authentication successful")
             
         except Exception as e:
             logger.error(f"Authentication failed: {str(e)}")
             raise
     
-    def _refresh_token_if_needed(self):
-        """Refresh token if it's about to expire (older than 50 minutes)."""
-        if not self.token_obtained_time:
-            return
-        
-        current_time = datetime.now()
-        time_since_token = current_time - self.token_obtained_time
-        
-        # Refresh if token is older than 50 minutes (tokens typically expire in 60-90 minutes)
-        if time_since_token.total_seconds() > 3000:  # 50 minutes
-            logger.info("🔄 Refreshing access token...")
-            self._authenticate()
-            logger.info("✅ Token refreshed")
+    def _increment_stat(self, key: str, amount: int = 1):
+        """Thread-safe backup_stats update."""
+        with self._stats_lock:
+            self.backup_stats[key] += amount
     
     def _setup_backup_directory(self):
         """Create backup directory structure."""
@@ -213,26 +214,23 @@ class ExchangeBackup:
         """
         url = f"{self.graph_endpoint}{endpoint}"
         
-        # Refresh token if needed before making request
-        self._refresh_token_if_needed()
-        
+        token = self.token_provider.get_token()
         headers = {
-            'Authorization': f'Bearer {self.access_token}',
+            'Authorization': f'Bearer {token}',
             'Content-Type': 'application/json',
             'Accept': 'application/json'
         }
         
-        # Add rate limiting delay
-        time.sleep(self.rate_limit_delay)
-        
         try:
-            response = self.session.request(
-                method=method,
-                url=url,
-                headers=headers,
-                timeout=self.request_timeout,
-                **kwargs
-            )
+            with self.scheduler.mailbox_slot(endpoint):
+                response = self.limiter.send(
+                    self.session.request,
+                    method=method,
+                    url=url,
+                    headers=headers,
+                    timeout=self.request_timeout,
+                    **kwargs
+                )
             
             response.raise_for_status()
             
@@ -245,20 +243,19 @@ class ExchangeBackup:
             # If we get 401, try refreshing token once and retry
             if e.response is not None and e.response.status_code == 401:
                 logger.warning(f"Received 401 for {url}, attempting token refresh...")
-                self._authenticate()  # Force re-authentication
-                
-                # Update headers with new token
-                headers['Authorization'] = f'Bearer {self.access_token}'
+                # Only the first worker to see the rejected token fetches a new one
+                headers['Authorization'] = f'Bearer {self.token_provider.invalidate(token)}'
                 
                 # Retry the request
-                time.sleep(self.rate_limit_delay)
-                response = self.session.request(
-                    method=method,
-                    url=url,
-                    headers=headers,
-                    timeout=self.request_timeout,
-                    **kwargs
-                )
+                with self.scheduler.mailbox_slot(endpoint):
+                    response = self.limiter.send(
+                        self.session.request,
+                        method=method,
+                        url=url,
+                        headers=headers,
+                        timeout=self.request_timeout,
+                        **kwargs
+                    )
                 response.raise_for_status()
                 
                 if response.status_code == 204:  # No content
@@ -314,6 +311,11 @@ class ExchangeBackup:
         logger.info(f"Found {len(users)} users")
         return users
     
+    def _estimate_mailbox_size(self, user: Dict[str, Any]) -> int:
+        """Estimate mailbox size as the item count of its top-level folders (for scheduling)."""
+        response = self._make_graph_request(f"/users/{user.get('id')}/mailFolders?$select=totalItemCount&$top=250")
+        return sum(folder.get('totalItemCount', 0) for folder in response.get('value', []))
+    
     def _get_user_folders(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all mail folders for a user."""
         logger.debug(f"Fetching folders for user: {user_id}")
@@ -435,55 +437,57 @@ class ExchangeBackup:
         
         return attachments
     
-    def _download_attachment(self, user_id: str, attachment_id: str, message_id: str) -> Optional[bytes]:
-        """Download a specific attachment with automatic token refresh."""
+    def _open_attachment_stream(self, user_id: str, attachment_id: str, message_id: str,
+                                start: int = 0) -> requests.Response:
+        """
+        Start downloading an attachment (with automatic token refresh) without reading its body.
+        
+        Args:
+            start: First byte to request (resuming an interrupted download)
+        
+        Returns:
+            Streaming response (caller iterates and closes it). Its status is
+            checked by iter_resumable, so a 416 on resume ends the download and
+            transport errors propagate to be retried there.
+        """
         endpoint = f"/users/{user_id}/messages/{message_id}/attachments/{attachment_id}/$value"
         url = f"{self.graph_endpoint}{endpoint}"
         
-        # Refresh token if needed before making request
-        self._refresh_token_if_needed()
-        
+        token = self.token_provider.get_token()
         headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Accept': 'application/octet-stream'
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/octet-stream',
+            **range_header(start)
         }
         
-        try:
-            response = self.session.get(
+        with self.scheduler.mailbox_slot(endpoint):
+            response = self.limiter.send(
+                self.session.get,
                 url,
                 headers=headers,
-                timeout=self.request_timeout
+                timeout=self.request_timeout,
+                stream=True
             )
-            response.raise_for_status()
-            
-            return response.content
+        
+        # If we get 401, try refreshing token once and retry
+        if response.status_code == 401:
+            logger.warning(f"Received 401 for attachment download, attempting token refresh...")
+            # Release the pooled connection of the rejected response first
+            response.close()
+            # Only the first worker to see the rejected token fetches a new one
+            headers['Authorization'] = f'Bearer {self.token_provider.invalidate(token)}'
             
-        except requests.exceptions.HTTPError as e:
-            # If we get 401, try refreshing token once and retry
-            if e.response is not None and e.response.status_code == 401:
-                logger.warning(f"Received 401 for attachment download, attempting token refresh...")
-                self._authenticate()  # Force re-authentication
-                
-                # Update headers with new token
-                headers['Authorization'] = f'Bearer {self.access_token}'
-                
-                # Retry the request
-                response = self.session.get(
+            # Retry the request
+            with self.scheduler.mailbox_slot(endpoint):
+                response = self.limiter.send(
+                    self.session.get,
                     url,
                     headers=headers,
-                    timeout=self.request_timeout
+                    timeout=self.request_timeout,
+                    stream=True
                 )
-                response.raise_for_status()
-                
-                return response.content
-            else:
-                # Re-raise other HTTP errors
-                logger.error(f"Failed to download attachment {attachment_id}: {str(e)}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Failed to download attachment {attachment_id}: {str(e)}")
-            return None
+        
+        return response
     
     def _calculate_checksum(self, message: Dict[str, Any]) -> str:
         """Calculate checksum for a message to detect changes."""
@@ -552,9 +556,56 @@ class ExchangeBackup:
         
         return user_id
     
-    def _create_eml_file(self, message: Dict[str, Any], attachments: List[Dict[str, Any]], 
-                        attachment_data: Dict[str, bytes], file_path: Path):
-        """Create EML file from message data."""
+    def _stream_attachment(self, user_id: str, message_id: str, attachment: Dict[str, Any],
+                           writer: Optional[StreamingEmlWriter], capture_limit: int) -> Optional[StreamedAttachment]:
+        """
+        Download one attachment, streaming it into the EML writer (or only hashing it).
+        
+        Returns:
+            StreamedAttachment, or None if the download failed
+        """
+        attachment_id = attachment.get('id')
+        attachment_name = attachment.get('name', f'attachment_{attachment_id}')
+        
+        # Reconnects with a Range header if the connection drops mid-attachment
+        chunks = iter_resumable(
+            lambda start, end: self._open_attachment_stream(user_id, attachment_id, message_id, start),
+            chunk_size=CHUNK_SIZE
+        )
+        
+        try:
+            if writer is not None:
+                result = writer.add_attachment(
+                    attachment_name, attachment.get('contentType', 'application/octet-stream'),
+                    chunks, capture_limit=capture_limit
+                )
+            else:
+                result = hash_stream(chunks, capture_limit=capture_limit)
+        except Exception as e:
+            logger.warning(f"Failed to download attachment: {attachment_name} ({str(e)})")
+            return None
+        finally:
+            chunks.close()
+        
+        self._increment_stat('attachments_downloaded')
+        logger.debug(f"Downloaded attachment: {attachment_name} ({result.size} bytes)")
+        return result
+    
+    def _create_eml_file(self, user_id: str, message: Dict[str, Any], attachments: List[Dict[str, Any]],
+                        file_path: Path, capture_limit: int = 0) -> Dict[str, StreamedAttachment]:
+        """
+        Create EML file from message data, streaming attachments straight to disk.
+        
+        Args:
+            user_id: User ID (for attachment downloads)
+            message: Graph message
+            attachments: Attachment metadata to download and include
+            file_path: EML path
+            capture_limit: Keep attachment content in memory up to this size (for JSON embedding)
+            
+        Returns:
+            Streamed attachment results by attachment ID
+        """
         # ALWAYS use MIMEMultipart - it's the most robust and can handle all cases
         # This ensures we never get "set_content not valid on multipart" errors
         eml = MIMEMultipart()
@@ -566,38 +617,22 @@ class ExchangeBackup:
         body_content = message.get('body', {}).get('content', '')
         body_type = message.get('body', {}).get('contentType', 'text')
         
-        # Always add body as a MIMEText part
-        if body_type == 'html':
-            body_part = MIMEText(body_content, 'html', 'utf-8')
-        else:
-            body_part = MIMEText(body_content, 'plain', 'utf-8')
-        eml.attach(body_part)
+        results: Dict[str, StreamedAttachment] = {}
         
-        # Add attachments if any
-        for attachment in attachments:
-            attachment_id = attachment.get('id')
-            if attachment_id in attachment_data:
-                content = attachment_data[attachment_id]
-                filename = attachment.get('name', f'attachment_{attachment_id}')
-                content_type = attachment.get('contentType', 'application/octet-stream')
-                
-                # Create attachment part
-                maintype, subtype = content_type.split('/', 1) if '/' in content_type else (content_type, '')
-                if not subtype:
-                    subtype = 'octet-stream'
-                
-                attachment_part = MIMEBase(maintype, subtype)
-                attachment_part.set_payload(content)
-                attachment_part.add_header('Content-Disposition', 'attachment', filename=filename)
-                
-                # Encode the attachment
-                encoders.encode_base64(attachment_part)
-                
-                eml.attach(attachment_part)
+        with StreamingEmlWriter(file_path, eml) as writer:
+            # Always add body as a MIMEText part
+            if body_type == 'html':
+                writer.write_body(MIMEText(body_content, 'html', 'utf-8'))
+            else:
+                writer.write_body(MIMEText(body_content, 'plain', 'utf-8'))
+            
+            # Add attachments if any; each is streamed from the HTTP response into the file
+            for attachment in attachments:
+                result = self._stream_attachment(user_id, message.get('id'), attachment, writer, capture_limit)
+                if result is not None:
+                    results[attachment.get('id')] = result
         
-        # Write EML file
-        with open(file_path, 'wb') as f:
-            f.write(eml.as_bytes())
+        return results
     
     def _set_email_headers(self, eml, message: Dict[str, Any]):
         """Set email headers, handling duplicates from internetMessageHeaders."""
@@ -647,7 +682,7 @@ class ExchangeBackup:
         return ', '.join(filter(None, formatted))
     
     def _create_json_file(self, message: Dict[str, Any], attachments: List[Dict[str, Any]], 
-                         attachment_data: Dict[str, bytes], file_path: Path):
+                         attachment_data: Dict[str, StreamedAttachment], file_path: Path):
         """Create JSON file from message data."""
         # Prepare message data for JSON
         json_data = {
@@ -683,8 +718,8 @@ class ExchangeBackup:
             # Include attachment content if small enough
             attachment_id = attachment.get('id')
             if attachment_id in attachment_data:
-                content = attachment_data[attachment_id]
-                if len(content) <= 1024 * 1024:  # 1MB limit for embedding
+                content = attachment_data[attachment_id].content
+                if content is not None:  # Only kept up to JSON_EMBED_LIMIT
                     attachment_info['content'] = base64.b64encode(content).decode('utf-8')
                 else:
                     attachment_info['content'] = 'TOO_LARGE_TO_EMBED'
@@ -695,8 +730,13 @@ class ExchangeBackup:
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(json_data, f, indent=2, ensure_ascii=False)
     
-    def _backup_user_messages(self, user: Dict[str, Any]):
-        """Backup all messages for a single user."""
+    def _backup_user_messages(self, user: Dict[str, Any]) -> Dict[str, int]:
+        """
+        Backup all messages for a single user.
+        
+        Returns:
+            Per-user counters for the backup timeline
+        """
         user_id = user.get('id')
         user_email = user.get('userPrincipalName', user.get('mail', 'Unknown'))
         
@@ -710,6 +750,9 @@ class ExchangeBackup:
         if self.preserve_folders:
             user_backup_path.mkdir(parents=True, exist_ok=True)
         
+        messages_seen = 0
+        errors = 0
+        
         # Process each folder
         for folder in folders:
             folder_id = folder.get('id')
@@ -730,17 +773,21 @@ class ExchangeBackup:
             
             # Process each message - NO LIMITS for backup tool
             for message in messages:
-                self.backup_stats['total_emails'] += 1
+                self._increment_stat('total_emails')
+                messages_seen += 1
                 
                 try:
                     self._backup_single_message(user_id, user_email, message, folder_path)
-                    self.backup_stats['backed_up_emails'] += 1
+                    self._increment_stat('backed_up_emails')
                     
                 except Exception as e:
                     logger.error(f"Failed to backup message {message.get('id')}: {str(e)}")
-                    self.backup_stats['errors'] += 1
+                    self._increment_stat('errors')
+                    errors += 1
+        
+        self._increment_stat('users_processed')
         
-        self.backup_stats['users_processed'] += 1
+        return {'messages': messages_seen, 'errors': errors}
     
     def _backup_single_message(self, user_id: str, user_email: str, message: Dict[str, Any], folder_path: Path):
         """Backup a single email message."""
@@ -752,7 +799,7 @@ class ExchangeBackup:
         
         if not should_backup:
             logger.debug(f"Skipping already backed up message: {subject}")
-            self.backup_stats['skipped_emails'] += 1
+            self._increment_stat('skipped_emails')
             return
         
         # Sanitize filename
@@ -764,26 +811,15 @@ class ExchangeBackup:
         safe_message_id = re.sub(r'[<>:"/\\|?*=+]', '_', message_id)
         safe_message_id = safe_message_id[:50]  # Limit length
         
-        # Get attachments if needed
+        # Get attachment list if needed (no size limit - backup ALL attachments)
         attachments = []
-        attachment_data = {}
+        attachment_data: Dict[str, StreamedAttachment] = {}
         
         if self.include_attachments and message.get('hasAttachments', False):
             attachments = self._get_message_attachments(user_id, message_id)
-            
-            for attachment in attachments:
-                attachment_id = attachment.get('id')
-                attachment_name = attachment.get('name', f'attachment_{attachment_id}')
-                attachment_size = attachment.get('size', 0)
-                
-                # Download attachment (no size limit - backup ALL attachments)
-                content = self._download_attachment(user_id, attachment_id, message_id)
-                if content:
-                    attachment_data[attachment_id] = content
-                    self.backup_stats['attachments_downloaded'] += 1
-                    logger.debug(f"Downloaded attachment: {attachment_name} ({attachment_size} bytes)")
-                else:
-                    logger.warning(f"Failed to download attachment: {attachment_name}")
+        
+        # JSON backups embed small attachments, so keep those in memory while streaming
+        capture_limit = JSON_EMBED_LIMIT if self.backup_format in ['json', 'both'] else 0
         
         # Create backup files based on format
         # IMPORTANT: Don't use with_suffix() as it removes the message_id if it contains dots
@@ -791,9 +827,15 @@ class ExchangeBackup:
         base_filename_str = f"{safe_subject}_{safe_message_id}"
         
         if self.backup_format in ['eml', 'both']:
+            # Attachments are downloaded while the EML file is written
             eml_file = folder_path / f"{base_filename_str}.eml"
-            self._create_eml_file(message, attachments, attachment_data, eml_file)
+            attachment_data = self._create_eml_file(user_id, message, attachments, eml_file, capture_limit)
             logger.debug(f"Created EML file: {eml_file.name}")
+        else:
+            for attachment in attachments:
+                result = self._stream_attachment(user_id, message_id, attachment, None, capture_limit)
+                if result is not None:
+                    attachment_data[attachment.get('id')] = result
         
         if self.backup_format in ['json', 'both']:
             json_file = folder_path / f"{base_filename_str}.json"
@@ -805,8 +847,8 @@ class ExchangeBackup:
         
         # Calculate total message size
         message_size = len(json.dumps(message, default=str).encode('utf-8'))
-        for content in attachment_data.values():
-            message_size += len(content)
+        for result in attachment_data.values():
+            message_size += result.size
         
         # Update email record in database
         email_id = self.checksum_db.update_email_record(
@@ -830,15 +872,13 @@ class ExchangeBackup:
             for attachment in attachments:
                 attachment_id = attachment.get('id')
                 if attachment_id in attachment_data:
-                    content = attachment_data[attachment_id]
-                    attachment_checksum = calculate_attachment_checksum(content)
-                    
+                    # SHA-256 computed while streaming (same as calculate_attachment_checksum)
                     self.checksum_db.update_attachment_record(
                         email_id=email_id,
                         attachment_id=attachment_id,
                         attachment_name=attachment.get('name', f'attachment_{attachment_id}'),
                         attachment_size=attachment.get('size', 0),
-                        checksum=attachment_checksum
+                        checksum=attachment_data[attachment_id].sha256
                     )
         
         # Log with username/email address instead of UUID
@@ -864,13 +904,21 @@ class ExchangeBackup:
                 logger.error("No users found to backup")
                 return
             
-            # Backup each user
-            for user in users:
+            # Backup users concurrently, largest mailboxes first
+            logger.info(f"Backing up {self.scheduler.max_mailboxes} mailboxes in parallel "
+                        f"(max {self.per_mailbox_concurrency} concurrent requests per mailbox)")
+            
+            def backup_user(user: Dict[str, Any]) -> Dict[str, int]:
                 try:
-                    self._backup_user_messages(user)
+                    return self._backup_user_messages(user)
                 except Exception as e:
                     logger.error(f"Failed to backup user {user.get('userPrincipalName')}: {str(e)}")
-                    self.backup_stats['errors'] += 1
+                    self._increment_stat('errors')
+                    raise
+            
+            self.backup_stats['user_timeline'] = self.scheduler.run(
+                users, backup_user, self._estimate_mailbox_size
+            )
             
             # Finalize backup
             self._finalize_backup()
@@ -907,6 +955,13 @@ class ExchangeBackup:
         logger.info(f"Errors: {self.backup_stats['errors']}")
         logger.info(f"Duration: {duration}")
         logger.info(f"Backup location: {self.backup_path.absolute()}")
+        
+        if self.backup_stats.get('user_timeline'):
+            logger.info("-" * 80)
+            logger.info("Per-user timeline:")
+            for line in format_timeline(self.backup_stats['user_timeline']):
+                logger.info(f"  {line}")
+        
         logger.info("=" * 80)
 
 
@@ -932,8 +987,9 @@ def load_config() -> Dict[str, Any]:
     # Graph API settings
     config['EXCHANGE_GRAPH_ENDPOINT'] = os.environ.get('EXCHANGE_GRAPH_ENDPOINT', 'https://graph.microsoft.com/v1.0')
     config['EXCHANGE_BATCH_SIZE'] = int(os.environ.get('EXCHANGE_BATCH_SIZE', '20'))
-    config['EXCHANGE_RATE_LIMIT_DELAY'] = float(os.environ.get('EXCHANGE_RATE_LIMIT_DELAY', '1'))
     config['EXCHANGE_MAX_RETRIES'] = int(os.environ.get('EXCHANGE_MAX_RETRIES', '3'))
+    config['EXCHANGE_MAX_CONCURRENT_MAILBOXES'] = int(os.environ.get('EXCHANGE_MAX_CONCURRENT_MAILBOXES', '4'))
+    config['EXCHANGE_PER_MAILBOX_CONCURRENCY'] = int(os.environ.get('EXCHANGE_PER_MAILBOX_CONCURRENCY', '4'))
     
     # Filtering
     config['EXCHANGE_FILTER_DATE_FROM'] = os.environ.get('EXCHANGE_FILTER_DATE_FROM')
@@ -30,9 +30,12 @@ class ExchangeChecksumDB:
     
     def _init_db(self):
         """Initialize database schema for Exchange backups."""
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
             cursor = conn.cursor()
             
+            # WAL lets concurrent mailbox workers read while another one writes
+            cursor.execute('PRAGMA journal_mode=WAL')
+            
             # Create email_messages table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS email_messages (
@@ -101,6 +104,17 @@ class ExchangeChecksumDB:
                 )
             ''')
             
+            # Create folder_delta_links table for Graph message delta state per mail folder
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS folder_delta_links (
+                    user_id TEXT NOT NULL,
+                    folder_id TEXT NOT NULL,
+                    delta_link TEXT NOT NULL,
+                    updated_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, folder_id)
+                )
+            ''')
+            
             # Create indexes for performance
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_message ON email_messages (user_id, message_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_email_checksum ON email_messages (checksum_sha256)')
@@ -122,7 +136,7 @@ class ExchangeChecksumDB:
         Returns:
             Dictionary with email record or None if not found
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -146,7 +160,7 @@ class ExchangeChecksumDB:
         Returns:
             List of email records
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -185,7 +199,7 @@ class ExchangeChecksumDB:
         Returns:
             Email ID in database
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
             cursor = conn.cursor()
             
             # Check if email exists
@@ -253,7 +267,7 @@ class ExchangeChecksumDB:
         Returns:
             Attachment record ID
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
             cursor = conn.cursor()
             
             # Check if attachment exists
@@ -312,6 +326,68 @@ class ExchangeChecksumDB:
         # Email unchanged
         return True, record
     
+    def get_folder_delta_link(self, user_id: str, folder_id: str) -> Optional[str]:
+        """
+        Get the stored Graph message delta link for a mail folder.
+        
+        Args:
+            user_id: User ID or email address
+            folder_id: Mail folder ID
+            
+        Returns:
+            The @odata.deltaLink from the last completed folder sync, or None
+        """
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT delta_link FROM folder_delta_links 
+                WHERE user_id = ? AND folder_id = ?
+            ''', (user_id, folder_id))
+            
+            row = cursor.fetchone()
+            return row[0] if row else None
+    
+    def save_folder_delta_link(self, user_id: str, folder_id: str, delta_link: str):
+        """
+        Store the Graph message delta link for a mail folder, replacing any previous one.
+        
+        Args:
+            user_id: User ID or email address
+            folder_id: Mail folder ID
+            delta_link: @odata.deltaLink returned by the last delta page
+        """
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT OR REPLACE INTO folder_delta_links 
+                (user_id, folder_id, delta_link, updated_timestamp)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (user_id, folder_id, delta_link))
+            
+            conn.commit()
+            logger.debug(f"Saved delta link for folder {folder_id}")
+    
+    def clear_folder_delta_link(self, user_id: str, folder_id: str):
+        """
+        Remove the stored delta link for a mail folder (e.g. after the sync state expired).
+        
+        Args:
+            user_id: User ID or email address
+            folder_id: Mail folder ID
+        """
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                DELETE FROM folder_delta_links 
+                WHERE user_id = ? AND folder_id = ?
+            ''', (user_id, folder_id))
+            
+            conn.commit()
+            logger.debug(f"Cleared delta link for folder {folder_id}")
+    
     def start_exchange_backup_session(self, backup_type: str, user_id: str = None) -> int:
         """
         Start a new Exchange backup session and return session ID.
@@ -323,7 +399,7 @@ class ExchangeChecksumDB:
         Returns:
             Backup session ID
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -352,7 +428,7 @@ class ExchangeChecksumDB:
             status: 'completed', 'failed', or 'partial'
             error_message: Error message if failed
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -384,7 +460,7 @@ class ExchangeChecksumDB:
         Returns:
             Dictionary with backup statistics
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -450,7 +526,7 @@ class ExchangeChecksumDB:
         Returns:
             Dictionary with user backup summary
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -499,7 +575,7 @@ class ExchangeChecksumDB:
         Args:
             keep_days: Keep records newer than this many days
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
             cursor = conn.cursor()
             
             # Count records to be deleted
@@ -542,7 +618,7 @@ class ExchangeChecksumDB:
             'exchange_backup_history': []
         }
         
-        with sqlite3.connect(self.db_path) as conn:
+        with sqlite3.connect(self.db_path, timeout=30) as conn:
             conn.row_factory = sqlite3.Row
             
             # Export email_messages
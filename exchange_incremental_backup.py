@@ -81,8 +81,9 @@ def create_config_from_args(args):
     # Graph API settings
     config['EXCHANGE_GRAPH_ENDPOINT'] = 'https://graph.microsoft.com/v1.0'
     config['EXCHANGE_BATCH_SIZE'] = 100
-    config['EXCHANGE_RATE_LIMIT_DELAY'] = 0.5
     config['EXCHANGE_MAX_RETRIES'] = 3
+    config['EXCHANGE_MAX_CONCURRENT_MAILBOXES'] = args.mailboxes
+    config['EXCHANGE_PER_MAILBOX_CONCURRENCY'] = args.per_mailbox
     
     # Filtering (none by default)
     config['EXCHANGE_FILTER_DATE_FROM'] = None
@@ -213,6 +214,12 @@ def main():
     parser.add_argument('--format', choices=['eml', 'json', 'both'], default='both',
                        help='Backup format: eml, json, or both (default: both)')
     
+    parser.add_argument('--mailboxes', type=int, default=4,
+                       help='Mailboxes backed up in parallel (default: 4)')
+    
+    parser.add_argument('--per-mailbox', type=int, default=4,
+                       help='Concurrent requests per mailbox (default: 4)')
+    
     parser.add_argument('--stats', action='store_true',
                        help='Show backup statistics')
     
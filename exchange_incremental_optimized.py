@@ -10,29 +10,48 @@ import sys
 import json
 import argparse
 import hashlib
+import threading
 import requests
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Set
+from typing import List, Dict, Any, Optional, Set, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
 
 from loguru import logger
 from exchange_checksum_db import ExchangeChecksumDB
+from graph_batch import GraphBatchClient, batch_body
+from graph_throttle import get_graph_limiter
+from token_provider import get_token_provider, GRAPH_SCOPE
+from mailbox_scheduler import MailboxScheduler, DEFAULT_PER_MAILBOX_CONCURRENCY, format_timeline
+from streaming_eml import StreamingEmlWriter, StreamedAttachment, CHUNK_SIZE
+from ranged_download import iter_resumable, range_header
 
-# Configure logging
-logger.remove()
-logger.level("INFO", color="<green>", icon="ℹ️")
-logger.level("SUCCESS", color="<bold><green>", icon="✅")
-logger.level("WARNING", color="<yellow>", icon="⚠️")
-logger.level("ERROR", color="<red>", icon="❌")
 
-logger.add(
-    sys.stdout,
-    format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>",
-    level="INFO",
-    colorize=True
-)
+def configure_logging(level: str = "INFO"):
+    """
+    Replace loguru's sinks with this script's console output.
+
+    Called from main() rather than at import, so importing the engine (e.g. from
+    backup_orchestrator) leaves the caller's sinks alone.
+    """
+    logger.remove()
+    logger.level("INFO", color="<green>", icon="ℹ️")
+    logger.level("SUCCESS", color="<bold><green>", icon="✅")
+    logger.level("WARNING", color="<yellow>", icon="⚠️")
+    logger.level("ERROR", color="<red>", icon="❌")
+
+    logger.add(
+        sys.stdout,
+        format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>",
+        level=level,
+        colorize=True
+    )
+
+
+class DeltaTokenExpired(Exception):
+    """Raised when Graph rejects a stored message delta link (sync state expired)."""
 
 
 @dataclass
@@ -83,7 +102,10 @@ class OptimizedExchangeBackup:
     """Optimized Exchange backup using message ID tracking (no checksums needed)."""
     
     def __init__(self, client_id: str, client_secret: str, tenant_id: str, 
-                 backup_dir: str = None, db_path: str = "backup_checksums_exchange.db"):
+                 backup_dir: str = None, db_path: str = "backup_checksums_exchange.db",
+                 use_delta: bool = True, max_mailboxes: int = 4,
+                 per_mailbox_concurrency: int = DEFAULT_PER_MAILBOX_CONCURRENCY,
+                 session: Optional[requests.Session] = None):
         """
         Initialize optimized Exchange backup client.
         
@@ -93,10 +115,20 @@ class OptimizedExchangeBackup:
             tenant_id: Azure AD Tenant ID
             backup_dir: Backup directory (defaults to EXCHANGE_BACKUP_DIR or "backup/exchange")
             db_path: Path to checksum database
+            use_delta: Use Graph message delta queries per folder for incremental runs
+            max_mailboxes: Mailboxes backed up in parallel
+            per_mailbox_concurrency: Folders and in-flight Graph requests per mailbox
+            session: HTTP session shared with other engines (e.g. by backup_orchestrator.py);
+                     by default the engine creates its own
         """
         self.client_id = client_id
         self.client_secret = client_secret
         self.tenant_id = tenant_id
+        self.use_delta = use_delta
+        self.per_mailbox_concurrency = max(1, per_mailbox_concurrency)
+        self.scheduler = MailboxScheduler(max_mailboxes, self.per_mailbox_concurrency)
+        
+        self._stats_lock = threading.Lock()
         
         # Determine backup directory
         if backup_dir:
@@ -112,15 +144,30 @@ class OptimizedExchangeBackup:
         
         self.db = ExchangeChecksumDB(db_path)
         
-        self.access_token = self._get_access_token()
-        self.token_obtained_time = datetime.now()
+        # Shared with every other Graph engine of this app in this process
+        self.token_provider = get_token_provider(self.tenant_id, self.client_id, self.client_secret,
+                                                 GRAPH_SCOPE, name='Graph access token')
+        self.token_provider.get_token()
         self.headers = {
-            'Authorization': f'Bearer {self.access_token}',
             'Content-Type': 'application/json'
         }
         
-        self.session = requests.Session()
+        # One connection pool shared by every mailbox worker
+        if session is not None:
+            self.session = session
+        else:
+            self.session = requests.Session()
+            pool_size = max(10, max_mailboxes * self.per_mailbox_concurrency)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount("https://", adapter)
+        
+        # Adaptive rate limiting shared with every other Graph client in this process
+        self.limiter = get_graph_limiter()
+        
+        # Message bodies and attachment lists are fetched 20 per round trip
+        self.batch_client = GraphBatchClient(self._make_graph_request, limiter=self.limiter)
         
+        self.timeline: List[Dict[str, Any]] = []
         self.stats = {
             'emails_backed_up': 0,
             'emails_skipped': 0,
@@ -136,48 +183,42 @@ class OptimizedExchangeBackup:
         logger.info(f"Backup directory: {self.backup_dir}")
         logger.info(f"Database: {db_path}")
     
-    def _get_access_token(self) -> str:
-        """Get Microsoft Graph access token."""
-        token_url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
-        token_data = {
-            'grant_type': 'client_credentials',
-            'client_id': self.client_id,
-            'client_secret': self.client_secret,
-            'scope': 'https://graph.microsoft.com/.default'
-        }
-        
-        response = requests.post(token_url, data=token_data, timeout=30)
-        response.raise_for_status()
-        return response.json()['access_token']
-    
-    def _refresh_token_if_needed(self):
-        """Refresh token if needed."""
-        current_time = datetime.now()
-        if (current_time - self.token_obtained_time).total_seconds() > 3000:
-            logger.info("Refreshing access token...")
-            self.access_token = self._get_access_token()
-            self.token_obtained_time = datetime.now()
-            self.headers['Authorization'] = f'Bearer {self.access_token}'
+    def _increment_stat(self, key: str, amount: int = 1):
+        """Thread-safe stats update."""
+        with self._stats_lock:
+            self.stats[key] += amount
     
-    def _make_graph_request(self, url: str, method: str = 'GET', **kwargs):
-        """Make Graph API request with token refresh."""
-        self._refresh_token_if_needed()
+    def _make_graph_request(self, url: str, method: str = 'GET', mailbox: Optional[str] = None, **kwargs):
+        """
+        Make Graph API request with token refresh.
         
-        headers = {**self.headers, **kwargs.pop('headers', {})}
+        Args:
+            mailbox: Mailbox whose request slot the request takes; found in the URL if not given
+        """
+        token = self.token_provider.get_token()
+        headers = {**self.headers, 'Authorization': f'Bearer {token}', **kwargs.pop('headers', {})}
         
-        response = self.session.request(method, url, headers=headers, **kwargs)
+        with self.scheduler.mailbox_slot(url, mailbox=mailbox):
+            response = self.limiter.send(self.session.request, method, url, headers=headers, **kwargs)
         
-        if response.status_code == 401:
-            logger.warning("Token expired, refreshing...")
-            self.access_token = self._get_access_token()
-            self.token_obtained_time = datetime.now()
-            self.headers['Authorization'] = f'Bearer {self.access_token}'
-            headers['Authorization'] = f'Bearer {self.access_token}'
-            response = self.session.request(method, url, headers=headers, **kwargs)
+            if response.status_code == 401:
+                # Release the connection of a streamed response, then retry.
+                # Coalesced: only the first worker to see the rejected token fetches a new one
+                response.close()
+                headers['Authorization'] = f'Bearer {self.token_provider.invalidate(token)}'
+                response = self.limiter.send(self.session.request, method, url, headers=headers, **kwargs)
         
         return response
     
-    def _get_users(self) -> List[Dict[str, Any]]:
+    def estimate_mailbox_size(self, user: Dict[str, Any]) -> int:
+        """Estimate mailbox size as the item count of its top-level folders (for scheduling)."""
+        endpoint = f"https://graph.microsoft.com/v1.0/users/{user.get('id')}/mailFolders"
+        response = self._make_graph_request(endpoint, params={'$select': 'totalItemCount', '$top': 250})
+        if response.status_code != 200:
+            return 0
+        return sum(folder.get('totalItemCount', 0) for folder in response.json().get('value', []))
+    
+    def get_users(self) -> List[Dict[str, Any]]:
         """Get list of users to backup."""
         logger.info("Fetching users...")
         
@@ -307,6 +348,73 @@ class OptimizedExchangeBackup:
             logger.error(f"Could not get message IDs from folder {folder_id}: {str(e)}")
             return set()
     
+    def _get_folder_message_delta(self, user_id: str, folder_id: str,
+                                  delta_link: str = None) -> Tuple[Set[str], Set[str], str]:
+        """
+        Get message IDs added or changed in a folder via the Graph message delta API.
+        
+        Without a delta link this is a full sync of the folder (every message ID)
+        that also yields the first delta link.
+        
+        Args:
+            user_id: User ID
+            folder_id: Folder ID
+            delta_link: @odata.deltaLink saved by a previous run, or None
+            
+        Returns:
+            Tuple of (added/changed message IDs, removed message IDs, new delta link)
+            
+        Raises:
+            DeltaTokenExpired: If Graph no longer accepts the delta link
+        """
+        import urllib.parse
+        
+        if delta_link:
+            endpoint = delta_link
+            params = {}
+        else:
+            encoded_folder_id = urllib.parse.quote(folder_id, safe='')
+            endpoint = f"https://graph.microsoft.com/v1.0/users/{user_id}/mailFolders/{encoded_folder_id}/messages/delta"
+            params = {'$select': 'id'}
+        
+        message_ids: Set[str] = set()
+        removed_ids: Set[str] = set()
+        new_delta_link = None
+        
+        while endpoint:
+            response = self._make_graph_request(
+                endpoint, params=params, headers={'Prefer': 'odata.maxpagesize=200'}
+            )
+            
+            if response.status_code == 410 or (
+                    response.status_code == 400 and 'SyncState' in response.text):
+                raise DeltaTokenExpired(f"Delta token expired for folder {folder_id}")
+            if response.status_code != 200:
+                raise Exception(f"Message delta query failed: {response.status_code}")
+            
+            data = response.json()
+            
+            # The same message can appear on several pages; the last occurrence wins
+            for msg in data.get('value', []):
+                msg_id = msg.get('id')
+                if not msg_id:
+                    continue
+                if '@removed' in msg:
+                    message_ids.discard(msg_id)
+                    removed_ids.add(msg_id)
+                else:
+                    removed_ids.discard(msg_id)
+                    message_ids.add(msg_id)
+            
+            new_delta_link = data.get('@odata.deltaLink', new_delta_link)
+            endpoint = data.get('@odata.nextLink')
+            params = {}  # Next/delta links include all params
+        
+        if not new_delta_link:
+            raise Exception(f"Message delta query for folder {folder_id} returned no deltaLink")
+        
+        return message_ids, removed_ids, new_delta_link
+    
     def _get_email_batch_data(self, user_id: str, folder_id: str, message_ids: Set[str]) -> List[Dict[str, Any]]:
         """
         Get full email data for specific message IDs.
@@ -323,46 +431,27 @@ class OptimizedExchangeBackup:
         if not message_ids:
             return []
         
-        messages = []
-        # We need to fetch emails in batches since Graph API doesn't support bulk by ID
-        
-        # URL encode the folder ID
         import urllib.parse
-        encoded_folder_id = urllib.parse.quote(folder_id, safe='')
         
-        # Fetch in smaller batches to avoid timeouts
-        batch_size = 50
-        message_id_list = list(message_ids)
+        select = ('id,subject,from,toRecipients,ccRecipients,bccRecipients,receivedDateTime,'
+                  'sentDateTime,hasAttachments,isRead,importance,body,internetMessageHeaders')
         
-        for i in range(0, len(message_id_list), batch_size):
-            batch_ids = message_id_list[i:i + batch_size]
-            
-            # For each message ID, we need to fetch individually or use filter
-            # Graph API doesn't support bulk fetch by multiple IDs easily
-            # We'll fetch them one by one but in parallel could be optimized
-            
-            for message_id in batch_ids:
-                try:
-                    # Fetch individual email with full data
-                    endpoint = f"https://graph.microsoft.com/v1.0/users/{user_id}/messages/{urllib.parse.quote(message_id, safe='')}"
-                    params = {
-                        '$select': 'id,subject,from,toRecipients,ccRecipients,bccRecipients,receivedDateTime,'
-                                  'sentDateTime,hasAttachments,isRead,importance,body,internetMessageHeaders'
-                    }
-                    
-                    response = self._make_graph_request(endpoint, params=params)
-                    if response.status_code == 200:
-                        messages.append(response.json())
-                    else:
-                        logger.warning(f"Failed to fetch email {message_id}: {response.status_code}")
-                        
-                except Exception as e:
-                    logger.warning(f"Error fetching email {message_id}: {str(e)}")
-            
-            # Small delay between batches to avoid rate limiting
-            import time
-            if i + batch_size < len(message_id_list):
-                time.sleep(0.1)
+        # One $batch POST per 20 messages; throttled messages are retried by the batch client
+        urls = [
+            (message_id, f"/users/{user_id}/messages/{urllib.parse.quote(message_id, safe='')}?$select={select}")
+            for message_id in message_ids
+        ]
+        responses = self.batch_client.get(urls, mailbox=user_id)
+        
+        messages = []
+        for message_id, _ in urls:
+            response = responses.get(message_id)
+            data = batch_body(response)
+            if data:
+                messages.append(data)
+            else:
+                status = response.get('status') if response else 'no response'
+                logger.warning(f"Failed to fetch email {message_id}: {status}")
         
         logger.debug(f"Fetched full data for {len(messages)} emails")
         return messages
@@ -422,6 +511,35 @@ class OptimizedExchangeBackup:
         # FAIL COMPLETELY - no placeholder
         raise Exception(f"Cannot access email metadata for {message_id}")
     
+    def _get_attachment_lists(self, user_id: str, message_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get attachment lists for many messages via $batch.
+        
+        Args:
+            user_id: User ID
+            message_ids: Message IDs (with attachments)
+            
+        Returns:
+            Dict of message ID to attachment list; messages whose listing failed are omitted
+        """
+        import urllib.parse
+        
+        # Metadata only - content is downloaded separately via $value
+        urls = [
+            (message_id, f"/users/{user_id}/messages/{urllib.parse.quote(message_id, safe='')}"
+                         f"/attachments?$select=id,name,contentType,size,isInline")
+            for message_id in message_ids
+        ]
+        responses = self.batch_client.get(urls, mailbox=user_id)
+        
+        attachment_lists = {}
+        for message_id, _ in urls:
+            data = batch_body(responses.get(message_id))
+            if data is not None:
+                attachment_lists[message_id] = data.get('value', [])
+        
+        return attachment_lists
+    
     def _get_message_attachments(self, user_id: str, message_id: str) -> List[Dict[str, Any]]:
         """Get attachments for a message."""
         attachments = []
@@ -454,30 +572,37 @@ class OptimizedExchangeBackup:
         logger.error(f"Failed to fetch attachments for message {message_id} after trying {len(endpoints_to_try)} approaches")
         return attachments
     
-    def _download_attachment(self, user_id: str, attachment_id: str, message_id: str) -> Optional[bytes]:
-        """Download a specific attachment."""
+    def _open_attachment_stream(self, user_id: str, attachment_id: str, message_id: str, start: int = 0):
+        """
+        Start downloading an attachment without reading its body.
+        
+        Args:
+            start: First byte to request (resuming an interrupted download)
+        
+        Returns:
+            Streaming response (caller iterates and closes it). Its status is
+            checked by iter_resumable, so a 416 on resume ends the download and
+            transport errors propagate to be retried there.
+        """
         # URL encode the message ID since it may contain special characters
         import urllib.parse
         encoded_message_id = urllib.parse.quote(message_id, safe='')
         endpoint = f"https://graph.microsoft.com/v1.0/users/{user_id}/messages/{encoded_message_id}/attachments/{attachment_id}/$value"
         
-        try:
-            response = self._make_graph_request(endpoint, headers={'Accept': 'application/octet-stream'})
-            response.raise_for_status()
-            return response.content
-            
-        except Exception as e:
-            logger.error(f"Failed to download attachment {attachment_id}: {str(e)}")
-            return None
+        return self._make_graph_request(
+            endpoint, headers={'Accept': 'application/octet-stream', **range_header(start)}, stream=True
+        )
     
-    def _create_eml_file(self, email_meta: EmailMetadata, attachments: List[Dict[str, Any]], 
-                        attachment_data: Dict[str, bytes], file_path: Path):
-        """Create EML file from email metadata."""
-        from email.message import EmailMessage
+    def _create_eml_file(self, user_id: str, email_meta: EmailMetadata, attachments: List[Dict[str, Any]], 
+                        file_path: Path) -> Dict[str, StreamedAttachment]:
+        """
+        Create EML file from email metadata, streaming attachments straight to disk.
+        
+        Returns:
+            Size and SHA-256 of every attachment written, by attachment ID
+        """
         from email.mime.multipart import MIMEMultipart
         from email.mime.text import MIMEText
-        from email.mime.base import MIMEBase
-        from email import encoders
         
         eml = MIMEMultipart()
         
@@ -494,34 +619,47 @@ class OptimizedExchangeBackup:
         
         logger.debug(f"Using batch-fetched email body: {len(body_content)} characters, type: {body_type}")
         
-        # Create body part
-        if body_type == 'html':
-            body_part = MIMEText(body_content, 'html', 'utf-8')
-        else:
-            body_part = MIMEText(body_content, 'plain', 'utf-8')
-        eml.attach(body_part)
+        written: Dict[str, StreamedAttachment] = {}
         
-        # Add attachments
-        for attachment in attachments:
-            attachment_id = attachment.get('id')
-            if attachment_id in attachment_data:
-                content = attachment_data[attachment_id]
-                filename = attachment.get('name', f'attachment_{attachment_id}')
-                content_type = attachment.get('contentType', 'application/octet-stream')
+        with StreamingEmlWriter(file_path, eml) as writer:
+            # Create body part
+            if body_type == 'html':
+                writer.write_body(MIMEText(body_content, 'html', 'utf-8'))
+            else:
+                writer.write_body(MIMEText(body_content, 'plain', 'utf-8'))
+            
+            # Add attachments, one download chunk in memory at a time
+            for attachment in attachments:
+                attachment_id = attachment.get('id')
+                attachment_name = attachment.get('name', f'attachment_{attachment_id}')
                 
-                maintype, subtype = content_type.split('/', 1) if '/' in content_type else (content_type, 'octet-stream')
-                attachment_part = MIMEBase(maintype, subtype)
-                attachment_part.set_payload(content)
-                attachment_part.add_header('Content-Disposition', 'attachment', filename=filename)
-                encoders.encode_base64(attachment_part)
-                eml.attach(attachment_part)
-        
-        # Write EML file
-        with open(file_path, 'wb') as f:
-            f.write(eml.as_bytes())
+                # Reconnects with a Range header if the connection drops mid-attachment
+                chunks = iter_resumable(
+                    lambda start, end: self._open_attachment_stream(user_id, attachment_id, email_meta.id, start),
+                    chunk_size=CHUNK_SIZE
+                )
+                
+                try:
+                    result = writer.add_attachment(
+                        attachment_name,
+                        attachment.get('contentType', 'application/octet-stream'),
+                        chunks
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to download attachment: {attachment_name} ({str(e)})")
+                    self._increment_stat('attachments_skipped')
+                    continue
+                finally:
+                    chunks.close()
+                
+                written[attachment_id] = result
+                self._increment_stat('attachments_backed_up')
+                self._increment_stat('total_size', result.size)
+                logger.debug(f"Downloaded attachment: {attachment_name} ({result.size} bytes)")
         
         file_size = file_path.stat().st_size if file_path.exists() else 0
         logger.debug(f"Created EML file: {file_path}, size: {file_size} bytes")
+        return written
     
     def _format_email_address(self, address_dict: Dict[str, Any]) -> str:
         """Format email address from Graph API response."""
@@ -553,8 +691,13 @@ class OptimizedExchangeBackup:
             filename = filename.replace(char, '_')
         return filename[:100]
     
-    def _backup_user_emails(self, user: Dict[str, Any], backup_type: str = 'incremental'):
-        """Backup emails for a single user using ID-based tracking."""
+    def _backup_user_emails(self, user: Dict[str, Any], backup_type: str = 'incremental') -> Dict[str, int]:
+        """
+        Backup emails for a single user using ID-based tracking.
+        
+        Returns:
+            Per-user counters for the backup timeline
+        """
         user_id = user.get('id')
         user_email = user.get('userPrincipalName', user.get('mail', 'Unknown'))
         
@@ -585,79 +728,156 @@ class OptimizedExchangeBackup:
         total_new_emails = 0
         total_skipped_emails = 0
         
-        for folder in folders:
-            folder_id = folder.get('id')
-            folder_name = folder.get('displayName', 'Unknown')
-            
-            logger.info(f"Processing folder: {folder_name}")
-            
-            # Create folder directory
-            folder_path = user_backup_path / self._sanitize_filename(folder_name)
-            folder_path.mkdir(parents=True, exist_ok=True)
+        # Folders are processed in parallel; the scheduler's mailbox slots cap in-flight requests
+        with ThreadPoolExecutor(max_workers=self.per_mailbox_concurrency) as executor:
+            futures = {
+                executor.submit(self._backup_folder, user_id, user_email, folder,
+                                user_backup_path, backup_type): folder
+                for folder in folders
+            }
+            for future in as_completed(futures):
+                folder_name = futures[future].get('displayName', 'Unknown')
+                try:
+                    new_emails, skipped_emails = future.result()
+                    total_new_emails += new_emails
+                    total_skipped_emails += skipped_emails
+                except Exception as e:
+                    logger.error(f"Failed to backup folder '{folder_name}' for {user_email}: {str(e)}")
+        
+        self._increment_stat('emails_backed_up', total_new_emails)
+        self._increment_stat('emails_skipped', total_skipped_emails)
+        self._increment_stat('users_processed')
+        
+        logger.info(f"User {user_email}: {total_new_emails} new emails backed up, {total_skipped_emails} skipped")
+        
+        return {'emails_backed_up': total_new_emails, 'emails_skipped': total_skipped_emails}
+    
+    def _backup_folder(self, user_id: str, user_email: str, folder: Dict[str, Any],
+                       user_backup_path: Path, backup_type: str) -> Tuple[int, int]:
+        """
+        Backup new emails in one mail folder.
+        
+        Returns:
+            Tuple of (new emails backed up, emails skipped)
+        """
+        folder_id = folder.get('id')
+        folder_name = folder.get('displayName', 'Unknown')
+        
+        logger.info(f"Processing folder: {folder_name}")
+        
+        # Create folder directory
+        folder_path = user_backup_path / self._sanitize_filename(folder_name)
+        folder_path.mkdir(parents=True, exist_ok=True)
+        
+        # TWO-PHASE APPROACH for performance:
+        # Phase 1: Get message IDs only (fast) - just the changes when a delta link is stored
+        current_message_ids = None
+        new_delta_link = None
+        
+        if self.use_delta:
+            stored_delta_link = None
+            if backup_type == 'incremental':
+                stored_delta_link = self.db.get_folder_delta_link(user_email, folder_id)
             
-            # TWO-PHASE APPROACH for performance:
-            # Phase 1: Get message IDs only (fast)
+            try:
+                try:
+                    current_message_ids, removed_ids, new_delta_link = self._get_folder_message_delta(
+                        user_id, folder_id, stored_delta_link
+                    )
+                except DeltaTokenExpired:
+                    logger.warning(f"Delta token expired for folder '{folder_name}', starting a new sync")
+                    self.db.clear_folder_delta_link(user_email, folder_id)
+                    current_message_ids, removed_ids, new_delta_link = self._get_folder_message_delta(
+                        user_id, folder_id
+                    )
+                
+                if stored_delta_link:
+                    logger.info(f"Delta: {len(current_message_ids)} new or changed emails, "
+                                f"{len(removed_ids)} removed from folder")
+            except Exception as e:
+                logger.warning(f"Message delta failed for folder '{folder_name}': {str(e)}, listing all IDs")
+                current_message_ids = None
+                new_delta_link = None
+        
+        if current_message_ids is None:
             current_message_ids = self._get_folder_message_ids(user_id, folder_id)
             logger.info(f"Found {len(current_message_ids)} emails in folder")
+        
+        if not current_message_ids:
+            if new_delta_link:
+                self.db.save_folder_delta_link(user_email, folder_id, new_delta_link)
+            return 0, 0
+        
+        # Get already backed up message IDs from database
+        existing_records = self.db.get_user_email_records(user_email)
+        existing_message_ids = {record['message_id'] for record in existing_records}
+        
+        # Find new emails (IDs not in database)
+        new_message_ids = current_message_ids - existing_message_ids
+        skipped_message_ids = current_message_ids & existing_message_ids
+        
+        logger.info(f"New emails: {len(new_message_ids)}, Skipped: {len(skipped_message_ids)}")
+        
+        # Phase 2: Get full data only for new emails
+        new_emails_in_folder = 0
+        skipped_emails_in_folder = len(skipped_message_ids)
+        
+        if new_message_ids:
+            # Fetch full data for new emails
+            new_messages = self._get_email_batch_data(user_id, folder_id, new_message_ids)
             
-            if not current_message_ids:
-                continue
-            
-            # Get already backed up message IDs from database
-            existing_records = self.db.get_user_email_records(user_email)
-            existing_message_ids = {record['message_id'] for record in existing_records}
-            
-            # Find new emails (IDs not in database)
-            new_message_ids = current_message_ids - existing_message_ids
-            skipped_message_ids = current_message_ids & existing_message_ids
-            
-            logger.info(f"New emails: {len(new_message_ids)}, Skipped: {len(skipped_message_ids)}")
-            
-            # Phase 2: Get full data only for new emails
-            new_emails_in_folder = 0
-            skipped_emails_in_folder = len(skipped_message_ids)
+            # Prefetch attachment lists for the whole folder in batches
+            attachment_lists = self._get_attachment_lists(
+                user_id, [m['id'] for m in new_messages if m.get('hasAttachments')]
+            )
             
-            if new_message_ids:
-                # Fetch full data for new emails
-                new_messages = self._get_email_batch_data(user_id, folder_id, new_message_ids)
+            for message in new_messages:
+                message_id = message.get('id')
+                subject = message.get('subject', 'No Subject')
+                
+                # NEW EMAIL DETECTED - log details
+                logger.info(f"NEW EMAIL DETECTED: '{subject}' (ID: {message_id[:30]}...)")
                 
-                for message in new_messages:
-                    message_id = message.get('id')
-                    subject = message.get('subject', 'No Subject')
+                # New email - backup it
+                try:
+                    # Create EmailMetadata from the batch data we already have
+                    email_meta = EmailMetadata.from_graph_data(message, folder_id, folder_name)
+                    logger.debug(f"Created metadata for new email: {subject}")
                     
-                    # NEW EMAIL DETECTED - log details
-                    logger.info(f"NEW EMAIL DETECTED: '{subject}' (ID: {message_id[:30]}...)")
+                    # Now we need to get the email body and attachments
+                    self._backup_single_email_with_metadata(
+                        user_id, user_email, email_meta, folder_path,
+                        attachments=attachment_lists.get(message_id)
+                    )
+                    new_emails_in_folder += 1
                     
-                    # New email - backup it
-                    try:
-                        # Create EmailMetadata from the batch data we already have
-                        email_meta = EmailMetadata.from_graph_data(message, folder_id, folder_name)
-                        logger.debug(f"Created metadata for new email: {subject}")
-                        
-                        # Now we need to get the email body and attachments
-                        self._backup_single_email_with_metadata(
-                            user_id, user_email, email_meta, folder_path
-                        )
-                        new_emails_in_folder += 1
-                        total_new_emails += 1
-                        
-                    except Exception as e:
-                        logger.error(f"Failed to backup email '{subject}' ({message_id}): {str(e)}")
-            
-            total_skipped_emails += skipped_emails_in_folder
-            self.stats['bytes_saved'] += skipped_emails_in_folder * 1024  # Approximate savings
-            
-            logger.info(f"New emails: {new_emails_in_folder}, Skipped: {skipped_emails_in_folder}")
+                except Exception as e:
+                    logger.error(f"Failed to backup email '{subject}' ({message_id}): {str(e)}")
         
-        self.stats['emails_backed_up'] += total_new_emails
-        self.stats['emails_skipped'] += total_skipped_emails
-        self.stats['users_processed'] += 1
+        self._increment_stat('bytes_saved', skipped_emails_in_folder * 1024)  # Approximate savings
         
-        logger.info(f"User {user_email}: {total_new_emails} new emails backed up, {total_skipped_emails} skipped")
+        # Only advance the delta link once every new email it covers is backed up
+        if new_delta_link:
+            failed_in_folder = len(new_message_ids) - new_emails_in_folder
+            if failed_in_folder:
+                logger.warning(f"Not saving delta link for folder '{folder_name}': "
+                               f"{failed_in_folder} emails failed")
+            else:
+                self.db.save_folder_delta_link(user_email, folder_id, new_delta_link)
+        
+        logger.info(f"New emails: {new_emails_in_folder}, Skipped: {skipped_emails_in_folder}")
+        
+        return new_emails_in_folder, skipped_emails_in_folder
     
     def _backup_single_email_with_metadata(self, user_id: str, user_email: str, 
-                                          email_meta: EmailMetadata, folder_path: Path):
-        """Backup a single email using already fetched metadata."""
+                                          email_meta: EmailMetadata, folder_path: Path,
+                                          attachments: Optional[List[Dict[str, Any]]] = None):
+        """
+        Backup a single email using already fetched metadata.
+        
+        Args:
+            attachments: Attachment list prefetched via $batch; fetched individually if None
+        """
         message_id = email_meta.id
         subject = email_meta.subject
         
@@ -680,28 +900,13 @@ class OptimizedExchangeBackup:
         logger.debug(f"Email validation passed: subject='{subject}', body length={len(body_content)}")
         
         # Get attachments if any
-        attachments = []
-        attachment_data = {}
-        
-        if email_meta.hasAttachments:
-            logger.debug(f"Email has attachments, fetching attachment list...")
-            attachments = self._get_message_attachments(user_id, message_id)
+        if not email_meta.hasAttachments:
+            attachments = []
+        else:
+            if attachments is None:
+                logger.debug(f"Email has attachments, fetching attachment list...")
+                attachments = self._get_message_attachments(user_id, message_id)
             logger.debug(f"Found {len(attachments)} attachments")
-            
-            for attachment in attachments:
-                attachment_id = attachment.get('id')
-                attachment_name = attachment.get('name', f'attachment_{attachment_id}')
-                
-                # Download attachment
-                content = self._download_attachment(user_id, attachment_id, message_id)
-                if content:
-                    attachment_data[attachment_id] = content
-                    self.stats['attachments_backed_up'] += 1
-                    self.stats['total_size'] += len(content)
-                    logger.debug(f"Downloaded attachment: {attachment_name} ({len(content)} bytes)")
-                else:
-                    logger.warning(f"Failed to download attachment: {attachment_name}")
-                    self.stats['attachments_skipped'] += 1
         
         # Create EML file
         safe_subject = self._sanitize_filename(email_meta.subject)
@@ -711,7 +916,8 @@ class OptimizedExchangeBackup:
         
         logger.debug(f"Creating EML file: {eml_filename}")
         
-        self._create_eml_file(email_meta, attachments, attachment_data, eml_path)
+        # Attachments are downloaded while the file is written
+        attachment_data = self._create_eml_file(user_id, email_meta, attachments, eml_path)
         
         # Update database ONLY if we successfully created the EML file
         logger.debug(f"Updating database record for email: {message_id}")
@@ -723,7 +929,7 @@ class OptimizedExchangeBackup:
             subject=email_meta.subject,
             sender=self._format_email_address(email_meta.from_address),
             received_date=email_meta.receivedDateTime,
-            message_size=email_meta.size + sum(len(c) for c in attachment_data.values()),
+            message_size=email_meta.size + sum(a.size for a in attachment_data.values()),
             checksum=hashlib.sha256(message_id.encode()).hexdigest(),  # Simple checksum based on ID
             has_attachments=email_meta.hasAttachments,
             attachment_count=len(attachments),
@@ -735,63 +941,89 @@ class OptimizedExchangeBackup:
         for attachment in attachments:
             attachment_id = attachment.get('id')
             if attachment_id in attachment_data:
-                content = attachment_data[attachment_id]
                 self.db.update_attachment_record(
                     email_id=message_id,  # This would need the actual email ID from database
                     attachment_id=attachment_id,
                     attachment_name=attachment.get('name', f'attachment_{attachment_id}'),
                     attachment_size=attachment.get('size', 0),
-                    checksum=hashlib.sha256(content).hexdigest()
+                    checksum=attachment_data[attachment_id].sha256
                 )
         
         logger.info(f"Successfully backed up: '{subject}'")
     
     def backup_all(self, backup_type: str = 'incremental'):
         """Main backup method."""
-        logger.info(f"Starting {backup_type.upper()} Exchange backup")
-        logger.info("=" * 60)
-        
-        session_id = self.db.start_exchange_backup_session(backup_type)
+        session_id = self.start_run(backup_type)
         
         try:
-            users = self._get_users()
+            users = self.get_users()
             logger.info(f"Found {len(users)} users")
+            logger.info(f"Backing up {self.scheduler.max_mailboxes} mailboxes in parallel "
+                        f"(max {self.per_mailbox_concurrency} concurrent requests per mailbox, largest first)")
             
-            for i, user in enumerate(users, 1):
-                user_email = user.get('userPrincipalName', user.get('mail', f'User_{i}'))
-                logger.info(f"[{i}/{len(users)}] Processing: {user_email}")
-                
-                try:
-                    self._backup_user_emails(user, backup_type)
-                except Exception as e:
-                    logger.error(f"Failed to backup user {user_email}: {str(e)}")
-            
-            self.db.update_exchange_backup_session(
-                session_id=session_id,
-                emails_backed_up=self.stats['emails_backed_up'],
-                emails_skipped=self.stats['emails_skipped'],
-                attachments_backed_up=self.stats['attachments_backed_up'],
-                attachments_skipped=self.stats['attachments_skipped'],
-                total_size=self.stats['total_size'],
-                status='completed'
-            )
+            self.timeline = self.scheduler.run(users, lambda user: self.backup_mailbox(user, backup_type),
+                                               self.estimate_mailbox_size)
+            self._save_timeline()
             
-            self._print_summary()
+            self.finish_run(session_id)
             
         except Exception as e:
             logger.error(f"Backup failed: {str(e)}")
-            self.db.update_exchange_backup_session(
-                session_id=session_id,
-                emails_backed_up=self.stats['emails_backed_up'],
-                emails_skipped=self.stats['emails_skipped'],
-                attachments_backed_up=self.stats['attachments_backed_up'],
-                attachments_skipped=self.stats['attachments_skipped'],
-                total_size=self.stats['total_size'],
-                status='failed',
-                error_message=str(e)
-            )
+            self.finish_run(session_id, error=str(e))
             raise
     
+    def start_run(self, backup_type: str) -> int:
+        """
+        Start a backup run.
+        
+        Returns:
+            Backup session id for finish_run()
+        """
+        logger.info(f"Starting {backup_type.upper()} Exchange backup")
+        logger.info("=" * 60)
+        return self.db.start_exchange_backup_session(backup_type)
+    
+    def finish_run(self, session_id: int, error: Optional[str] = None):
+        """Record the run totals; a successful run also prints the summary."""
+        self.db.update_exchange_backup_session(
+            session_id=session_id,
+            emails_backed_up=self.stats['emails_backed_up'],
+            emails_skipped=self.stats['emails_skipped'],
+            attachments_backed_up=self.stats['attachments_backed_up'],
+            attachments_skipped=self.stats['attachments_skipped'],
+            total_size=self.stats['total_size'],
+            status='failed' if error else 'completed',
+            error_message=error
+        )
+        
+        if not error:
+            self._print_summary()
+    
+    def backup_mailbox(self, user: Dict[str, Any], backup_type: str = 'incremental') -> Dict[str, int]:
+        """
+        Back up one mailbox (safe to run for several users at once).
+        
+        Returns:
+            Per-user counters for the timeline
+        """
+        user_email = user.get('userPrincipalName', user.get('mail', 'Unknown'))
+        try:
+            return self._backup_user_emails(user, backup_type)
+        except Exception as e:
+            logger.error(f"Failed to backup user {user_email}: {str(e)}")
+            raise
+    
+    def _save_timeline(self):
+        """Write the per-user timeline of this run next to the user backups."""
+        if not self.timeline:
+            return
+        
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        timeline_file = self.backup_dir / f"backup_timeline_{self.stats['start_time'].strftime('%Y%m%d_%H%M%S')}.json"
+        with open(timeline_file, 'w') as f:
+            json.dump(self.timeline, f, indent=2)
+        logger.debug(f"Saved backup timeline: {timeline_file}")
+    
     def _print_summary(self):
         """Print backup summary."""
         end_time = datetime.now()
@@ -814,11 +1046,19 @@ class OptimizedExchangeBackup:
                         (self.stats['emails_backed_up'] + self.stats['emails_skipped'])) * 100
             logger.info(f"Skip rate: {skip_rate:.1f}%")
         
+        if self.timeline:
+            logger.info("-" * 60)
+            logger.info("Per-user timeline:")
+            for line in format_timeline(self.timeline):
+                logger.info(f"  {line}")
+        
         logger.info("=" * 60)
 
 
 def main():
     """Command-line interface."""
+    configure_logging()
+
     # Try to load environment variables from .env file
     try:
         from dotenv import load_dotenv
@@ -843,6 +1083,15 @@ def main():
     parser.add_argument('--db-path', default='backup_checksums_exchange.db',
                        help='Checksum database path (default: backup_checksums_exchange.db)')
     
+    parser.add_argument('--no-delta', action='store_true',
+                       help='Disable Graph message delta queries and list every message ID on each run')
+    
+    parser.add_argument('--mailboxes', type=int, default=4,
+                       help='Mailboxes backed up in parallel (default: 4)')
+    
+    parser.add_argument('--per-mailbox', type=int, default=DEFAULT_PER_MAILBOX_CONCURRENCY,
+                       help=f'Concurrent requests per mailbox (default: {DEFAULT_PER_MAILBOX_CONCURRENCY})')
+    
     args = parser.parse_args()
     
     # Get credentials from environment
@@ -858,7 +1107,10 @@ def main():
     try:
         backup = OptimizedExchangeBackup(
             CLIENT_ID, CLIENT_SECRET, TENANT_ID, 
-            args.backup_dir, args.db_path
+            args.backup_dir, args.db_path,
+            use_delta=not args.no_delta,
+            max_mailboxes=args.mailboxes,
+            per_mailbox_concurrency=args.per_mailbox
         )
 
         backup.backup_all(args.type)
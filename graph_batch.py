@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Microsoft Graph JSON Batching
+Packs up to 20 Graph requests into a single POST to the $batch endpoint and
+retries throttled sub-requests individually.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+from graph_throttle import THROTTLE_STATUSES, AdaptiveRateLimiter, parse_retry_after
+
+GRAPH_BATCH_URL = "https://graph.microsoft.com/v1.0/$batch"
+
+# Graph rejects batches with more than 20 sub-requests
+MAX_BATCH_SIZE = 20
+
+# Sub-request statuses worth retrying; everything else is returned to the caller
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GraphBatchClient:
+    """Send many Graph requests through the JSON $batch endpoint."""
+
+    def __init__(self, request_func: Callable, batch_size: int = MAX_BATCH_SIZE,
+                 max_retries: int = 5, max_retry_wait: float = 60.0,
+                 limiter: Optional[AdaptiveRateLimiter] = None):
+        """
+        Initialize batch client.
+
+        Args:
+            request_func: Callable(url, method='GET', **kwargs) returning a requests.Response,
+                          typically the engine's _make_graph_request (handles auth and token refresh);
+                          must accept mailbox= if get()/execute() are given one
+            batch_size: Sub-requests per POST (capped at 20)
+            max_retries: Retry rounds for throttled or failed sub-requests
+            max_retry_wait: Upper bound in seconds for a single Retry-After wait
+            limiter: Shared rate limiter that request_func goes through; throttled (429/503)
+                     sub-requests are reported to it instead of sleeping here
+        """
+        self.request_func = request_func
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self.limiter = limiter
+
+    def get(self, urls: List[Tuple[str, str]], mailbox: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Batch GET requests.
+
+        Args:
+            urls: List of (key, url) pairs; url is relative to /v1.0
+                  (e.g. "/users/{id}/messages/{id}?$select=subject")
+            mailbox: See execute()
+
+        Returns:
+            Dict mapping each key to its sub-response ({'status', 'headers', 'body'})
+        """
+        return self.execute([{'method': 'GET', 'url': url, 'key': key} for key, url in urls], mailbox=mailbox)
+
+    def execute(self, requests_list: List[Dict[str, Any]],
+                mailbox: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Execute sub-requests in batches, retrying throttled ones.
+
+        Args:
+            requests_list: Dicts with 'key', 'method', 'url' and optionally 'headers'/'body'
+            mailbox: Mailbox every sub-request addresses; passed to request_func so each
+                     POST takes one of that mailbox's request slots (the $batch URL has no /users/{id})
+
+        Returns:
+            Dict mapping each key to its last sub-response ({'status', 'headers', 'body'}).
+            Requests whose batch POST was rejected get that POST's status and body,
+            or status 0 if it raised.
+        """
+        # Batch ids must be unique strings; keep caller keys out of the payload
+        pending = {str(i): request for i, request in enumerate(requests_list)}
+        results: Dict[str, Dict[str, Any]] = {}
+
+        for attempt in range(self.max_retries + 1):
+            if not pending:
+                break
+
+            retry: Dict[str, Dict[str, Any]] = {}
+            wait = 0.0
+            throttled = False
+            ids = list(pending.keys())
+
+            for i in range(0, len(ids), self.batch_size):
+                chunk = {batch_id: pending[batch_id] for batch_id in ids[i:i + self.batch_size]}
+                responses = self._post_batch(chunk, mailbox)
+
+                for batch_id, request in chunk.items():
+                    response = responses.get(batch_id, {'status': 0, 'headers': {}, 'body': None})
+                    results[request['key']] = response
+
+                    if response['status'] in RETRYABLE_STATUSES or response['status'] == 0:
+                        retry[batch_id] = request
+                        throttled = throttled or response['status'] in THROTTLE_STATUSES
+                        wait = max(wait, self._retry_after(response.get('headers', {}), attempt))
+
+            pending = retry
+            if pending and attempt < self.max_retries:
+                wait = min(wait, self.max_retry_wait)
+                logger.debug(f"Retrying {len(pending)} failed batch sub-requests in {wait:.1f}s")
+                if throttled and self.limiter:
+                    # Pauses every caller of the shared limiter, including our next POST;
+                    # plain server errors only back off this batch
+                    self.limiter.on_throttle(wait)
+                else:
+                    time.sleep(wait)
+
+        if pending:
+            logger.warning(f"{len(pending)} batch sub-requests still failing after {self.max_retries} retries")
+
+        return results
+
+    def _post_batch(self, chunk: Dict[str, Dict[str, Any]],
+                    mailbox: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        POST one batch.
+
+        Returns:
+            Sub-responses by batch id. If the POST itself is rejected, every
+            sub-request gets its status, headers and body.
+        """
+        payload = {'requests': []}
+        for batch_id, request in chunk.items():
+            sub_request = {'id': batch_id, 'method': request.get('method', 'GET'), 'url': request['url']}
+            if request.get('headers'):
+                sub_request['headers'] = request['headers']
+            if request.get('body') is not None:
+                sub_request['body'] = request['body']
+                sub_request.setdefault('headers', {}).setdefault('Content-Type', 'application/json')
+            payload['requests'].append(sub_request)
+
+        try:
+            extra = {'mailbox': mailbox} if mailbox is not None else {}
+            response = self.request_func(GRAPH_BATCH_URL, method='POST', json=payload, **extra)
+        except Exception as e:
+            logger.warning(f"Graph batch request failed: {str(e)}")
+            return {}
+
+        if response.status_code != 200:
+            # The whole batch was rejected; throttling and server errors are retried,
+            # other client errors (e.g. a malformed payload) go straight back to the caller
+            logger.warning(f"Graph batch request returned {response.status_code}")
+            try:
+                body = response.json()
+            except ValueError:
+                body = None
+            rejected = {'status': response.status_code, 'headers': dict(response.headers), 'body': body}
+            return {batch_id: rejected for batch_id in chunk}
+
+        responses = {}
+        for item in response.json().get('responses', []):
+            responses[str(item.get('id'))] = {
+                'status': item.get('status', 0),
+                'headers': item.get('headers', {}) or {},
+                'body': item.get('body')
+            }
+
+        return responses
+
+    @staticmethod
+    def _retry_after(headers: Dict[str, Any], attempt: int) -> float:
+        """Seconds to wait from a Retry-After header, or exponential backoff."""
+        retry_after = parse_retry_after(headers)
+        if retry_after is not None:
+            return retry_after
+
+        return float(min(2 ** attempt, 30))
+
+
+def batch_body(response: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Return the JSON body of a successful sub-response, else None."""
+    if response and 200 <= response.get('status', 0) < 300:
+        return response.get('body')
+    return None
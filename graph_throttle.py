@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Adaptive Graph Throttle Controller
+Token-bucket rate limiter shared by all Microsoft Graph clients in the process.
+Honors Retry-After, backs off on 429/503 and speeds up again while calls succeed.
+An optional byte-rate limiter caps the download bandwidth of the whole process.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Mapping, Optional
+
+from loguru import logger
+
+# Statuses that mean "slow down" rather than "this request is wrong"
+THROTTLE_STATUSES = {429, 503}
+
+
+def parse_retry_after(headers: Optional[Mapping[str, Any]]) -> Optional[float]:
+    """Return the Retry-After header in seconds, or None if absent or not numeric."""
+    if not headers:
+        return None
+
+    for name, value in headers.items():
+        if name.lower() == 'retry-after':
+            try:
+                return max(0.0, float(value))
+            except (TypeError, ValueError):
+                return None
+
+    return None
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose refill rate adapts to Graph throttling (AIMD).
+
+    Every successful call raises the rate by increase_step; every 429/503 halves
+    it and pauses all callers until Retry-After has passed.
+    """
+
+    def __init__(self, initial_rate: float = 10.0, min_rate: float = 0.5, max_rate: float = 50.0,
+                 burst: int = 10, increase_step: float = 0.25, decrease_factor: float = 0.5,
+                 max_retries: int = 5):
+        """
+        Initialize rate limiter.
+
+        Args:
+            initial_rate: Starting requests per second
+            min_rate: Lowest rate backoff can reach
+            max_rate: Highest rate recovery can reach
+            burst: Bucket capacity (requests that may start back-to-back)
+            increase_step: Requests/second added after each successful call
+            decrease_factor: Rate multiplier applied on each throttled call
+            max_retries: Retries of a throttled request in send()
+        """
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, min_rate)
+        self.rate = min(max(initial_rate, min_rate), self.max_rate)
+        self.burst = max(1, burst)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._consecutive_throttles = 0
+        self._lock = threading.Lock()
+
+        self.stats = {'requests': 0, 'throttled': 0, 'waited_seconds': 0.0}
+
+    def _take_token(self) -> float:
+        """Take a token if one is available; otherwise return the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+
+            if now < self._paused_until:
+                wait = self._paused_until - now
+            else:
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.stats['requests'] += 1
+                    return 0.0
+
+                wait = (1 - self._tokens) / self.rate
+
+            self.stats['waited_seconds'] += wait
+            return wait
+
+    def acquire(self):
+        """Block until the bucket has a token (and any Retry-After pause is over)."""
+        while True:
+            wait = self._take_token()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Like acquire(), but waits without blocking the event loop."""
+        while True:
+            wait = self._take_token()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        """Record a call that was not throttled."""
+        with self._lock:
+            self._consecutive_throttles = 0
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        """
+        Record a throttled call.
+
+        Args:
+            retry_after: Seconds from the Retry-After header; exponential backoff if None
+        """
+        with self._lock:
+            self._consecutive_throttles += 1
+            self.stats['throttled'] += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+
+            if retry_after is None:
+                retry_after = min(2 ** (self._consecutive_throttles - 1), 60)
+
+            # Pause everyone, and start refilling from empty afterwards
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._tokens = 0.0
+            self._last_refill = self._paused_until
+
+        logger.debug(f"Graph throttled, pausing {retry_after:.1f}s, rate now {self.rate:.2f} req/s")
+
+    def feedback(self, status_code: int, headers: Optional[Mapping[str, Any]] = None) -> bool:
+        """
+        Record the outcome of a call.
+
+        Returns:
+            True if the call was throttled and should be retried
+        """
+        if status_code in THROTTLE_STATUSES:
+            self.on_throttle(parse_retry_after(headers))
+            return True
+
+        self.on_success()
+        return False
+
+    def send(self, request_func: Callable[..., Any], *args, **kwargs):
+        """
+        Perform a request under the limiter, retrying while it is throttled.
+
+        Args:
+            request_func: Callable returning a requests.Response (e.g. session.request)
+
+        Returns:
+            The first non-throttled response, or the last throttled one after max_retries
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            response = request_func(*args, **kwargs)
+
+            if not self.feedback(response.status_code, response.headers):
+                return response
+
+            if attempt < self.max_retries:
+                # Release the connection of a throttled (possibly streamed) response
+                response.close()
+                logger.debug(f"Retrying throttled request ({response.status_code}), "
+                             f"attempt {attempt + 1}/{self.max_retries}")
+
+        logger.warning(f"Request still throttled after {self.max_retries} retries")
+        return response
+
+    async def send_async(self, request_func: Callable[..., Awaitable[Any]], *args, **kwargs):
+        """
+        Async counterpart of send().
+
+        Args:
+            request_func: Coroutine function returning a response (e.g. httpx.AsyncClient.request)
+
+        Returns:
+            The first non-throttled response, or the last throttled one after max_retries
+        """
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async()
+            response = await request_func(*args, **kwargs)
+
+            if not self.feedback(response.status_code, response.headers):
+                return response
+
+            if attempt < self.max_retries:
+                aclose = getattr(response, 'aclose', None)
+                if aclose is not None:
+                    await aclose()
+                else:
+                    response.close()
+                logger.debug(f"Retrying throttled request ({response.status_code}), "
+                             f"attempt {attempt + 1}/{self.max_retries}")
+
+        logger.warning(f"Request still throttled after {self.max_retries} retries")
+        return response
+
+
+_shared_limiter: Optional[AdaptiveRateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_graph_limiter() -> AdaptiveRateLimiter:
+    """
+    Get the process-wide limiter for Microsoft Graph.
+
+    Graph throttles per app and tenant, so every client in the process shares one
+    bucket. GRAPH_MAX_REQUESTS_PER_SECOND caps the rate (default 50).
+    """
+    global _shared_limiter
+
+    with _shared_lock:
+        if _shared_limiter is None:
+            max_rate = float(os.environ.get('GRAPH_MAX_REQUESTS_PER_SECOND', '50'))
+            _shared_limiter = AdaptiveRateLimiter(initial_rate=min(10.0, max_rate), max_rate=max_rate)
+        return _shared_limiter
+
+
+class BandwidthLimiter:
+    """
+    Byte-rate budget shared by all downloads in the process.
+
+    Readers report each chunk after receiving it; once the bucket is overdrawn
+    they sleep until it has refilled, which holds the combined rate of all
+    threads at bytes_per_second.
+    """
+
+    def __init__(self, bytes_per_second: float, burst_seconds: float = 1.0):
+        """
+        Initialize bandwidth limiter.
+
+        Args:
+            bytes_per_second: Combined download rate of all callers
+            burst_seconds: Seconds of transfer that may run at full speed after an idle period
+        """
+        self.rate = float(bytes_per_second)
+        self.capacity = self.rate * burst_seconds
+        self._available = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.stats = {'bytes': 0, 'waited_seconds': 0.0}
+
+    def consume(self, nbytes: int):
+        """Account for nbytes just received, sleeping while the budget is overdrawn."""
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(self.capacity, self._available + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            self._available -= nbytes
+            self.stats['bytes'] += nbytes
+
+            wait = -self._available / self.rate if self._available < 0 else 0.0
+            self.stats['waited_seconds'] += wait
+
+        if wait:
+            time.sleep(wait)
+
+
+_bandwidth_limiter: Optional[BandwidthLimiter] = None
+_bandwidth_configured = False
+
+
+def set_bandwidth_limit(bytes_per_second: Optional[float]) -> Optional[BandwidthLimiter]:
+    """
+    Set the process-wide download bandwidth; None or 0 removes the limit.
+
+    Returns:
+        The new limiter, or None if unlimited
+    """
+    global _bandwidth_limiter, _bandwidth_configured
+
+    with _shared_lock:
+        _bandwidth_limiter = BandwidthLimiter(bytes_per_second) if bytes_per_second else None
+        _bandwidth_configured = True
+        return _bandwidth_limiter
+
+
+def get_bandwidth_limiter() -> Optional[BandwidthLimiter]:
+    """
+    Get the process-wide download bandwidth limiter.
+
+    BACKUP_MAX_BYTES_PER_SECOND sets the limit unless set_bandwidth_limit() was
+    called; without either, downloads are not limited and None is returned.
+    """
+    global _bandwidth_limiter, _bandwidth_configured
+
+    with _shared_lock:
+        if not _bandwidth_configured:
+            max_bytes = float(os.environ.get('BACKUP_MAX_BYTES_PER_SECOND', '0'))
+            _bandwidth_limiter = BandwidthLimiter(max_bytes) if max_bytes > 0 else None
+            _bandwidth_configured = True
+        return _bandwidth_limiter
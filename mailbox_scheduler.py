@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Concurrent Mailbox Scheduler
+Backs up several Exchange mailboxes at the same time while capping the number of
+in-flight Graph requests per mailbox, and records a per-user timeline.
+"""
+
+import re
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Exchange Online allows 4 concurrent requests per app per mailbox
+DEFAULT_PER_MAILBOX_CONCURRENCY = 4
+
+_USER_IN_URL = re.compile(r'/users/([^/?]+)')
+
+
+class MailboxScheduler:
+    """Run a per-user backup function over many mailboxes concurrently."""
+
+    def __init__(self, max_mailboxes: int = 4,
+                 per_mailbox_concurrency: int = DEFAULT_PER_MAILBOX_CONCURRENCY,
+                 largest_first: bool = True):
+        """
+        Initialize mailbox scheduler.
+
+        Args:
+            max_mailboxes: Mailboxes backed up at the same time
+            per_mailbox_concurrency: Maximum in-flight Graph requests per mailbox
+            largest_first: Start the largest mailboxes first to shorten the tail
+        """
+        self.max_mailboxes = max(1, max_mailboxes)
+        self.per_mailbox_concurrency = max(1, per_mailbox_concurrency)
+        self.largest_first = largest_first
+
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._slots_lock = threading.Lock()
+
+    @contextmanager
+    def mailbox_slot(self, url: str = '', mailbox: Optional[str] = None):
+        """
+        Hold one of the mailbox's request slots while a Graph request to it runs.
+
+        Args:
+            url: Graph URL or endpoint; used to find the mailbox (/users/{id}/) if none is given
+            mailbox: User ID or principal name the request addresses, for URLs without it
+                     (e.g. $batch POSTs); requests with neither are not limited
+        """
+        if mailbox is None:
+            match = _USER_IN_URL.search(url)
+            if not match:
+                yield
+                return
+            mailbox = match.group(1)
+
+        mailbox = mailbox.lower()
+        with self._slots_lock:
+            slot = self._slots.get(mailbox)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.per_mailbox_concurrency)
+                self._slots[mailbox] = slot
+
+        with slot:
+            yield
+
+    def run(self, users: List[Dict[str, Any]],
+            backup_func: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+            size_func: Callable[[Dict[str, Any]], int] = None) -> List[Dict[str, Any]]:
+        """
+        Back up all users, max_mailboxes at a time.
+
+        Args:
+            users: Graph user objects
+            backup_func: Backs up one user; may return a dict of per-user counters for the timeline
+            size_func: Estimates mailbox size (any unit) for largest-first ordering
+
+        Returns:
+            Per-user timeline entries in start order
+        """
+        sizes: Dict[int, int] = {}
+        if self.largest_first and size_func and len(users) > 1:
+            # Size probes are cheap single requests; run them with the same parallelism
+            with ThreadPoolExecutor(max_workers=self.max_mailboxes) as executor:
+                futures = {executor.submit(self._safe_size, size_func, user): i
+                           for i, user in enumerate(users)}
+                for future in as_completed(futures):
+                    sizes[futures[future]] = future.result()
+
+            order = sorted(range(len(users)), key=lambda i: sizes.get(i, 0), reverse=True)
+        else:
+            order = list(range(len(users)))
+
+        run_start = time.monotonic()
+        timeline: List[Dict[str, Any]] = []
+        timeline_lock = threading.Lock()
+
+        def run_one(index: int):
+            user = users[index]
+            entry = {
+                'user': user.get('userPrincipalName', user.get('mail', user.get('id', 'Unknown'))),
+                'size_estimate': sizes.get(index),
+                'start_offset': round(time.monotonic() - run_start, 2),
+                'start_time': datetime.now().isoformat(),
+                'status': 'completed',
+                'error': None
+            }
+            try:
+                result = backup_func(user)
+                if result:
+                    entry.update(result)
+            except Exception as e:
+                entry['status'] = 'failed'
+                entry['error'] = str(e)
+
+            entry['end_offset'] = round(time.monotonic() - run_start, 2)
+            entry['duration_seconds'] = round(entry['end_offset'] - entry['start_offset'], 2)
+            with timeline_lock:
+                timeline.append(entry)
+            return entry
+
+        with ThreadPoolExecutor(max_workers=self.max_mailboxes) as executor:
+            for index in order:
+                executor.submit(run_one, index)
+
+        timeline.sort(key=lambda entry: entry['start_offset'])
+        logger.debug(f"Scheduled {len(users)} mailboxes, {self.max_mailboxes} at a time")
+        return timeline
+
+    @staticmethod
+    def _safe_size(size_func: Callable[[Dict[str, Any]], int], user: Dict[str, Any]) -> int:
+        try:
+            return size_func(user) or 0
+        except Exception:
+            return 0
+
+
+def format_timeline(timeline: List[Dict[str, Any]]) -> List[str]:
+    """
+    Format timeline entries as log lines.
+
+    Returns:
+        One line per user: start/end offsets, duration, status and counters
+    """
+    lines = []
+    for entry in timeline:
+        counters = ', '.join(
+            f"{key}={value}" for key, value in entry.items()
+            if key not in ('user', 'size_estimate', 'start_offset', 'start_time', 'end_offset',
+                           'duration_seconds', 'status', 'error') and value is not None
+        )
+        line = (f"+{entry['start_offset']:>8.1f}s → +{entry['end_offset']:>8.1f}s "
+                f"({entry['duration_seconds']:.1f}s) {entry['status']:<9} {entry['user']}")
+        if counters:
+            line += f" [{counters}]"
+        if entry.get('error'):
+            line += f" - {entry['error']}"
+        lines.append(line)
+    return lines
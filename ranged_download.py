@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Resumable Ranged Downloads
+Downloads large Graph content with HTTP Range requests so a dropped connection
+resumes at the last received byte instead of starting over. Files are written to
+a .partial file whose progress survives between runs; very large files can be
+fetched as several ranges in parallel.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import requests
+from loguru import logger
+
+from graph_throttle import get_bandwidth_limiter
+
+# Bytes read from the network per iteration
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Files at least this large are split into parallel ranges (when enabled)
+PARALLEL_THRESHOLD = 256 * 1024 * 1024
+
+# Range progress is written to the state file after this many new bytes
+STATE_SAVE_INTERVAL = 16 * 1024 * 1024
+
+# Errors after which the download continues from the current byte
+RESUMABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+)
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+# open_range(start, end) -> streaming response for bytes start..end (end inclusive, None = to EOF)
+RangeOpener = Callable[[int, Optional[int]], Optional[requests.Response]]
+
+
+class DownloadError(Exception):
+    """Download failed in a way resuming cannot fix (HTTP error, size mismatch, retries exhausted)."""
+
+
+class SizeMismatchError(DownloadError):
+    """The server reports a different total size than the one the ranges were planned for."""
+
+
+@dataclass
+class DownloadResult:
+    """Result of a completed file download."""
+    size: int
+    sha256: str
+    resumed_bytes: int = 0  # Bytes reused from a .partial file of an earlier run
+
+
+def range_header(start: int, end: Optional[int] = None) -> Dict[str, str]:
+    """
+    Build a Range header.
+
+    Returns:
+        {'Range': 'bytes=start-end'}, or {} for the whole content
+    """
+    if start == 0 and end is None:
+        return {}
+    return {'Range': f"bytes={start}-{'' if end is None else end}"}
+
+
+def _check_response(response: requests.Response, position: int, end: Optional[int],
+                    total_size: Optional[int] = None):
+    """
+    Validate a (ranged) response.
+
+    Returns:
+        Tuple of (leading bytes to discard, expected end offset or None)
+    """
+    if response.status_code == 206:
+        match = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+        if not match:
+            return 0, None
+        if int(match.group(1)) != position:
+            raise DownloadError(f"Server returned range starting at {match.group(1)}, expected {position}")
+        if total_size is not None and match.group(3) != '*' and int(match.group(3)) != total_size:
+            raise SizeMismatchError(f"Content is {match.group(3)} bytes, expected {total_size}")
+        return 0, int(match.group(2)) + 1
+
+    if response.status_code == 200:
+        # Range ignored: the full content follows, so skip what we already have
+        expected = None
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and not response.headers.get('Content-Encoding'):
+            expected = int(length)
+        if end is not None:
+            expected = end + 1 if expected is None else min(expected, end + 1)
+        return position, expected
+
+    raise DownloadError(f"HTTP {response.status_code}")
+
+
+def iter_resumable(open_range: RangeOpener, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = DOWNLOAD_CHUNK_SIZE, max_attempts: int = 5,
+                   backoff: float = 1.0, total_size: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Yield the bytes start..end of a download, reconnecting with a Range header
+    whenever the connection drops.
+
+    Args:
+        open_range: Returns a streaming response for (start, end), or None on failure
+        start: First byte to yield
+        end: Last byte to yield (inclusive), or None for everything
+        chunk_size: Bytes per network read
+        max_attempts: Consecutive attempts without progress before giving up
+        backoff: Base delay in seconds between attempts (doubles each time)
+        total_size: Expected size of the whole content; a ranged response reporting
+                    another size raises SizeMismatchError
+
+    Raises:
+        DownloadError: On HTTP errors or when max_attempts is exhausted
+    """
+    position = start
+    last_failure = start
+    attempt = 0
+    bandwidth = get_bandwidth_limiter()
+
+    while True:
+        response = None
+        try:
+            response = open_range(position, end)
+            if response is None:
+                raise DownloadError("Request failed")
+
+            if response.status_code == 416 and position > 0:
+                return  # Nothing left to fetch
+
+            skip, expected_end = _check_response(response, position, end, total_size)
+
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+                if skip:
+                    if len(chunk) <= skip:
+                        skip -= len(chunk)
+                        continue
+                    chunk = chunk[skip:]
+                    skip = 0
+                if end is not None and position + len(chunk) > end + 1:
+                    chunk = chunk[:end + 1 - position]
+
+                position += len(chunk)
+                if bandwidth is not None:
+                    bandwidth.consume(len(chunk))
+                yield chunk
+
+                if end is not None and position > end:
+                    return
+
+            if expected_end is None or position >= expected_end:
+                return
+
+            raise requests.exceptions.ChunkedEncodingError(
+                f"Connection closed at byte {position:,} of {expected_end:,}"
+            )
+
+        except RESUMABLE_ERRORS as e:
+            # Only failures without any progress in between count towards the limit
+            if position > last_failure:
+                attempt = 0
+                last_failure = position
+            attempt += 1
+
+            if attempt >= max_attempts:
+                raise DownloadError(f"Giving up at byte {position:,} after {attempt} attempts: {str(e)}") from e
+
+            delay = min(backoff * 2 ** (attempt - 1), 30)
+            logger.warning(f"Download interrupted at byte {position:,} ({str(e)}); "
+                           f"resuming in {delay:.0f}s ({attempt}/{max_attempts - 1})")
+            time.sleep(delay)
+
+        finally:
+            if response is not None:
+                response.close()
+
+
+def _hash_file(path: Path, sha256, length: Optional[int] = None):
+    """Feed the first length bytes of path (all if None) into sha256."""
+    remaining = length
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(DOWNLOAD_CHUNK_SIZE if remaining is None else min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            sha256.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+
+
+class _PartialState:
+    """Progress of a .partial file, kept next to it as JSON."""
+
+    def __init__(self, state_path: Path, version: Optional[str], size: Optional[int]):
+        self.path = state_path
+        self.version = version
+        self.size = size
+        self.ranges: Optional[List[Dict[str, int]]] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, state_path: Path, version: Optional[str], size: Optional[int]) -> Optional['_PartialState']:
+        """Load saved progress if it belongs to the same version and size of the content."""
+        try:
+            with open(state_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get('version') != version or data.get('size') != size:
+            return None
+
+        state = cls(state_path, version, size)
+        state.ranges = data.get('ranges')
+        return state
+
+    def save(self):
+        with self._lock:
+            data: Dict[str, Any] = {'version': self.version, 'size': self.size, 'ranges': self.ranges}
+            tmp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+def download_file(open_range: RangeOpener, file_path: Path, partial_path: Optional[Path] = None,
+                  expected_size: Optional[int] = None, version: Optional[str] = None,
+                  parallel_parts: int = 1, parallel_threshold: int = PARALLEL_THRESHOLD,
+                  chunk_size: int = DOWNLOAD_CHUNK_SIZE, max_attempts: int = 5) -> DownloadResult:
+    """
+    Download to file_path through a resumable .partial file.
+
+    Progress is kept in '<partial>.json'. A later call for the same version of
+    the content continues where the previous one stopped; a different version
+    (e.g. a new eTag) starts over.
+
+    Args:
+        open_range: Returns a streaming response for (start, end), or None on failure
+        file_path: Final path; only created once the download is complete
+        partial_path: Where to keep the incomplete file (default: file_path + '.partial').
+                      Use a stable location to resume across backup sessions.
+        expected_size: Content size if known; used to plan parallel ranges. Graph sizes can
+                       differ from the content for some files, so a single-stream download
+                       keeps whatever the server sends
+        version: Content version (eTag); partial data of other versions is discarded
+        parallel_parts: Ranges fetched at once for files of at least parallel_threshold bytes
+        parallel_threshold: Minimum size for a parallel download
+        chunk_size: Bytes per network read
+        max_attempts: Consecutive attempts without progress before giving up
+
+    Returns:
+        DownloadResult with size and SHA-256 of the file
+
+    Raises:
+        DownloadError: The .partial file is kept (if still valid) for the next attempt
+    """
+    file_path = Path(file_path)
+    partial_path = Path(partial_path) if partial_path else file_path.with_name(file_path.name + '.partial')
+    partial_path.parent.mkdir(parents=True, exist_ok=True)
+    state_path = partial_path.with_name(partial_path.name + '.json')
+
+    state = _PartialState.load(state_path, version, expected_size) if partial_path.exists() else None
+    if state is None:
+        partial_path.unlink(missing_ok=True)
+        state = _PartialState(state_path, version, expected_size)
+
+    parallel = (parallel_parts > 1 and expected_size is not None and expected_size >= parallel_threshold)
+    if state.ranges is not None or parallel:
+        try:
+            resumed, sha256 = _download_ranges(open_range, partial_path, state, expected_size,
+                                               parallel_parts, chunk_size, max_attempts)
+        except SizeMismatchError as e:
+            # The planned ranges do not cover the real content; fetch it as one stream
+            logger.warning(f"{file_path.name}: {str(e)}; downloading as a single stream")
+            partial_path.unlink(missing_ok=True)
+            state.ranges = None
+            resumed, sha256 = _download_sequential(open_range, partial_path, state,
+                                                   chunk_size, max_attempts)
+    else:
+        resumed, sha256 = _download_sequential(open_range, partial_path, state,
+                                               chunk_size, max_attempts)
+
+    size = partial_path.stat().st_size
+    os.replace(partial_path, file_path)
+    state.remove()
+
+    if resumed:
+        logger.debug(f"Resumed {file_path.name} from byte {resumed:,}")
+
+    return DownloadResult(size, sha256, resumed)
+
+
+def _download_sequential(open_range: RangeOpener, partial_path: Path, state: _PartialState,
+                         chunk_size: int, max_attempts: int):
+    """Download in one stream, hashing on the way. Returns (resumed bytes, sha256 hex)."""
+    offset = partial_path.stat().st_size if partial_path.exists() else 0
+
+    sha256 = hashlib.sha256()
+    if offset:
+        # The hash state of the earlier run is gone; rebuild it from the bytes on disk
+        _hash_file(partial_path, sha256, offset)
+    else:
+        state.save()
+
+    with open(partial_path, 'r+b' if offset else 'wb') as f:
+        f.seek(offset)
+        f.truncate()
+
+        for chunk in iter_resumable(open_range, start=offset, chunk_size=chunk_size,
+                                    max_attempts=max_attempts):
+            sha256.update(chunk)
+            f.write(chunk)
+
+    return offset, sha256.hexdigest()
+
+
+def _download_ranges(open_range: RangeOpener, partial_path: Path, state: _PartialState,
+                     expected_size: int, parts: int, chunk_size: int, max_attempts: int):
+    """Download ranges in parallel into a preallocated file. Returns (resumed bytes, sha256 hex)."""
+    if state.ranges is None:
+        part_size = -(-expected_size // max(1, parts))
+        state.ranges = [
+            {'start': start, 'end': min(start + part_size, expected_size) - 1, 'done': 0}
+            for start in range(0, expected_size, part_size)
+        ]
+        with open(partial_path, 'wb') as f:
+            f.truncate(expected_size)
+        state.save()
+
+    resumed = sum(r['done'] for r in state.ranges)
+
+    def fetch(byte_range: Dict[str, int]):
+        position = byte_range['start'] + byte_range['done']
+        if position > byte_range['end']:
+            return
+
+        # 'done' only counts flushed bytes: any thread's save() may persist it,
+        # and bytes still in this thread's buffer would be holes after a crash
+        written = byte_range['done']
+        with open(partial_path, 'r+b') as f:
+            f.seek(position)
+            try:
+                for chunk in iter_resumable(open_range, start=position, end=byte_range['end'],
+                                            chunk_size=chunk_size, max_attempts=max_attempts,
+                                            total_size=expected_size):
+                    f.write(chunk)
+                    written += len(chunk)
+                    if written - byte_range['done'] >= STATE_SAVE_INTERVAL:
+                        f.flush()
+                        byte_range['done'] = written
+                        state.save()
+            finally:
+                f.flush()
+                byte_range['done'] = written
+
+    with ThreadPoolExecutor(max_workers=len(state.ranges)) as executor:
+        futures = [executor.submit(fetch, byte_range) for byte_range in state.ranges]
+        errors = [future.exception() for future in futures if future.exception()]
+
+    state.save()
+    if errors:
+        raise errors[0]
+
+    sha256 = hashlib.sha256()
+    _hash_file(partial_path, sha256)
+    return resumed, sha256.hexdigest()
@@ -23,6 +23,8 @@ Expected backup tree layout
           <drive_folder>/
             drive_metadata.json
             <files and sub-dirs …>
+          manifest.json           <- instead of files, for --dedup-store sessions
+    .blobs/                       <- content-addressed store (--dedup-store)
 
     exchange/
       <user>/
@@ -43,6 +45,12 @@ Usage examples
   # Exchange only
   python rebuild_databases.py --type exchange
 
+  # Hash with 8 processes (large trees)
+  python rebuild_databases.py --type sharepoint --jobs 8
+
+  # Nightly: only hash files added or changed since the last run
+  python rebuild_databases.py --incremental --jobs 8
+
   # Custom paths + dry-run
   python rebuild_databases.py --backup-dir /mnt/nas/backup \\
       --sharepoint-db /data/sp.db --exchange-db /data/ex.db --dry-run -v
@@ -57,9 +65,11 @@ import os
 import re
 import sys
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -76,6 +86,15 @@ _SKIP_FILENAMES = frozenset({
 
 _SKIP_SUFFIXES = frozenset({".log", ".db", ".db-wal", ".db-shm"})
 
+# Records per executemany transaction
+_BULK_BATCH_SIZE = 5000
+
+# Files queued per hashing process (bounds memory with --jobs)
+_HASH_WINDOW_PER_JOB = 64
+
+# Log hashing progress every this many files
+_PROGRESS_INTERVAL = 10000
+
 
 # ===========================================================================
 # Generic helpers
@@ -145,10 +164,118 @@ def extract_msg_id_from_stem(stem: str) -> Tuple[str, str]:
 # SharePoint rebuild
 # ===========================================================================
 
+# (path, sha256 or None, size, mtime_ns, inode, error message or None)
+HashResult = Tuple[str, Optional[str], int, int, int, Optional[str]]
+
+
+def _hash_job(path: str) -> HashResult:
+    """Stat and hash one file; runs in a worker process with --jobs."""
+    try:
+        stat_info = os.stat(path)
+        checksum = sha256_file(Path(path))
+        return path, checksum, stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ino, None
+    except OSError as exc:
+        return path, None, 0, 0, 0, str(exc)
+
+
+def hash_files(paths: Iterable[str], jobs: int = 1, cache=None) -> Iterator[HashResult]:
+    """
+    Hash files, optionally on a process pool and skipping unchanged files.
+
+    With jobs > 1 at most jobs * _HASH_WINDOW_PER_JOB files are in flight, so
+    memory stays flat however many files there are.
+
+    Args:
+        paths: Files to hash
+        jobs: Worker processes (1 hashes in this process)
+        cache: FileStatCache; files whose size, mtime and inode match an entry
+               are not read, and fresh hashes are added to it
+
+    Yields:
+        One result per path (cached results right away, hashed ones as they finish)
+    """
+    def finish(result: HashResult) -> HashResult:
+        path, checksum, size, mtime_ns, inode, error = result
+        if cache is not None and error is None:
+            cache.store(path, size, mtime_ns, inode, checksum)
+        return result
+
+    def cached(path: str) -> Optional[HashResult]:
+        if cache is None:
+            return None
+        try:
+            stat_info = os.stat(path)
+        except OSError as exc:
+            return path, None, 0, 0, 0, str(exc)
+        checksum = cache.lookup(path, stat_info)
+        if checksum is None:
+            return None
+        return path, checksum, stat_info.st_size, stat_info.st_mtime_ns, stat_info.st_ino, None
+
+    if jobs <= 1:
+        for path in paths:
+            yield cached(path) or finish(_hash_job(path))
+        return
+
+    window = jobs * _HASH_WINDOW_PER_JOB
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        in_flight: deque = deque()
+        for path in paths:
+            result = cached(path)
+            if result is not None:
+                yield result
+                continue
+            in_flight.append(pool.submit(_hash_job, path))
+            if len(in_flight) >= window:
+                yield finish(in_flight.popleft().result())
+        while in_flight:
+            yield finish(in_flight.popleft().result())
+
+
+def _hash_one(path: Path, cache=None) -> Tuple[str, int]:
+    """
+    Hash one file in this process, reusing the stat cache when given.
+
+    Returns:
+        Tuple of (sha256, size)
+    """
+    for _, checksum, size, _, _, error in hash_files([str(path)], cache=cache):
+        if error is not None:
+            raise OSError(error)
+        return checksum, size
+
+
+def _find_sharepoint_sessions(backup_root: Path) -> List[Tuple[Path, Path]]:
+    """Return (site_dir, session_dir) pairs, oldest session first."""
+    # Look in both backup_root and backup_root/sharepoint
+    sharepoint_dir = backup_root / "sharepoint"
+    search_root = sharepoint_dir if sharepoint_dir.is_dir() else backup_root
+
+    # Look for directories matching timestamp pattern YYYYMMDD_HHMMSS
+    timestamp_pattern = re.compile(r'^\d{8}_\d{6}$')
+
+    session_dirs = []
+    for site_dir in search_root.iterdir():
+        if not site_dir.is_dir():
+            continue
+        # Skip exchange directory
+        if site_dir.name == "exchange":
+            continue
+
+        for session_dir in site_dir.iterdir():
+            if session_dir.is_dir() and timestamp_pattern.match(session_dir.name):
+                session_dirs.append((site_dir, session_dir))
+
+    session_dirs.sort(key=lambda x: x[1].name)
+    return session_dirs
+
+
 def rebuild_sharepoint_db(
     backup_root: Path,
     db_path: str,
     dry_run: bool = False,
+    jobs: int = 1,
+    incremental: bool = False,
 ) -> Dict[str, Any]:
     """
     Walk *backup_root* looking for backup sessions, then index every content file
@@ -159,69 +286,66 @@ def rebuild_sharepoint_db(
     Otherwise, site information is inferred from directory structure.
 
     Only the **most recent session** for each ``(site_id, relative_path)``
-    pair ends up in the DB – older sessions are processed first and the later
-    upsert wins automatically.
+    pair ends up in the DB.  A first pass over all sessions (oldest first, no
+    hashing) works out which copy that is; only those copies are hashed, and
+    each path is written once, in large executemany transactions.
+
+    Sessions written with the blob store hold a manifest.json instead of files;
+    their records are taken from the manifest (which keeps the eTag) after
+    checking that each blob exists, under the same session-relative path as
+    files on disk.
+
+    Args:
+        jobs: Worker processes for hashing (1 hashes in this process)
+        incremental: Reuse the hashes of files whose size, mtime and inode are
+                     unchanged since the last run (stat cache kept in the database)
     """
-    from checksum_db import BackupChecksumDB      # lazy import
+    from checksum_db import BackupChecksumDB, FileStatCache      # lazy import
+    from blob_store import find_blob_store, SessionManifest, MANIFEST_NAME     # lazy import
 
     stats: Dict[str, Any] = {
         "sites_found":      0,
         "sessions_found":   0,
         "files_scanned":    0,
+        "files_superseded": 0,
+        "files_hashed":     0,
+        "files_cached":     0,
         "files_written":    0,
         "files_skipped":    0,
         "files_errors":     0,
         "total_bytes":      0,
     }
 
-    db = None if dry_run else BackupChecksumDB(db_path)
-
-    # Find all potential session directories (directories with timestamp names)
-    # Look in both backup_root and backup_root/sharepoint
-    session_dirs = []
-    
-    # First, check if there's a sharepoint subdirectory
-    sharepoint_dir = backup_root / "sharepoint"
-    if sharepoint_dir.is_dir():
-        search_root = sharepoint_dir
-    else:
-        search_root = backup_root
-    
-    # Look for directories matching timestamp pattern YYYYMMDD_HHMMSS
-    timestamp_pattern = re.compile(r'^\d{8}_\d{6}$')
-    
-    for site_dir in search_root.iterdir():
-        if not site_dir.is_dir():
-            continue
-        # Skip exchange directory
-        if site_dir.name == "exchange":
-            continue
-            
-        for session_dir in site_dir.iterdir():
-            if not session_dir.is_dir():
-                continue
-            if timestamp_pattern.match(session_dir.name):
-                session_dirs.append((site_dir, session_dir))
-    
+    # Absolute paths keep stat cache keys stable across working directories
+    backup_root = Path(backup_root).resolve()
+    session_dirs = _find_sharepoint_sessions(backup_root)
     if not session_dirs:
         logger.warning(f"No backup sessions found under {backup_root}")
         logger.warning("Expected structure: <backup_dir>/<site_name>/<YYYYMMDD_HHMMSS>/")
         return stats
-    
-    # Sort by session directory name (timestamp) so older sessions are processed first
-    session_dirs.sort(key=lambda x: x[1].name)
-    
-    # Track sites we've seen
+
+    # ------------------------------------------------------------------
+    # Pass 1 – final state: later sessions replace earlier candidates.
+    #   (site_id, file_path) -> ("file", site_id, abs_path)
+    #                         | ("blob", site_id, rel_path, entry, store)
+    # ------------------------------------------------------------------
+    final: Dict[Tuple[str, str], Tuple] = {}
     sites_seen = set()
-    
+
+    def add_candidate(key: Tuple[str, str], candidate: Tuple) -> None:
+        stats["files_scanned"] += 1
+        if key in final:
+            stats["files_superseded"] += 1
+        final[key] = candidate
+
     for site_dir, session_dir in session_dirs:
         site_name = site_dir.name
         timestamp = session_dir.name
-        
+
         # Try to read site_metadata.json if it exists
         meta_path = session_dir / "site_metadata.json"
         site_id = f"inferred:{site_name}"
-        
+
         if meta_path.is_file():
             try:
                 with open(meta_path, encoding="utf-8") as fh:
@@ -233,51 +357,111 @@ def rebuild_sharepoint_db(
                     site_name = site_name_from_meta
             except Exception as exc:
                 logger.warning(f"  Could not read {meta_path}: {exc}")
-        
+
         stats["sessions_found"] += 1
         if site_name not in sites_seen:
             stats["sites_found"] += 1
             sites_seen.add(site_name)
-        
+
         logger.info(f"  Session: {site_name}  [{timestamp}]  site_id={site_id[:40]}…")
 
-        for abs_path in sorted(session_dir.rglob("*")):
-            if not abs_path.is_file():
-                continue
-            if abs_path.name in _SKIP_FILENAMES:
-                continue
-            if abs_path.suffix.lower() in _SKIP_SUFFIXES:
+        manifest_path = session_dir / MANIFEST_NAME
+        if manifest_path.is_file():
+            try:
+                manifest = SessionManifest.load(manifest_path)
+            except Exception as exc:
+                logger.error(f"    Could not read {manifest_path}: {exc}")
+                stats["files_errors"] += 1
                 continue
 
-            stats["files_scanned"] += 1
+            store = find_blob_store(session_dir)
+            for rel_path, entry in manifest.files.items():
+                # Keyed like the on-disk walk below, so a blob-store session and a
+                # plain session of the same site supersede each other's copies
+                file_path = "/" + rel_path
+                add_candidate((site_id, file_path), ("blob", site_id, rel_path, entry, store))
+            continue
 
-            try:
-                checksum      = sha256_file(abs_path)
-                stat_info     = abs_path.stat()
-                file_size     = stat_info.st_size
-                last_modified = datetime.fromtimestamp(stat_info.st_mtime).isoformat()
+        for dirpath, _, filenames in os.walk(session_dir):
+            for filename in filenames:
+                if filename in _SKIP_FILENAMES:
+                    continue
+                if os.path.splitext(filename)[1].lower() in _SKIP_SUFFIXES:
+                    continue
 
+                abs_path = os.path.join(dirpath, filename)
                 # Relative path within this session, e.g. /Documents/Reports/Q1.xlsx
-                rel_path = "/" + str(abs_path.relative_to(session_dir)).replace(os.sep, "/")
+                rel_path = "/" + os.path.relpath(abs_path, session_dir).replace(os.sep, "/")
+                add_candidate((site_id, rel_path), ("file", site_id, abs_path))
 
-                logger.debug(f"    {rel_path}  {checksum[:12]}…  {human_size(file_size)}")
+    logger.info(f"  {len(final):,} distinct files in {stats['sessions_found']} sessions "
+                f"({stats['files_superseded']:,} older copies not hashed)")
 
-                if not dry_run:
-                    db.update_file_record(
-                        site_id       = site_id,
-                        file_path     = rel_path,
-                        file_name     = abs_path.name,
-                        file_size     = file_size,
-                        last_modified = last_modified,
-                        checksum      = checksum,
-                    )
+    # ------------------------------------------------------------------
+    # Pass 2 – hash the winning copies and write each path once.
+    # ------------------------------------------------------------------
+    db = None if dry_run else BackupChecksumDB(db_path, persistent=True)
+    cache = FileStatCache(db_path, readonly=dry_run) if incremental else None
+    batch: List[Tuple] = []
+
+    def emit(record: Tuple) -> None:
+        stats["files_written"] += 1
+        stats["total_bytes"]   += record[3]
+        if db is not None:
+            batch.append(record)
+            if len(batch) >= _BULK_BATCH_SIZE:
+                db.bulk_upsert_file_records(batch)
+                batch.clear()
 
-                stats["files_written"] += 1
-                stats["total_bytes"]   += file_size
+    try:
+        disk_files: Dict[str, Tuple[str, str]] = {}     # abs_path -> (site_id, file_path)
+        for (_, file_path), candidate in final.items():
+            if candidate[0] == "file":
+                disk_files[candidate[2]] = (candidate[1], file_path)
+                continue
 
-            except Exception as exc:
-                logger.error(f"    Error processing {abs_path}: {exc}")
+            _, site_id, rel_path, entry, store = candidate
+            if store is None or entry["sha256"] not in store:
+                logger.error(f"    Blob missing for {rel_path}  {entry['sha256'][:12]}…")
                 stats["files_errors"] += 1
+                continue
+
+            logger.debug(f"    {rel_path}  {entry['sha256'][:12]}…  {human_size(entry['size'])}")
+            emit((site_id, file_path, rel_path.rsplit("/", 1)[-1], entry["size"],
+                  entry.get("last_modified", ""), entry["sha256"], entry.get("eTag"), entry.get("cTag")))
+
+        if disk_files:
+            logger.info(f"  Hashing {len(disk_files):,} files"
+                        f"{f' with {jobs} processes' if jobs > 1 else ''}…")
+
+        hashed = 0
+        # Sorted so files of one directory are read together
+        for abs_path, checksum, file_size, mtime_ns, _, error in hash_files(sorted(disk_files), jobs, cache):
+            hashed += 1
+            if error is not None:
+                logger.error(f"    Error processing {abs_path}: {error}")
+                stats["files_errors"] += 1
+                continue
+
+            site_id, file_path = disk_files[abs_path]
+            logger.debug(f"    {file_path}  {checksum[:12]}…  {human_size(file_size)}")
+            emit((site_id, file_path, os.path.basename(abs_path), file_size,
+                  datetime.fromtimestamp(mtime_ns / 1e9).isoformat(), checksum, None, None))
+
+            if hashed % _PROGRESS_INTERVAL == 0:
+                logger.info(f"    Hashed {hashed:,}/{len(disk_files):,} files "
+                            f"({human_size(stats['total_bytes'])})")
+
+        if db is not None and batch:
+            db.bulk_upsert_file_records(batch)
+
+        if cache is not None:
+            stats["files_cached"] = cache.hits
+            cache.save()
+        stats["files_hashed"] = len(disk_files) - stats["files_cached"]
+    finally:
+        if db is not None:
+            db.close()
 
     return stats
 
@@ -346,6 +530,7 @@ def rebuild_exchange_db(
     backup_root: Path,
     db_path: str,
     dry_run: bool = False,
+    incremental: bool = False,
 ) -> Dict[str, Any]:
     """
     Walk ``<backup_root>/exchange/`` and index every .eml / .json email file
@@ -366,10 +551,15 @@ def rebuild_exchange_db(
     parsing.  User email addresses are resolved from ``user_metadata.json``
     where available; a pre-scan builds a ``short_name → email`` map from all
     new-layout sessions so old-layout entries receive correct full emails.
+
+    With *incremental*, files whose size, mtime and inode are unchanged since
+    the last run are not re-hashed (stat cache kept in the database).
     """
     from exchange_checksum_db import ExchangeChecksumDB     # lazy import
+    from checksum_db import FileStatCache                   # lazy import
 
-    exchange_dir = backup_root / "exchange"
+    # Absolute paths keep stat cache keys stable across working directories
+    exchange_dir = Path(backup_root).resolve() / "exchange"
     if not exchange_dir.is_dir():
         logger.warning(
             f"Exchange backup directory not found: {exchange_dir}\n"
@@ -384,10 +574,12 @@ def rebuild_exchange_db(
         "messages_written": 0,
         "messages_skipped": 0,
         "messages_errors":  0,
+        "messages_cached":  0,
         "total_bytes":      0,
     }
 
     db = None if dry_run else ExchangeChecksumDB(db_path)
+    cache = FileStatCache(db_path, readonly=dry_run) if incremental else None
 
     # ------------------------------------------------------------------
     # Phase 0 – build short_name → full_email map from all user_metadata.json
@@ -468,8 +660,7 @@ def rebuild_exchange_db(
                     received_date = hdrs.get("received_date", "")
                     _, message_id = extract_msg_id_from_stem(stem)
 
-                checksum    = sha256_file(primary_file)
-                file_size   = primary_file.stat().st_size
+                checksum, file_size = _hash_one(primary_file, cache)
                 backup_path = str(primary_file.parent)
 
                 logger.debug(
@@ -596,6 +787,10 @@ def rebuild_exchange_db(
 
                 _write_messages(messages, user_email)
 
+    if cache is not None:
+        stats["messages_cached"] = cache.hits
+        cache.save()
+
     return stats
 
 
@@ -626,6 +821,15 @@ def main() -> None:
         "--exchange-db", default="backup_checksums_exchange.db", metavar="FILE",
         help="Exchange checksum DB path (default: backup_checksums_exchange.db)",
     )
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=1, metavar="N",
+        help="Processes hashing SharePoint files in parallel (default: 1)",
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Only hash files that are new or changed since the last run "
+             "(size, mtime and inode are cached in the database)",
+    )
     parser.add_argument(
         "--dry-run", action="store_true",
         help="Scan and compute checksums but do NOT write to any database",
@@ -691,6 +895,8 @@ def main() -> None:
             backup_root  = backup_root,
             db_path      = args.sharepoint_db,
             dry_run      = args.dry_run,
+            jobs         = max(1, args.jobs),
+            incremental  = args.incremental,
         )
 
         logger.info("")
@@ -713,6 +919,7 @@ def main() -> None:
             backup_root = backup_root,
             db_path     = args.exchange_db,
             dry_run     = args.dry_run,
+            incremental = args.incremental,
         )
 
         logger.info("")
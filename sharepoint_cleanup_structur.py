@@ -6,8 +6,21 @@ This script consolidates multiple timestamped backup directories into a single
 consolidated timestamp directory (format: consolidated_YYYYMMDD_HHMMSS), 
 keeping only the newest versions of files.
 
+Sessions written with the blob store (--dedup-store) only hold a manifest.json;
+they are consolidated by merging manifests, without copying any file contents.
+
+With --link-mode the consolidated files share storage with the sessions instead
+of being copied (hard links, or reflinks / copy_file_range where the filesystem
+supports them), and --move renames files out of sessions that --cleanup-old is
+about to remove.
+
+Each site is consolidated from a plan: all sessions are scanned in parallel with
+os.scandir into a path -> newest-session index, which is then carried out on a
+thread pool. --dry-run reports the bytes the plan would write and free.
+
 Usage:
     python3 sharepoint_cleanup_structur.py [--root-dir ROOT_DIR] [--dry-run] [--verbose]
+                                           [--link-mode MODE] [--cleanup-old [--move]] [--workers N]
 
 Example:
     python3 sharepoint_cleanup_structur.py --root-dir BACKUP/sundbusserne/sharepoint --dry-run
@@ -15,13 +28,24 @@ Example:
 
 import os
 import sys
+import errno
 import argparse
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Set, Tuple
+from typing import List, Dict, Optional, Set, Tuple
 import re
 
+from blob_store import SessionManifest, open_blob_store, BLOB_DIR_NAME, MANIFEST_NAME
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False     # Windows: no reflinks
+
 # Configure logging
 import logging
 
@@ -31,6 +55,87 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Linux FICLONE ioctl: share the source's extents (Btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+
+# Ways of placing a file in the consolidated directory, in the order 'auto' tries them
+PLACE_METHODS = ('hardlink', 'reflink', 'copy_range', 'copy')
+
+# --link-mode choice -> methods tried in order
+LINK_MODES = {
+    'copy': ('copy',),
+    'auto': PLACE_METHODS,
+    'hardlink': ('hardlink', 'copy'),
+    'reflink': ('reflink', 'copy_range', 'copy'),
+}
+
+# Errors meaning the filesystem cannot use a method at all (as opposed to this one file)
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY,
+                       errno.EINVAL, errno.ENOSYS, errno.EBADF}
+
+# Default threads for scanning sessions and placing files
+DEFAULT_WORKERS = 8
+
+# Files placed per thread-pool task
+_PLACE_BATCH_SIZE = 256
+
+
+def _scan_tree(top: str, prefix: str) -> Tuple[List[Tuple[str, int]], int]:
+    """
+    List every file below a directory with os.scandir.
+    
+    Args:
+        top: Directory to scan
+        prefix: Relative path of top within its session, ending in '/'
+    
+    Returns:
+        Tuple of ([(relative '/'-separated path, size), ...], directories that could not be read)
+    """
+    found: List[Tuple[str, int]] = []
+    failed = 0
+    stack = [(top, prefix)]
+    
+    while stack:
+        path, rel_dir = stack.pop()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, rel_dir + entry.name + '/'))
+                    elif entry.is_file():
+                        found.append((rel_dir + entry.name, entry.stat().st_size))
+        except OSError as e:
+            logger.warning(f"Could not scan {path}: {e}")
+            failed += 1
+    
+    return found, failed
+
+
+def _reflink(src_file: Path, dst_file: Path):
+    """Clone src_file into dst_file with the FICLONE ioctl (raises OSError if unsupported)."""
+    if not FCNTL_AVAILABLE:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform")
+
+    with open(src_file, 'rb') as src, open(dst_file, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _copy_range(src_file: Path, dst_file: Path):
+    """
+    Copy with os.copy_file_range, which stays in the kernel and lets the
+    filesystem share blocks or copy server-side (NFS 4.2, SMB).
+    """
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, "copy_file_range is not available")
+
+    with open(src_file, 'rb') as src, open(dst_file, 'wb') as dst:
+        remaining = os.fstat(src.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(src.fileno(), dst.fileno(), min(remaining, 1 << 30))
+            if copied == 0:
+                break
+            remaining -= copied
+
 
 class SharePointBackupCleanup:
     """Cleanup and consolidate SharePoint backup directories."""
@@ -38,7 +143,8 @@ class SharePointBackupCleanup:
     # Regex pattern to match timestamp directories (YYYYMMDD_HHMMSS)
     TIMESTAMP_PATTERN = re.compile(r'^\d{8}_\d{6}$')
     
-    def __init__(self, root_dir: Path, dry_run: bool = False, verbose: bool = False):
+    def __init__(self, root_dir: Path, dry_run: bool = False, verbose: bool = False,
+                 link_mode: str = 'copy', move: bool = False, workers: int = DEFAULT_WORKERS):
         """
         Initialize the cleanup utility.
         
@@ -46,10 +152,26 @@ class SharePointBackupCleanup:
             root_dir: Root directory containing SharePoint backup structure
             dry_run: If True, only show what would be done without making changes
             verbose: If True, show detailed progress information
+            link_mode: How files are placed in the consolidated directory (see LINK_MODES);
+                       anything but 'copy' shares storage with the session files
+            move: Rename files out of sessions that run(cleanup_old=True) will remove
+            workers: Threads scanning sessions and placing files
         """
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode: {link_mode}")
+        
         self.root_dir = Path(root_dir).resolve()
         self.dry_run = dry_run
         self.verbose = verbose
+        self.link_mode = link_mode
+        self.move = move
+        self.workers = max(1, workers)
+        
+        # Methods the filesystem turned out not to support; not tried again
+        self._unsupported: Set[str] = set()
+        
+        # Placement threads update the statistics concurrently
+        self._stats_lock = threading.Lock()
         
         if verbose:
             logger.setLevel(logging.DEBUG)
@@ -59,7 +181,18 @@ class SharePointBackupCleanup:
             'sites_processed': 0,
             'timestamp_dirs_found': 0,
             'files_copied': 0,
+            'files_hardlinked': 0,
+            'files_reflinked': 0,
+            'files_moved': 0,
+            'bytes_copied': 0,
+            'bytes_shared': 0,
+            'files_superseded': 0,
+            'bytes_superseded': 0,
+            'bytes_reclaimed': 0,
             'files_skipped': 0,
+            'manifest_entries_merged': 0,
+            'blobs_removed': 0,
+            'blob_bytes_freed': 0,
             'directories_created': 0,
             'old_dirs_removed': 0,
             'errors': 0
@@ -69,6 +202,8 @@ class SharePointBackupCleanup:
         logger.info(f"Root directory: {self.root_dir}")
         logger.info(f"Dry run: {dry_run}")
         logger.info(f"Verbose: {verbose}")
+        logger.info(f"Link mode: {link_mode}{' (moving from removed sessions)' if move else ''}")
+        logger.info(f"Workers: {self.workers}")
     
     def is_timestamp_directory(self, dir_name: str) -> bool:
         """Check if a directory name matches the timestamp pattern."""
@@ -159,31 +294,189 @@ class SharePointBackupCleanup:
             logger.warning(f"Could not compare file timestamps: {e}")
             return True  # Copy if we can't determine
     
-    def copy_file(self, src_file: Path, dst_file: Path) -> bool:
-        """Copy a file with proper error handling."""
+    def copy_file(self, src_file: Path, dst_file: Path, move: bool = False,
+                  size: Optional[int] = None) -> Optional[str]:
+        """
+        Place a file in the consolidated directory.
+        
+        Args:
+            src_file: Newest version of the file in a session directory
+            dst_file: Path in the consolidated directory
+            move: Rename instead (the source session is about to be removed)
+            size: Size of src_file if already known (saves a stat)
+        
+        Returns:
+            Method used ('move', 'hardlink', 'reflink', 'copy_range' or 'copy'), or None on failure
+        """
         try:
-            # Create parent directories if they don't exist
-            dst_file.parent.mkdir(parents=True, exist_ok=True)
+            if size is None:
+                size = src_file.stat().st_size
             
             if self.dry_run:
-                logger.debug(f"Would copy: {src_file} -> {dst_file}")
-                self.stats['files_copied'] += 1
-                return True
+                method = 'move' if move else self._next_method()
+                logger.debug(f"Would {method}: {src_file} -> {dst_file}")
+                self._count_placed(method, size)
+                return method
             
-            # Copy the file
-            shutil.copy2(src_file, dst_file)
-            logger.debug(f"Copied: {src_file} -> {dst_file}")
-            self.stats['files_copied'] += 1
-            self.stats['directories_created'] += 1 if not dst_file.parent.exists() else 0
-            return True
+            # Create parent directories if they don't exist
+            self._make_dirs(dst_file.parent)
+            
+            if move:
+                try:
+                    os.replace(src_file, dst_file)
+                    logger.debug(f"Moved: {src_file} -> {dst_file}")
+                    self._count_placed('move', size)
+                    return 'move'
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    # Different filesystem: fall through to linking/copying
+            
+            method = self._place(src_file, dst_file)
+            logger.debug(f"{method.capitalize()}: {src_file} -> {dst_file}")
+            self._count_placed(method, size)
+            return method
             
         except (OSError, IOError, shutil.Error) as e:
             logger.error(f"Failed to copy {src_file} to {dst_file}: {e}")
-            self.stats['errors'] += 1
-            return False
+            self._add_stats(errors=1)
+            return None
+    
+    def _next_method(self) -> str:
+        """First method of the link mode that is not known to be unsupported."""
+        for method in LINK_MODES[self.link_mode]:
+            if method not in self._unsupported:
+                return method
+        return 'copy'
+    
+    def _place(self, src_file: Path, dst_file: Path) -> str:
+        """
+        Create dst_file with src_file's content, trying the link mode's methods in order.
+        
+        The file is built under a temporary name and renamed over dst_file, so an
+        existing older file is replaced atomically (os.link cannot overwrite).
+        
+        Returns:
+            Name of the method that succeeded
+        """
+        tmp_file = dst_file.with_name(dst_file.name + '.consolidating')
+        methods = [m for m in LINK_MODES[self.link_mode] if m not in self._unsupported] or ['copy']
+        
+        for method in methods:
+            try:
+                if tmp_file.exists() or tmp_file.is_symlink():
+                    tmp_file.unlink()
+                
+                if method == 'hardlink':
+                    os.link(src_file, tmp_file)
+                elif method == 'reflink':
+                    _reflink(src_file, tmp_file)
+                    shutil.copystat(src_file, tmp_file)
+                elif method == 'copy_range':
+                    _copy_range(src_file, tmp_file)
+                    shutil.copystat(src_file, tmp_file)
+                else:
+                    shutil.copy2(src_file, tmp_file)
+                
+                os.replace(tmp_file, dst_file)
+                return method
+            
+            except OSError as e:
+                if method == 'copy':
+                    if tmp_file.exists():
+                        tmp_file.unlink()
+                    raise
+                if e.errno in _UNSUPPORTED_ERRNOS and method not in self._unsupported:
+                    self._unsupported.add(method)
+                    logger.info(f"  {method} is not supported here ({e.strerror}), not trying it again")
+                else:
+                    # e.g. EMLINK (too many links to this inode): only this file falls back
+                    logger.debug(f"  {method} failed for {src_file}: {e}")
+        
+        raise OSError(f"No placement method left for {src_file}")
+    
+    def _make_dirs(self, directory: Path):
+        """Create a directory and its missing parents, counting the ones created."""
+        missing = []
+        while not directory.is_dir():
+            missing.append(directory)
+            directory = directory.parent
+        
+        created = 0
+        for path in reversed(missing):
+            try:
+                path.mkdir()
+                created += 1
+            except FileExistsError:
+                pass  # Created by another worker in the meantime
+        
+        if created:
+            self._add_stats(directories_created=created)
+    
+    def _add_stats(self, **counts: int):
+        """Add to several statistics at once (thread-safe)."""
+        with self._stats_lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+    
+    def _count_placed(self, method: str, size: int):
+        """Update the statistics for one placed file."""
+        if method == 'hardlink':
+            self._add_stats(files_hardlinked=1, bytes_shared=size)
+        elif method == 'reflink':
+            self._add_stats(files_reflinked=1, bytes_shared=size)
+        elif method == 'move':
+            self._add_stats(files_moved=1, bytes_shared=size)
+        else:
+            # copy_file_range may share blocks too, but that is invisible from here
+            self._add_stats(files_copied=1, bytes_copied=size)
+    
+    def scan_sessions(self, session_dirs: List[Path]) -> List[List[Tuple[str, int]]]:
+        """
+        List the files of several sessions in parallel.
+        
+        Every top-level directory of every session is one scan task, so a single
+        large session is spread over the workers too. The top-level manifest.json
+        is left out (it is merged, not copied).
+        
+        Returns:
+            One [(relative path, size), ...] list per session, in the given order
+        """
+        results: List[List[Tuple[str, int]]] = [[] for _ in session_dirs]
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            tasks = []
+            for index, session_dir in enumerate(session_dirs):
+                try:
+                    with os.scandir(session_dir) as entries:
+                        for entry in entries:
+                            if entry.is_dir(follow_symlinks=False):
+                                tasks.append((index, pool.submit(_scan_tree, entry.path, entry.name + '/')))
+                            elif entry.is_file() and entry.name != MANIFEST_NAME:
+                                results[index].append((entry.name, entry.stat().st_size))
+                except OSError as e:
+                    logger.error(f"Could not scan {session_dir}: {e}")
+                    self.stats['errors'] += 1
+            
+            for index, task in tasks:
+                found, failed = task.result()
+                results[index].extend(found)
+                self.stats['errors'] += failed
+        
+        return results
     
-    def process_site_directory(self, site_dir: Path):
-        """Process a single site directory, consolidating timestamped backups."""
+    def process_site_directory(self, site_dir: Path, removable_dirs: Set[Path] = frozenset()):
+        """
+        Process a single site directory, consolidating timestamped backups.
+        
+        Builds a plan first (which session provides each path), then carries it out.
+        
+        Args:
+            site_dir: Site directory holding timestamp directories
+            removable_dirs: Sessions that will be removed afterwards; used for the
+                            reclaimed-space estimate, and with move=True their files
+                            are renamed into the consolidated directory
+        """
         site_name = site_dir.name
         logger.info(f"Processing site: {site_name}")
         
@@ -195,59 +488,87 @@ class SharePointBackupCleanup:
             return
         
         self.stats['timestamp_dirs_found'] += len(timestamp_dirs)
+        session_dirs = [d for _, d in timestamp_dirs]
         
         # Determine target directory name
         # Use a consolidated timestamp directory name instead of "master"
         # Format: consolidated_YYYYMMDD_HHMMSS (using current time)
-        from datetime import datetime
         consolidated_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         target_dir_name = f"consolidated_{consolidated_timestamp}"
         target_dir = site_dir / target_dir_name
+        target_existed = target_dir.is_dir()
         
         logger.info(f"  Found {len(timestamp_dirs)} timestamp directories")
         logger.info(f"  Consolidating into: {target_dir}")
         
+        # Blob store sessions: newest entry per path wins, no file contents are copied
+        merged = SessionManifest({
+            'site_name': site_name,
+            'consolidated_from': [d.name for d in session_dirs],
+            'backup_date': datetime.now().isoformat()
+        })
+        
+        # Plan: relative path -> (index of the newest session holding it, size)
+        plan: Dict[str, Tuple[int, int]] = {}
+        session_bytes = [0] * len(session_dirs)
+        superseded = 0
+        superseded_bytes = 0
+        scanned = self.scan_sessions(session_dirs)
+        
+        # Sessions are merged from newest to oldest; the first one to provide a path wins
+        for index, (session_dir, files) in enumerate(zip(session_dirs, scanned)):
+            manifest_path = session_dir / MANIFEST_NAME
+            if manifest_path.is_file():
+                self.merge_manifest(manifest_path, merged, plan)
+            
+            for rel_path, size in files:
+                session_bytes[index] += size
+                if rel_path in plan or rel_path in merged.files:
+                    superseded += 1
+                    superseded_bytes += size
+                    continue
+                plan[rel_path] = (index, size)
+        
+        # Only a target left over from an earlier run can hold newer files already
+        if target_existed:
+            for rel_path, (index, _) in list(plan.items()):
+                if not self.should_process_file(session_dirs[index] / rel_path, target_dir / rel_path):
+                    del plan[rel_path]
+                    self.stats['files_skipped'] += 1
+        
+        self.stats['files_skipped'] += superseded
+        self.stats['files_superseded'] += superseded
+        self.stats['bytes_superseded'] += superseded_bytes
+        
+        planned_bytes = sum(size for _, size in plan.values())
+        logger.info(f"  Plan: {len(plan):,} files ({planned_bytes:,} bytes), "
+                    f"{superseded:,} older versions superseded ({superseded_bytes:,} bytes)")
+        
         if self.dry_run:
-            logger.info(f"  Dry run: Would create {target_dir} and copy newest files")
+            logger.info(f"  Dry run: Would create {target_dir} and {'copy' if self.link_mode == 'copy' else 'link'} newest files")
         else:
             # Create target directory if it doesn't exist
             target_dir.mkdir(exist_ok=True)
         
-        # Track which files we've already copied (to avoid overwriting with older versions)
-        copied_files: Set[Path] = set()
+        kept_bytes = self.execute_plan(plan, session_dirs, target_dir, removable_dirs)
         
-        # Process directories from newest to oldest
-        for timestamp, timestamp_dir in timestamp_dirs:
-            logger.info(f"  Processing backup from {timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
-            
-            # Walk through all files in this timestamp directory
-            for root, dirs, files in os.walk(timestamp_dir):
-                root_path = Path(root)
-                
-                for file_name in files:
-                    src_file = root_path / file_name
-                    
-                    # Calculate relative path from timestamp directory
-                    rel_path = src_file.relative_to(timestamp_dir)
-                    
-                    # Calculate destination path in target directory
-                    dst_file = target_dir / rel_path
-                    
-                    # Skip if we've already copied a newer version of this file
-                    if dst_file in copied_files:
-                        if self.verbose:
-                            logger.debug(f"    Skipping (already copied newer version): {rel_path}")
-                        self.stats['files_skipped'] += 1
-                        continue
-                    
-                    # Check if we should copy this file
-                    if self.should_process_file(src_file, dst_file):
-                        if self.copy_file(src_file, dst_file):
-                            copied_files.add(dst_file)
-                    else:
-                        if self.verbose:
-                            logger.debug(f"    Skipping (older version): {rel_path}")
-                        self.stats['files_skipped'] += 1
+        # Space freed once removable sessions are deleted, except what the
+        # consolidated directory still shares (hard links, reflinks, moves).
+        # Files that were already hard-linked elsewhere count as freed too.
+        if removable_dirs:
+            removed_bytes = sum(size for session_dir, size in zip(session_dirs, session_bytes)
+                                if session_dir in removable_dirs)
+            reclaimed = max(0, removed_bytes - kept_bytes)
+            self.stats['bytes_reclaimed'] += reclaimed
+            logger.info(f"  {'Would free' if self.dry_run else 'Frees'} about {reclaimed:,} bytes "
+                        f"when old directories are removed")
+        
+        if len(merged):
+            if self.dry_run:
+                logger.info(f"  Dry run: Would write {MANIFEST_NAME} with {len(merged)} entries")
+            else:
+                merged.save(target_dir / MANIFEST_NAME)
+                logger.info(f"  Wrote {MANIFEST_NAME} with {len(merged)} entries")
         
         # After consolidating files, we could optionally remove old timestamp directories
         # For safety, we'll leave them in place unless explicitly requested
@@ -255,6 +576,103 @@ class SharePointBackupCleanup:
         self.stats['sites_processed'] += 1
         logger.info(f"  Completed processing {site_name}")
     
+    def execute_plan(self, plan: Dict[str, Tuple[int, int]], session_dirs: List[Path],
+                     target_dir: Path, removable_dirs: Set[Path] = frozenset()) -> int:
+        """
+        Place the planned files in the target directory on a thread pool.
+        
+        Args:
+            plan: Relative path -> (index into session_dirs, size)
+            session_dirs: Session directories, newest first
+            target_dir: Consolidated directory
+            removable_dirs: Sessions that will be removed afterwards
+        
+        Returns:
+            Bytes taken from removable sessions without copying (still in use after removal)
+        """
+        # Files of one session and directory stay together, which keeps lookups local
+        items = sorted(plan.items(), key=lambda item: (item[1][0], item[0]))
+        kept_bytes = 0
+        
+        def place_batch(batch) -> int:
+            kept = 0
+            for rel_path, (index, size) in batch:
+                session_dir = session_dirs[index]
+                removable = session_dir in removable_dirs
+                method = self.copy_file(session_dir / rel_path, target_dir / rel_path,
+                                        move=self.move and removable, size=size)
+                if removable and method in ('hardlink', 'reflink', 'move'):
+                    kept += size
+            return kept
+        
+        batches = [items[i:i + _PLACE_BATCH_SIZE] for i in range(0, len(items), _PLACE_BATCH_SIZE)]
+        if self.workers == 1 or len(batches) <= 1:
+            for batch in batches:
+                kept_bytes += place_batch(batch)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for kept in pool.map(place_batch, batches):
+                    kept_bytes += kept
+        
+        return kept_bytes
+    
+    def merge_manifest(self, manifest_path: Path, merged: SessionManifest,
+                       planned: Dict[str, Tuple[int, int]]):
+        """
+        Merge an (older) session manifest into the consolidated manifest.
+        
+        Entries for paths that a newer session already provided, as a manifest
+        entry or as a planned file, are skipped.
+        """
+        try:
+            manifest = SessionManifest.load(manifest_path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read {manifest_path}: {e}")
+            self.stats['errors'] += 1
+            return
+        
+        for rel_path, entry in manifest.files.items():
+            if rel_path in merged.files or rel_path in planned:
+                self.stats['files_skipped'] += 1
+                continue
+            merged.files[rel_path] = entry
+            self.stats['manifest_entries_merged'] += 1
+    
+    def collect_blob_garbage(self, grace_hours: float = 24):
+        """
+        Delete blobs that no remaining manifest refers to.
+        
+        Only runs when the root directory holds the blob store. Every session of
+        every site counts, including consolidated ones. Blobs younger than
+        grace_hours are kept so a running backup cannot lose files.
+        """
+        store_dir = self.root_dir / BLOB_DIR_NAME
+        if not store_dir.is_dir():
+            return
+        
+        referenced: Set[str] = set()
+        site_dirs = [self.root_dir] + [item for item in self.root_dir.iterdir() if item.is_dir()]
+        for site_dir in site_dirs:
+            for session_dir in site_dir.iterdir():
+                manifest_path = session_dir / MANIFEST_NAME
+                if not manifest_path.is_file():
+                    continue
+                try:
+                    referenced |= SessionManifest.load(manifest_path).hashes()
+                except (OSError, ValueError) as e:
+                    # Without every manifest we cannot tell which blobs are unused
+                    logger.error(f"Skipping blob garbage collection, could not read {manifest_path}: {e}")
+                    self.stats['errors'] += 1
+                    return
+        
+        removed, freed = open_blob_store(store_dir).collect_garbage(
+            referenced, grace_seconds=grace_hours * 3600, dry_run=self.dry_run
+        )
+        self.stats['blobs_removed'] += removed
+        self.stats['blob_bytes_freed'] += freed
+        logger.info(f"{'Would remove' if self.dry_run else 'Removed'} {removed} unreferenced blobs "
+                    f"({freed:,} bytes)")
+    
     def cleanup_old_directories(self, site_dir: Path, keep_newest: int = 1):
         """
         Remove old timestamp directories after consolidation.
@@ -304,7 +722,11 @@ class SharePointBackupCleanup:
             # Process each site directory
             for site_dir in site_dirs:
                 try:
-                    self.process_site_directory(site_dir)
+                    removable_dirs: Set[Path] = set()
+                    if cleanup_old:
+                        removable_dirs = {d for _, d in self.get_timestamp_directories(site_dir)[keep_newest:]}
+                    
+                    self.process_site_directory(site_dir, removable_dirs)
                     
                     # Optionally clean up old directories
                     if cleanup_old:
@@ -315,6 +737,10 @@ class SharePointBackupCleanup:
                     self.stats['errors'] += 1
                     continue
             
+            # Removed sessions may have been the last references to some blobs
+            if cleanup_old:
+                self.collect_blob_garbage()
+            
             # Print summary
             self.print_summary()
             
@@ -330,10 +756,24 @@ class SharePointBackupCleanup:
         logger.info("=" * 60)
         logger.info(f"Sites processed: {self.stats['sites_processed']}")
         logger.info(f"Timestamp directories found: {self.stats['timestamp_dirs_found']}")
-        logger.info(f"Files copied: {self.stats['files_copied']}")
+        logger.info(f"Files copied: {self.stats['files_copied']} ({self.stats['bytes_copied']:,} bytes)")
+        if self.stats['files_hardlinked'] or self.stats['files_reflinked'] or self.stats['files_moved']:
+            logger.info(f"Files hard-linked: {self.stats['files_hardlinked']}, "
+                        f"reflinked: {self.stats['files_reflinked']}, moved: {self.stats['files_moved']} "
+                        f"({self.stats['bytes_shared']:,} bytes without copying)")
         logger.info(f"Files skipped: {self.stats['files_skipped']}")
+        logger.info(f"Older versions superseded: {self.stats['files_superseded']} "
+                    f"({self.stats['bytes_superseded']:,} bytes)")
+        logger.info(f"Manifest entries merged: {self.stats['manifest_entries_merged']}")
+        if self.stats['blobs_removed']:
+            logger.info(f"Unreferenced blobs removed: {self.stats['blobs_removed']} "
+                        f"({self.stats['blob_bytes_freed']:,} bytes)")
         logger.info(f"Directories created: {self.stats['directories_created']}")
         logger.info(f"Old directories removed: {self.stats['old_dirs_removed']}")
+        if self.stats['bytes_reclaimed']:
+            net = self.stats['bytes_copied'] - self.stats['bytes_reclaimed']
+            logger.info(f"Space {'to be ' if self.dry_run else ''}freed by removing old directories: "
+                        f"{self.stats['bytes_reclaimed']:,} bytes (net change {net:+,} bytes)")
         logger.info(f"Errors: {self.stats['errors']}")
         
         if self.dry_run:
@@ -365,6 +805,19 @@ def main():
                        help='Number of newest timestamp directories to keep when '
                             'cleaning up (default: 1)')
     
+    parser.add_argument('--link-mode', choices=sorted(LINK_MODES), default='copy',
+                       help='How newest files are placed in the consolidated directory: '
+                            'copy (default), hardlink, reflink (reflink or copy_file_range), '
+                            'or auto (hardlink, then reflink, then copy_file_range, then copy)')
+    
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                       help=f'Threads scanning timestamp directories and placing files '
+                            f'(default: {DEFAULT_WORKERS})')
+    
+    parser.add_argument('--move', action='store_true',
+                       help='With --cleanup-old: move files out of timestamp directories that '
+                            'are about to be removed instead of linking or copying them')
+    
     args = parser.parse_args()
     
     # Validate arguments
@@ -381,12 +834,19 @@ def main():
         logger.error("keep-newest must be 0 or greater")
         sys.exit(1)
     
+    if args.move and not args.cleanup_old:
+        logger.error("--move only applies together with --cleanup-old")
+        sys.exit(1)
+    
     try:
         # Run the cleanup
         cleanup = SharePointBackupCleanup(
             root_dir=root_dir,
             dry_run=args.dry_run,
-            verbose=args.verbose
+            verbose=args.verbose,
+            link_mode=args.link_mode,
+            move=args.move,
+            workers=args.workers
         )
         
         cleanup.run(
@@ -7,35 +7,59 @@ to detect file changes without downloading files unnecessarily.
 
 import os
 import sys
+import asyncio
 import json
 import argparse
-import hashlib
+import queue
 import requests
 import time
+import threading
+import urllib.parse
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
+from collections import deque
+from contextlib import nullcontext
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 from loguru import logger
-from checksum_db import BackupChecksumDB
+from checksum_db import BackupChecksumDB, FileChangeIndex
+from graph_throttle import get_graph_limiter
+from token_provider import get_token_provider, GRAPH_SCOPE
+from ranged_download import download_file, range_header, PARALLEL_THRESHOLD
+from blob_store import BlobStore, SessionManifest, BLOB_DIR_NAME, MANIFEST_NAME
+from chunk_store import ChunkedBlobStore
+from stage_pipeline import StagePipeline, StageMetrics, DEFAULT_QUEUE_SIZE
+from async_graph import (AsyncGraphClient, CrawlCancelled, crawl_drive, transport_backend, GRAPH_URL,
+                         CHILDREN_SELECT, DEFAULT_CRAWL_CONCURRENCY)
 
-# Configure logging
-logger.remove()
-logger.level("INFO", color="<green>", icon="ℹ️")
-logger.level("SUCCESS", color="<bold><green>", icon="✅")
-logger.level("WARNING", color="<yellow>", icon="⚠️")
-logger.level("ERROR", color="<red>", icon="❌")
 
-logger.add(
-    sys.stdout,
-    format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>",
-    level="INFO",
-    colorize=True
-)
+def configure_logging(level: str = "INFO"):
+    """
+    Replace loguru's sinks with this script's console output.
+
+    Called from main() rather than at import, so importing the engine (e.g. from
+    backup_orchestrator) leaves the caller's sinks alone.
+    """
+    logger.remove()
+    logger.level("INFO", color="<green>", icon="ℹ️")
+    logger.level("SUCCESS", color="<bold><green>", icon="✅")
+    logger.level("WARNING", color="<yellow>", icon="⚠️")
+    logger.level("ERROR", color="<red>", icon="❌")
+
+    logger.add(
+        sys.stdout,
+        format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>",
+        level=level,
+        colorize=True
+    )
+
+
+class DeltaTokenExpired(Exception):
+    """Raised when Graph rejects a stored drive delta link (HTTP 410 Gone)."""
 
 
 @dataclass
@@ -73,7 +97,12 @@ class OptimizedSharePointBackup:
     """Optimized backup using server-side metadata for change detection."""
     
     def __init__(self, client_id: str, client_secret: str, tenant_id: str, 
-                 backup_dir: str = None, db_path: str = "backup_checksums.db"):
+                 backup_dir: str = None, db_path: str = "backup_checksums.db",
+                 use_delta: bool = True, download_workers: int = 4,
+                 max_concurrent_downloads: int = 16, range_parts: int = 4,
+                 use_blob_store: bool = False, chunk_dedup: bool = False,
+                 crawl_concurrency: int = DEFAULT_CRAWL_CONCURRENCY,
+                 session: Optional[requests.Session] = None):
         """
         Initialize optimized backup client.
         
@@ -83,10 +112,32 @@ class OptimizedSharePointBackup:
             tenant_id: Azure AD Tenant ID
             backup_dir: Backup directory (defaults to SHAREPOINT_BACKUP_DIR or "backup")
             db_path: Path to checksum database
+            use_delta: Use Graph drive delta queries for incremental change detection
+            download_workers: Parallel file downloads within a single drive
+            max_concurrent_downloads: Cap on simultaneous downloads across all drives
+            range_parts: Parallel ranges per file for files over 256 MB (1 disables)
+            use_blob_store: Store contents once per SHA-256 in <backup_dir>/.blobs and write
+                            a manifest per session instead of a file tree
+            chunk_dedup: Store large files in the blob store as content-defined chunks,
+                         so a new version only adds its changed chunks (implies use_blob_store)
+            crawl_concurrency: Folder listings in flight during a full crawl, over the async
+                               transport (1 crawls folder by folder with the blocking session)
+            session: HTTP session shared with other engines (e.g. by backup_orchestrator.py);
+                     by default the engine creates its own
         """
         self.client_id = client_id
         self.client_secret = client_secret
         self.tenant_id = tenant_id
+        self.use_delta = use_delta
+        self.download_workers = max(1, download_workers)
+        self.max_concurrent_downloads = max(1, max_concurrent_downloads)
+        self.range_parts = max(1, range_parts)
+        self.crawl_concurrency = max(1, crawl_concurrency)
+        self.graph_url = GRAPH_URL
+        
+        # Global download cap shared by the per-drive download pools
+        self._download_slots = threading.BoundedSemaphore(self.max_concurrent_downloads)
+        self._stats_lock = threading.Lock()
         
         # Determine backup directory
         if backup_dir:
@@ -101,15 +152,33 @@ class OptimizedSharePointBackup:
                 backup_dir_env = os.environ.get('BACKUP_DIR', 'backup')
                 self.backup_dir = Path(backup_dir_env)
         
-        self.db = BackupChecksumDB(db_path)
+        # Incomplete downloads live outside the timestamped session folders,
+        # so the next run can resume them
+        self.partial_dir = self.backup_dir / '.partial'
+        
+        # Optional content-addressed store shared by all sites and sessions
+        if chunk_dedup:
+            self.blob_store = ChunkedBlobStore(self.backup_dir / BLOB_DIR_NAME)
+        elif use_blob_store:
+            self.blob_store = BlobStore(self.backup_dir / BLOB_DIR_NAME)
+        else:
+            self.blob_store = None
+        
+        # One WAL connection per worker thread; file records are written in batches
+        self.db = BackupChecksumDB(db_path, persistent=True)
         
         # Setup HTTP session with retry logic
-        self._setup_session()
+        self._setup_session(session)
         
-        self.access_token = self._get_access_token()
-        self.token_obtained_time = datetime.now()
+        # Shared with every other Graph client in this process
+        self.limiter = get_graph_limiter()
+        
+        # Shared with every other Graph engine of this app in this process
+        self.token_provider = get_token_provider(self.tenant_id, self.client_id, self.client_secret,
+                                                 GRAPH_SCOPE, fetch=self._request_token,
+                                                 name='Graph access token')
+        self.token_provider.get_token()
         self.headers = {
-            'Authorization': f'Bearer {self.access_token}',
             'Content-Type': 'application/json'
         }
         
@@ -117,80 +186,114 @@ class OptimizedSharePointBackup:
             'files_backed_up': 0,
             'files_skipped': 0,
             'files_failed': 0,
+            'files_deleted': 0,
             'total_size': 0,
             'bytes_saved': 0,
+            'bytes_resumed': 0,
+            'bytes_deduplicated': 0,
             'start_time': datetime.now()
         }
         
+        # Per-stage counters of the drive pipelines, summed over all drives
+        self.pipeline_metrics: Dict[str, StageMetrics] = {}
+        self._pipeline_metrics_lock = threading.Lock()
+        
         logger.info(f"Optimized SharePoint backup initialized")
         logger.info(f"Backup directory: {self.backup_dir}")
         logger.info(f"Database: {db_path}")
+        logger.info(f"Delta queries: {'enabled' if use_delta else 'disabled'}")
+        if self.blob_store:
+            logger.info(f"Blob store: {self.blob_store.root}"
+                        f"{' (chunked)' if chunk_dedup else ''}")
+        logger.info(f"Downloads: {self.download_workers} per drive, "
+                    f"{self.max_concurrent_downloads} max concurrent, "
+                    f"{self.range_parts} ranges per large file")
+        if self.crawl_concurrency > 1:
+            logger.info(f"Folder crawl: {self.crawl_concurrency} concurrent via {transport_backend()}")
+        else:
+            logger.info("Folder crawl: sequential")
     
-    def _setup_session(self):
-        """Setup HTTP session with retry logic."""
-        # Configure retry strategy for network/DNS failures and HTTP 5xx errors
+    def _setup_session(self, session: Optional[requests.Session] = None):
+        """Setup HTTP session with retry logic, unless a shared session is given."""
+        # Set default timeout
+        self.request_timeout = 30
+        
+        if session is not None:
+            self.session = session
+            return
+        
+        # Configure retry strategy for network/DNS failures and HTTP 5xx errors;
+        # 429/503 are left to the shared adaptive rate limiter
         retry_strategy = Retry(
             total=3,  # Maximum number of retries
             backoff_factor=1,  # Exponential backoff: 1, 2, 4 seconds
-            status_forcelist=[429, 500, 502, 503, 504],  # Retry on rate limit and server errors
+            status_forcelist=[500, 502, 504],  # Retry on server errors
             allowed_methods=["GET", "POST", "PUT", "DELETE"],
             raise_on_status=False
         )
         
-        # Create adapter with retry strategy
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # Create adapter with retry strategy; size the pool for concurrent (ranged) downloads
+        adapter = HTTPAdapter(
+            max_retries=retry_strategy,
+            pool_maxsize=max(10, self.max_concurrent_downloads * self.range_parts)
+        )
         
         # Create session and mount adapter
         self.session = requests.Session()
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
-        
-        # Set default timeout
-        self.request_timeout = 30
     
-    def _get_access_token(self) -> str:
-        """Get Microsoft Graph access token."""
+    def _request_token(self) -> Dict[str, Any]:
+        """Request a Microsoft Graph access token (token endpoint response)."""
         token_url = f"https://login.microsoftonline.com/{self.tenant_id}/oauth2/v2.0/token"
         token_data = {
             'grant_type': 'client_credentials',
             'client_id': self.client_id,
             'client_secret': self.client_secret,
-            'scope': 'https://graph.microsoft.com/.default'
+            'scope': GRAPH_SCOPE
         }
         
         # Use session for token request as well
         response = self.session.post(token_url, data=token_data, timeout=self.request_timeout)
         response.raise_for_status()
-        return response.json()['access_token']
+        return response.json()
     
-    def _refresh_token_if_needed(self):
-        """Refresh token if needed."""
-        current_time = datetime.now()
-        if (current_time - self.token_obtained_time).total_seconds() > 3000:
-            logger.info("Refreshing access token...")
-            self.access_token = self._get_access_token()
-            self.token_obtained_time = datetime.now()
-            self.headers['Authorization'] = f'Bearer {self.access_token}'
+    def _renew_token(self, rejected_token: Optional[str] = None):
+        """Replace a rejected access token (once, however many requests saw the 401)."""
+        self.token_provider.invalidate(rejected_token)
+    
+    def _graph_headers(self) -> Dict[str, str]:
+        """Current request headers; the shared provider keeps the token fresh."""
+        return {**self.headers, 'Authorization': self.token_provider.authorization()}
+    
+    def _increment_stat(self, key: str, amount: int = 1):
+        """Thread-safe increment of a stats counter."""
+        with self._stats_lock:
+            self.stats[key] += amount
     
     def _make_graph_request(self, url: str, method: str = 'GET', **kwargs):
         """Make Graph API request with token refresh and retry logic."""
-        self._refresh_token_if_needed()
-        
         # Add timeout if not specified
         if 'timeout' not in kwargs:
             kwargs['timeout'] = self.request_timeout
         
+        extra_headers = kwargs.pop('headers', {})
+        
         try:
-            response = self.session.request(method, url, headers=self.headers, **kwargs)
+            token = self.token_provider.get_token()
+            response = self.limiter.send(self.session.request, method, url,
+                                         headers={**self.headers, 'Authorization': f'Bearer {token}',
+                                                  **extra_headers}, **kwargs)
             
             if response.status_code == 401:
-                logger.warning("Token expired, refreshing...")
-                self.access_token = self._get_access_token()
-                self.token_obtained_time = datetime.now()
-                self.headers['Authorization'] = f'Bearer {self.access_token}'
+                # Release the connection of a streamed response before retrying
+                response.close()
+                token = self.token_provider.invalidate(token)
                 
                 # Retry the request with new token
-                response = self.session.request(method, url, headers=self.headers, **kwargs)
+                response = self.limiter.send(self.session.request, method, url,
+                                             headers={**self.headers, 'Authorization': f'Bearer {token}',
+                                                      **extra_headers}, **kwargs)
             
             return response
             
@@ -198,71 +301,106 @@ class OptimizedSharePointBackup:
             logger.warning(f"Graph API request failed: {str(e)}")
             raise
     
-    def _has_file_changed(self, file_meta: FileMetadata) -> bool:
-        """Check if file has changed using server-side metadata."""
-        record = self.db.get_file_record(file_meta.file_path)
+    def _has_file_changed(self, file_meta: FileMetadata, index: FileChangeIndex) -> bool:
+        """Check if file has changed using server-side metadata (eTag and size)."""
+        return index.has_changed(file_meta.file_path, file_meta.eTag, file_meta.size)
+    
+    def _download_file(self, site_id: str, drive_id: str, file_meta: FileMetadata, local_path: Path,
+                       manifest: Optional[SessionManifest] = None) -> Optional[str]:
+        """
+        Download a file; returns its SHA-256, or None if the download failed.
         
-        if not record:
-            return True  # New file
+        Only the transfer holds one of the global download slots; storing the
+        content (chunking it with --chunk-dedup) happens after the slot is released.
+        """
+        return self._download_file_unbounded(site_id, drive_id, file_meta, local_path, manifest,
+                                             slot=self._download_slots)
+    
+    def _download_file_unbounded(self, site_id: str, drive_id: str, file_meta: FileMetadata,
+                                 local_path: Path, manifest: Optional[SessionManifest] = None,
+                                 slot: Optional[threading.BoundedSemaphore] = None) -> Optional[str]:
+        """
+        Download a file without taking a global download slot.
         
-        # Check eTag and size for changes
-        if file_meta.eTag != record.get('eTag', '') or file_meta.size != record.get('file_size', 0):
-            return True
+        With the blob store enabled the content goes into the store and the file
+        is recorded in the session manifest instead of the session's file tree.
+        The database record is left to the caller (see _record_file).
         
-        return False  # Unchanged
-    
-    def _download_file(self, site_id: str, drive_id: str, file_meta: FileMetadata, local_path: Path) -> bool:
-        """Download a file and update database."""
+        Args:
+            slot: Held only while the content is transferred, not while it is stored
+        """
         try:
-            download_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/items/{file_meta.id}/content"
-            response = self._make_graph_request(download_url, stream=True)
+            download_url = f"{self.graph_url}/sites/{site_id}/drives/{drive_id}/items/{file_meta.id}/content"
             
-            if response.status_code != 200:
-                logger.warning(f"Failed to download {file_meta.name}: {response.status_code}")
-                return False
+            def open_range(start: int, end: Optional[int]):
+                return self._make_graph_request(download_url, stream=True, headers=range_header(start, end))
             
             # Create the full local path including folder hierarchy
             if file_meta.relative_path:
-                # Create the folder structure
                 full_path = local_path / file_meta.relative_path
-                full_path.mkdir(parents=True, exist_ok=True)
                 file_path = full_path / self._sanitize_filename(file_meta.name)
             else:
                 # Fallback to root directory
                 file_path = local_path / self._sanitize_filename(file_meta.name)
             
-            # Calculate checksum while downloading
-            sha256_hash = hashlib.sha256()
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        sha256_hash.update(chunk)
-                        f.write(chunk)
+            item_key = self._sanitize_filename(f"{drive_id}_{file_meta.id}")
+            if self.blob_store:
+                target_path = self.blob_store.incoming_path(item_key)
+            else:
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                target_path = file_path
+            
+            # Resumable download, checksum calculated while downloading;
+            # the partial file is keyed by item so an interrupted run can continue it
+            with slot or nullcontext():
+                result = download_file(
+                    open_range, target_path,
+                    partial_path=self.partial_dir / f"{item_key}.partial",
+                    expected_size=file_meta.size,
+                    version=file_meta.eTag,
+                    parallel_parts=self.range_parts,
+                    parallel_threshold=PARALLEL_THRESHOLD
+                )
             
-            checksum = sha256_hash.hexdigest()
+            checksum = result.sha256
+            if result.resumed_bytes:
+                self._increment_stat('bytes_resumed', result.resumed_bytes)
             
-            # Update database
-            self.db.update_file_record(
-                site_id=site_id,
-                file_path=file_meta.file_path,
-                file_name=file_meta.name,
-                file_size=file_meta.size,
-                last_modified=file_meta.lastModifiedDateTime,
-                checksum=checksum,
-                eTag=file_meta.eTag,
-                cTag=file_meta.cTag
-            )
+            if self.blob_store:
+                stored = self.blob_store.put_file(target_path, checksum)
+                self._increment_stat('bytes_deduplicated', result.size - stored)
+                if manifest is not None:
+                    manifest.add(
+                        file_path.relative_to(local_path.parent).as_posix(), checksum, result.size,
+                        item_path=file_meta.file_path,
+                        eTag=file_meta.eTag,
+                        cTag=file_meta.cTag,
+                        last_modified=file_meta.lastModifiedDateTime
+                    )
             
-            self.stats['files_backed_up'] += 1
-            self.stats['total_size'] += file_meta.size
+            self._increment_stat('files_backed_up')
+            self._increment_stat('total_size', file_meta.size)
             logger.info(f"Backed up: {file_meta.name} ({file_meta.size:,} bytes)")
             
-            return True
+            return checksum
             
         except Exception as e:
             logger.warning(f"Error downloading {file_meta.name}: {str(e)}")
-            self.stats['files_failed'] += 1
-            return False
+            self._increment_stat('files_failed')
+            return None
+    
+    def _record_file(self, site_id: str, file_meta: FileMetadata, checksum: str):
+        """Queue the database record of a downloaded file (flushed before the delta link is saved)."""
+        self.db.queue_file_record(
+            site_id=site_id,
+            file_path=file_meta.file_path,
+            file_name=file_meta.name,
+            file_size=file_meta.size,
+            last_modified=file_meta.lastModifiedDateTime,
+            checksum=checksum,
+            eTag=file_meta.eTag,
+            cTag=file_meta.cTag
+        )
     
     def _sanitize_filename(self, filename: str) -> str:
         """Sanitize filename for filesystem."""
@@ -271,27 +409,39 @@ class OptimizedSharePointBackup:
             filename = filename.replace(char, '_')
         return filename[:200]
     
-    def _get_files_with_metadata(self, site_id: str, drive_id: str, folder_id: str = "root") -> List[FileMetadata]:
-        """Get all files in a folder with metadata using iterative approach."""
+    def _get_files_with_metadata(self, site_id: str, drive_id: str, folder_id: str = "root",
+                                 errors: Optional[List[str]] = None,
+                                 on_file: Optional[Callable[[FileMetadata], None]] = None) -> List[FileMetadata]:
+        """
+        Get all files in a folder with metadata using iterative approach.
+        
+        Listing failures are logged and skipped; if *errors* is given, a message is
+        appended for each one so callers can tell a partial crawl from a complete one.
+        If *on_file* is given, each file is passed to it as soon as it is listed
+        instead of being collected, and the returned list is empty.
+        """
+        if self.crawl_concurrency > 1:
+            return self._get_files_with_metadata_async(site_id, drive_id, folder_id, errors, on_file)
+        
         files = []
         # Store folder paths: folder_id -> relative_path
         folder_paths = {folder_id: Path("")}
-        folders_to_process = [(folder_id, 0)]  # (folder_id, depth)
+        folders_to_process = deque([(folder_id, 0)])  # (folder_id, depth)
         max_depth = 50  # Increased safety limit
         
         try:
             while folders_to_process:
-                current_folder_id, depth = folders_to_process.pop(0)
+                current_folder_id, depth = folders_to_process.popleft()
                 current_folder_path = folder_paths.get(current_folder_id, Path(""))
                 
                 if depth > max_depth:
                     logger.warning(f"Max depth {max_depth} reached, skipping deeper folders")
                     continue
                 
-                url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/items/{current_folder_id}/children"
+                url = f"{self.graph_url}/sites/{site_id}/drives/{drive_id}/items/{current_folder_id}/children"
                 
                 params = {
-                    '$select': 'id,name,size,eTag,cTag,lastModifiedDateTime,createdDateTime,webUrl,file,folder,parentReference',
+                    '$select': CHILDREN_SELECT,
                     '$top': 200
                 }
                 
@@ -300,6 +450,8 @@ class OptimizedSharePointBackup:
                     response = self._make_graph_request(url, params=params)
                     if response.status_code != 200:
                         logger.warning(f"Failed to get folder contents: {response.status_code}")
+                        if errors is not None:
+                            errors.append(f"{current_folder_id}: HTTP {response.status_code}")
                         break
                     
                     data = response.json()
@@ -313,7 +465,10 @@ class OptimizedSharePointBackup:
                             file_meta = FileMetadata.from_graph_data(item, drive_id)
                             # Store the relative path in the file metadata
                             file_meta.relative_path = current_folder_path
-                            files.append(file_meta)
+                            if on_file is not None:
+                                on_file(file_meta)
+                            else:
+                                files.append(file_meta)
                         elif 'folder' in item:
                             # Calculate subfolder path
                             subfolder_path = current_folder_path / self._sanitize_filename(item_name)
@@ -329,19 +484,224 @@ class OptimizedSharePointBackup:
             
             return files
             
+        except CrawlCancelled:
+            raise
         except Exception as e:
             logger.warning(f"Error getting files: {str(e)}")
+            if errors is not None:
+                errors.append(str(e))
             return []
     
+    def _get_files_with_metadata_async(self, site_id: str, drive_id: str, folder_id: str = "root",
+                                       errors: Optional[List[str]] = None,
+                                       on_file: Optional[Callable[[FileMetadata], None]] = None
+                                       ) -> List[FileMetadata]:
+        """
+        Same as _get_files_with_metadata, but lists sibling folders concurrently.
+        
+        Runs its own event loop, so it can be called from any worker thread.
+        """
+        def to_file_meta(item: Dict[str, Any], folder_path: Path) -> FileMetadata:
+            file_meta = FileMetadata.from_graph_data(item, drive_id)
+            file_meta.relative_path = folder_path
+            return file_meta
+        
+        async def emit(item: Dict[str, Any], folder_path: Path):
+            # on_file may block (bounded queue); keep it off the event loop so the
+            # other folder listings continue meanwhile
+            await asyncio.get_running_loop().run_in_executor(None, on_file, to_file_meta(item, folder_path))
+        
+        async def crawl():
+            async with AsyncGraphClient(self._graph_headers, renew_token=self._renew_token,
+                                        limiter=self.limiter, max_connections=self.crawl_concurrency,
+                                        timeout=self.request_timeout, session=self.session) as client:
+                return await crawl_drive(client, f"{self.graph_url}/sites/{site_id}/drives/{drive_id}",
+                                         folder_id, concurrency=self.crawl_concurrency,
+                                         sanitize=self._sanitize_filename,
+                                         on_file=emit if on_file is not None else None)
+        
+        try:
+            items, crawl_errors = asyncio.run(crawl())
+        except CrawlCancelled:
+            raise
+        except Exception as e:
+            logger.warning(f"Error getting files: {str(e)}")
+            if errors is not None:
+                errors.append(str(e))
+            return []
+        
+        if errors is not None:
+            errors.extend(crawl_errors)
+        
+        return [to_file_meta(item, folder_path) for item, folder_path in items]
+    
+    def _iter_files_with_metadata(self, site_id: str, drive_id: str, folder_id: str = "root",
+                                  errors: Optional[List[str]] = None,
+                                  max_pending: int = DEFAULT_QUEUE_SIZE) -> Iterator[FileMetadata]:
+        """
+        Yield the files of a folder tree while it is still being crawled.
+        
+        The crawl runs on a background thread, so callers can start downloading the
+        first files before the last folders are listed. At most *max_pending* files
+        wait to be consumed; beyond that the crawl pauses. *errors* is complete once
+        the iterator is exhausted; closing the iterator early stops the crawl.
+        """
+        discovered: queue.Queue = queue.Queue(maxsize=max(1, max_pending))
+        crawl_done = object()
+        stop = threading.Event()
+        
+        def hand_over(item: Any):
+            # Wait for room in the queue, but give up once the consumer has stopped
+            while not stop.is_set():
+                try:
+                    discovered.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+            raise CrawlCancelled()
+        
+        def crawl():
+            try:
+                self._get_files_with_metadata(site_id, drive_id, folder_id, errors=errors,
+                                              on_file=hand_over)
+            except CrawlCancelled:
+                pass
+            finally:
+                try:
+                    hand_over(crawl_done)
+                except CrawlCancelled:
+                    pass
+        
+        crawler = threading.Thread(target=crawl, name=f"crawl-{drive_id[-8:]}", daemon=True)
+        crawler.start()
+        
+        try:
+            while True:
+                file_meta = discovered.get()
+                if file_meta is crawl_done:
+                    break
+                yield file_meta
+            
+            crawler.join()
+        finally:
+            stop.set()
+    
+    def _get_latest_delta_link(self, site_id: str, drive_id: str) -> Optional[str]:
+        """
+        Get a delta link representing the current state of a drive.
+        
+        Used to seed delta tracking before a full crawl, so that changes made while
+        the crawl is running are picked up by the next incremental run.
+        """
+        url = f"{self.graph_url}/sites/{site_id}/drives/{drive_id}/root/delta"
+        params = {
+            'token': 'latest',
+            '$select': 'id,name,size,eTag,cTag,lastModifiedDateTime,createdDateTime,webUrl,file,folder,parentReference,deleted,root'
+        }
+        
+        try:
+            response = self._make_graph_request(url, params=params)
+            if response.status_code != 200:
+                logger.warning(f"Failed to get latest delta link: {response.status_code}")
+                return None
+            return response.json().get('@odata.deltaLink')
+        except Exception as e:
+            logger.warning(f"Error getting latest delta link: {str(e)}")
+            return None
+    
+    def _get_delta_changes(self, site_id: str, drive_id: str,
+                           delta_link: str) -> Tuple[List[FileMetadata], List[str], str]:
+        """
+        Fetch items changed since a stored delta link.
+        
+        Args:
+            site_id: SharePoint site ID
+            drive_id: Drive ID
+            delta_link: @odata.deltaLink saved by a previous run
+            
+        Returns:
+            Tuple of (changed files, file_paths of deleted items, new delta link)
+            
+        Raises:
+            DeltaTokenExpired: If Graph no longer accepts the delta link (410 Gone)
+        """
+        changed: Dict[str, Dict[str, Any]] = {}
+        deleted: Dict[str, str] = {}
+        url = delta_link
+        new_delta_link = None
+        
+        while url:
+            response = self._make_graph_request(url)
+            if response.status_code == 410:
+                raise DeltaTokenExpired(f"Delta token expired for drive {drive_id}")
+            if response.status_code != 200:
+                raise Exception(f"Delta query failed: {response.status_code}")
+            
+            data = response.json()
+            
+            # The same item can appear on several pages; the last occurrence wins
+            for item in data.get('value', []):
+                item_id = item.get('id')
+                if 'deleted' in item:
+                    changed.pop(item_id, None)
+                    deleted[item_id] = f"/drives/{drive_id}/items/{item_id}"
+                elif 'file' in item:
+                    deleted.pop(item_id, None)
+                    changed[item_id] = item
+            
+            new_delta_link = data.get('@odata.deltaLink', new_delta_link)
+            url = data.get('@odata.nextLink')
+        
+        if not new_delta_link:
+            raise Exception(f"Delta query for drive {drive_id} returned no deltaLink")
+        
+        # Delta responses omit parentReference.path, so resolve folder paths by ID
+        folder_paths: Dict[str, Path] = {}
+        files = []
+        for item in changed.values():
+            file_meta = FileMetadata.from_graph_data(item, drive_id)
+            parent_id = (item.get('parentReference') or {}).get('id')
+            file_meta.relative_path = self._resolve_folder_path(site_id, drive_id, parent_id, folder_paths)
+            files.append(file_meta)
+        
+        return files, list(deleted.values()), new_delta_link
+    
+    def _resolve_folder_path(self, site_id: str, drive_id: str, folder_id: Optional[str],
+                             cache: Dict[str, Path]) -> Path:
+        """Resolve a folder ID to its sanitized path relative to the drive root."""
+        if not folder_id:
+            return Path("")
+        if folder_id in cache:
+            return cache[folder_id]
+        
+        folder_path = Path("")
+        url = f"{self.graph_url}/sites/{site_id}/drives/{drive_id}/items/{folder_id}"
+        
+        try:
+            response = self._make_graph_request(url, params={'$select': 'id,name,root,parentReference'})
+            if response.status_code == 200:
+                data = response.json()
+                if 'root' not in data:
+                    # parentReference.path looks like /drives/{id}/root:/Folder/Sub
+                    parent_path = (data.get('parentReference') or {}).get('path', '')
+                    _, _, below_root = parent_path.partition('root:')
+                    parts = [self._sanitize_filename(urllib.parse.unquote(part))
+                             for part in below_root.split('/') if part]
+                    folder_path = Path(*parts) / self._sanitize_filename(data.get('name', ''))
+            else:
+                logger.warning(f"Failed to resolve folder {folder_id}: {response.status_code}")
+        except Exception as e:
+            logger.warning(f"Error resolving folder {folder_id}: {str(e)}")
+        
+        cache[folder_id] = folder_path
+        return folder_path
+    
     def backup_all_sites(self, backup_type: str = 'incremental', max_workers: int = 5):
         """Main backup method."""
-        logger.info(f"Starting {backup_type.upper()} SharePoint backup")
-        logger.info("=" * 60)
-        
-        session_id = self.db.start_backup_session(backup_type)
+        session_id = self.start_run(backup_type)
         
         try:
-            sites = self._get_all_sites()
+            sites = self.get_sites()
             logger.info(f"Found {len(sites)} sites")
             
             for i, site in enumerate(sites, 1):
@@ -349,33 +709,43 @@ class OptimizedSharePointBackup:
                 site_name = site.get('displayName', f"Site_{i}")
                 
                 logger.info(f"[{i}/{len(sites)}] Processing: {site_name}")
-                self._backup_site(site_id, site_name, backup_type, max_workers)
+                self.backup_site(site_id, site_name, backup_type, max_workers)
             
-            self.db.update_backup_session(
-                session_id=session_id,
-                files_backed_up=self.stats['files_backed_up'],
-                files_skipped=self.stats['files_skipped'],
-                total_size=self.stats['total_size'],
-                status='completed'
-            )
-            
-            self._print_summary()
+            self.finish_run(session_id)
             
         except Exception as e:
             logger.error(f"Backup failed: {str(e)}")
-            self.db.update_backup_session(
-                session_id=session_id,
-                files_backed_up=self.stats['files_backed_up'],
-                files_skipped=self.stats['files_skipped'],
-                total_size=self.stats['total_size'],
-                status='failed',
-                error_message=str(e)
-            )
+            self.finish_run(session_id, error=str(e))
             raise
     
-    def _get_all_sites(self) -> List[Dict[str, Any]]:
+    def start_run(self, backup_type: str) -> int:
+        """
+        Start a backup run.
+        
+        Returns:
+            Backup session id for finish_run()
+        """
+        logger.info(f"Starting {backup_type.upper()} SharePoint backup")
+        logger.info("=" * 60)
+        return self.db.start_backup_session(backup_type)
+    
+    def finish_run(self, session_id: int, error: Optional[str] = None):
+        """Record the run totals; a successful run also prints the summary."""
+        self.db.update_backup_session(
+            session_id=session_id,
+            files_backed_up=self.stats['files_backed_up'],
+            files_skipped=self.stats['files_skipped'],
+            total_size=self.stats['total_size'],
+            status='failed' if error else 'completed',
+            error_message=error
+        )
+        
+        if not error:
+            self._print_summary()
+    
+    def get_sites(self) -> List[Dict[str, Any]]:
         """Get all SharePoint sites."""
-        sites_url = "https://graph.microsoft.com/v1.0/sites?$select=id,name,webUrl,displayName"
+        sites_url = f"{self.graph_url}/sites?$select=id,name,webUrl,displayName"
         all_sites = []
         
         try:
@@ -391,7 +761,7 @@ class OptimizedSharePointBackup:
             logger.error(f"Failed to get sites: {str(e)}")
             return []
     
-    def _backup_site(self, site_id: str, site_name: str, backup_type: str, max_workers: int):
+    def backup_site(self, site_id: str, site_name: str, backup_type: str, max_workers: int):
         """Backup a single site."""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         site_path = self.backup_dir / self._sanitize_filename(site_name) / timestamp
@@ -409,33 +779,41 @@ class OptimizedSharePointBackup:
         with open(site_path / "site_metadata.json", 'w') as f:
             json.dump(metadata, f, indent=2)
         
+        # With the blob store the session is just a list of path -> content hash
+        manifest = SessionManifest(metadata) if self.blob_store else None
+        
         # Get drives
         drives = self._get_site_drives(site_id)
         logger.info(f"  Found {len(drives)} document libraries")
         
         # Process drives in parallel
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-            for drive in drives:
-                drive_name = drive.get('name', 'Unknown')
-                drive_id = drive.get('id')
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = []
+                for drive in drives:
+                    drive_name = drive.get('name', 'Unknown')
+                    drive_id = drive.get('id')
+                    
+                    future = executor.submit(
+                        self._backup_drive,
+                        site_id, drive_id, drive_name, site_path, backup_type, manifest
+                    )
+                    futures.append((drive_name, future))
                 
-                future = executor.submit(
-                    self._backup_drive,
-                    site_id, drive_id, drive_name, site_path, backup_type
-                )
-                futures.append((drive_name, future))
-            
-            for drive_name, future in futures:
-                try:
-                    future.result()
-                    logger.info(f"  Completed: {drive_name}")
-                except Exception as e:
-                    logger.error(f"  Failed to backup drive '{drive_name}': {str(e)}")
+                for drive_name, future in futures:
+                    try:
+                        future.result()
+                        logger.info(f"  Completed: {drive_name}")
+                    except Exception as e:
+                        logger.error(f"  Failed to backup drive '{drive_name}': {str(e)}")
+        finally:
+            if manifest is not None:
+                manifest.save(site_path / MANIFEST_NAME)
+                logger.info(f"  Manifest: {len(manifest)} files")
     
     def _get_site_drives(self, site_id: str) -> List[Dict[str, Any]]:
         """Get all drives for a site."""
-        drives_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives"
+        drives_url = f"{self.graph_url}/sites/{site_id}/drives"
         
         try:
             response = self._make_graph_request(drives_url)
@@ -446,58 +824,153 @@ class OptimizedSharePointBackup:
             logger.warning(f"Error getting drives: {str(e)}")
             return []
     
-    def _backup_drive(self, site_id: str, drive_id: str, drive_name: str, site_path: Path, backup_type: str):
+    def _backup_drive(self, site_id: str, drive_id: str, drive_name: str, site_path: Path, backup_type: str,
+                      manifest: Optional[SessionManifest] = None):
         """Backup a document library."""
         drive_path = site_path / self._sanitize_filename(drive_name)
-        drive_path.mkdir(parents=True, exist_ok=True)
+        if not self.blob_store:
+            drive_path.mkdir(parents=True, exist_ok=True)
         
-        # Get files with metadata
-        logger.info(f"    Scanning '{drive_name}'...")
-        files = self._get_files_with_metadata(site_id, drive_id)
-        logger.info(f"    Found {len(files)} files")
+        files = None
+        deleted_paths: List[str] = []
+        new_delta_link = None
+        crawl_errors: List[str] = []
         
-        if not files:
-            logger.info(f"    No files found in '{drive_name}'")
-            return
+        # Incremental runs with a stored delta link only fetch what changed
+        stored_delta_link = None
+        if self.use_delta and backup_type == 'incremental':
+            stored_delta_link = self.db.get_delta_link(site_id, drive_id)
         
-        # Process files
-        changed_files = []
-        unchanged_files = []
-        
-        # Log first few files being processed
-        sample_size = min(5, len(files))
-        for i, file_meta in enumerate(files[:sample_size]):
-            logger.debug(f"      Sample file {i+1}: {file_meta.name} ({file_meta.size:,} bytes)")
-        
-        for file_meta in files:
-            if backup_type == 'full':
-                changed_files.append(file_meta)
-                logger.debug(f"      Will backup (full): {file_meta.name}")
-            elif self._has_file_changed(file_meta):
-                changed_files.append(file_meta)
-                logger.debug(f"      Changed: {file_meta.name}")
-            else:
-                unchanged_files.append(file_meta)
-                self.stats['files_skipped'] += 1
-                self.stats['bytes_saved'] += file_meta.size
-                # Log only first few skipped files to avoid spam
-                if len(unchanged_files) <= 5:
-                    logger.debug(f"      Unchanged (skipping): {file_meta.name}")
-        
-        logger.info(f"    Changed: {len(changed_files)}, Unchanged: {len(unchanged_files)}")
-        
-        if unchanged_files:
-            logger.info(f"    Skipping {len(unchanged_files)} unchanged files")
-            if len(unchanged_files) > 5:
-                logger.info(f"      (showing first 5): {', '.join(f.name for f in unchanged_files[:5])}...")
-        
-        # Download changed files
-        if changed_files:
-            logger.info(f"    Downloading {len(changed_files)} changed files...")
-            for file_meta in changed_files:
-                self._download_file(site_id, drive_id, file_meta, drive_path)
+        if stored_delta_link:
+            logger.info(f"    Fetching changes for '{drive_name}' via delta query...")
+            try:
+                files, deleted_paths, new_delta_link = self._get_delta_changes(
+                    site_id, drive_id, stored_delta_link
+                )
+                logger.info(f"    Delta: {len(files)} changed files, {len(deleted_paths)} deleted items")
+            except DeltaTokenExpired:
+                logger.warning(f"    Delta token expired for '{drive_name}', falling back to full crawl")
+                self.db.clear_delta_link(site_id, drive_id)
+            except Exception as e:
+                logger.warning(f"    Delta query failed for '{drive_name}': {str(e)}, falling back to full crawl")
+        
+        files_from_delta = files is not None
+        
+        # One query for everything we know about this drive
+        index = self.db.load_change_index(site_id, drive_id)
+        
+        if files is None:
+            # Seed delta tracking before crawling so changes made during the crawl are not lost
+            if self.use_delta:
+                new_delta_link = self._get_latest_delta_link(site_id, drive_id)
+            
+            logger.info(f"    Scanning '{drive_name}'...")
+            # Files are classified and downloaded while the rest of the tree is still being listed
+            files = self._iter_files_with_metadata(site_id, drive_id, errors=crawl_errors)
+        
+        seen_paths: List[str] = []
+        unchanged_sample: List[str] = []
+        unchanged_count = 0
+        changed_count = 0
+        failed_downloads = 0
+        failed_lock = threading.Lock()
+        
+        def diff(file_meta: FileMetadata) -> Optional[FileMetadata]:
+            nonlocal changed_count, unchanged_count
+            seen_paths.append(file_meta.file_path)
+            
+            if backup_type == 'full' or self._has_file_changed(file_meta, index):
+                changed_count += 1
+                logger.debug(f"      {'Will backup (full)' if backup_type == 'full' else 'Changed'}: "
+                             f"{file_meta.name} ({file_meta.size:,} bytes)")
+                return file_meta
+            
+            self._increment_stat('files_skipped')
+            self._increment_stat('bytes_saved', file_meta.size)
+            unchanged_count += 1
+            # Log only first few skipped files to avoid spam
+            if len(unchanged_sample) < 5:
+                logger.debug(f"      Unchanged (skipping): {file_meta.name}")
+                unchanged_sample.append(file_meta.name)
+            return None
+        
+        def download(file_meta: FileMetadata) -> Optional[Tuple[FileMetadata, str]]:
+            nonlocal failed_downloads
+            checksum = self._download_file(site_id, drive_id, file_meta, drive_path, manifest)
+            if checksum is None:
+                with failed_lock:
+                    failed_downloads += 1
+                return None
+            return file_meta, checksum
+        
+        def record(downloaded: Tuple[FileMetadata, str]):
+            file_meta, checksum = downloaded
+            self._record_file(site_id, file_meta, checksum)
+        
+        # crawl -> diff -> download -> database, overlapping; the bounded queues keep
+        # memory flat and the global slots cap downloads across drives
+        pipeline = (StagePipeline()
+                    .add_stage('diff', diff)
+                    .add_stage('download', download, workers=self.download_workers,
+                               queue_size=self.download_workers * 2, measure=lambda f: f.size)
+                    .add_stage('db', record))
+        metrics = pipeline.run(files, source_name='delta' if files_from_delta else 'crawl')
+        failed_records = metrics[-1].errors
+        self._add_pipeline_metrics(metrics)
+        for stage in metrics:
+            logger.debug(f"      Pipeline {stage.summary()}")
+        
+        if not files_from_delta:
+            logger.info(f"    Found {len(seen_paths)} files")
+        
+        if files_from_delta:
+            deleted_files = [path for path in deleted_paths if path in index]
+        elif not crawl_errors:
+            # A complete listing: anything stored but not listed is gone
+            deleted_files = index.missing(seen_paths)
         else:
+            deleted_files = []  # Partial listing, absence proves nothing
+        
+        if deleted_files:
+            logger.info(f"    Detected {len(deleted_files)} deleted files in '{drive_name}'")
+            self._increment_stat('files_deleted', self.db.mark_files_deleted(site_id, deleted_files))
+        
+        if not seen_paths:
+            logger.info(f"    No files found in '{drive_name}'")
+        else:
+            logger.info(f"    Changed: {changed_count}, Unchanged: {unchanged_count}")
+        
+        if unchanged_count:
+            logger.info(f"    Skipped {unchanged_count} unchanged files")
+            if unchanged_count > 5:
+                logger.info(f"      (showing first 5): {', '.join(unchanged_sample)}...")
+        
+        if changed_count:
+            logger.info(f"    Downloaded {changed_count - failed_downloads} of {changed_count} changed files "
+                        f"({self.download_workers} parallel)")
+        elif seen_paths:
             logger.info(f"    No files need downloading (all unchanged)")
+        
+        # Record this drive's files before the delta link moves past them
+        if manifest is not None:
+            manifest.save(site_path / MANIFEST_NAME)
+        
+        # Only advance the delta link once everything it covers is safely backed up
+        if new_delta_link:
+            if failed_downloads or failed_records or crawl_errors:
+                logger.warning(f"    Not saving delta link for '{drive_name}': "
+                               f"{failed_downloads} failed downloads, {failed_records} failed database records, "
+                               f"{len(crawl_errors)} crawl errors")
+            else:
+                self.db.save_delta_link(site_id, drive_id, new_delta_link)
+    
+    def _add_pipeline_metrics(self, metrics: List[StageMetrics]):
+        """Fold one drive's pipeline metrics into the run totals."""
+        with self._pipeline_metrics_lock:
+            for stage in metrics:
+                if stage.name not in self.pipeline_metrics:
+                    self.pipeline_metrics[stage.name] = StageMetrics(stage.name, stage.workers)
+                self.pipeline_metrics[stage.name].merge(stage)
     
     def _print_summary(self):
         """Print backup summary."""
@@ -511,19 +984,31 @@ class OptimizedSharePointBackup:
         logger.info(f"Files backed up: {self.stats['files_backed_up']}")
         logger.info(f"Files skipped: {self.stats['files_skipped']}")
         logger.info(f"Files failed: {self.stats['files_failed']}")
+        logger.info(f"Files deleted in source: {self.stats['files_deleted']}")
         logger.info(f"Total size: {self.stats['total_size']:,} bytes")
         logger.info(f"Bytes saved: {self.stats['bytes_saved']:,} bytes")
+        if self.blob_store:
+            logger.info(f"Bytes deduplicated by blob store: {self.stats['bytes_deduplicated']:,} bytes")
+        if self.stats['bytes_resumed']:
+            logger.info(f"Bytes resumed from interrupted downloads: {self.stats['bytes_resumed']:,} bytes")
         
         if self.stats['files_backed_up'] + self.stats['files_skipped'] > 0:
             skip_rate = (self.stats['files_skipped'] / 
                         (self.stats['files_backed_up'] + self.stats['files_skipped'])) * 100
             logger.info(f"Skip rate: {skip_rate:.1f}%")
         
+        if self.pipeline_metrics:
+            logger.info("Pipeline stages (per drive):")
+            for stage in self.pipeline_metrics.values():
+                logger.info(f"  {stage.summary()}")
+        
         logger.info("=" * 60)
 
 
 def main():
     """Command-line interface."""
+    configure_logging()
+
     # Try to load environment variables from .env file
     try:
         from dotenv import load_dotenv
@@ -549,7 +1034,33 @@ def main():
                        help='Checksum database path (default: backup_checksums.db)')
 
     parser.add_argument('--workers', type=int, default=5,
-                       help='Maximum parallel downloads (default: 5)')
+                       help='Maximum document libraries processed in parallel (default: 5)')
+
+    parser.add_argument('--download-workers', type=int, default=4,
+                       help='Parallel file downloads within each document library (default: 4)')
+
+    parser.add_argument('--max-downloads', type=int, default=16,
+                       help='Maximum concurrent downloads across all libraries (default: 16)')
+
+    parser.add_argument('--range-parts', type=int, default=4,
+                       help='Parallel byte ranges per file for files over 256 MB, 1 to disable (default: 4)')
+
+    parser.add_argument('--dedup-store', action='store_true',
+                       help='Store file contents once per SHA-256 in <backup-dir>/.blobs and write a '
+                            'manifest.json per session instead of copying files (restore with blob_store.py)')
+
+    parser.add_argument('--chunk-dedup', action='store_true',
+                       help='With the blob store, split files of 1 MB or more into content-defined chunks '
+                            'so edited versions only store changed chunks (implies --dedup-store). Chunking '
+                            'runs in pure Python at roughly 8 MB/s for the whole process, which caps the '
+                            'throughput of large changed files')
+
+    parser.add_argument('--crawl-concurrency', type=int, default=DEFAULT_CRAWL_CONCURRENCY,
+                       help='Folder listings in flight during full crawls, using httpx (HTTP/2) when '
+                            f'installed; 1 for the sequential crawl (default: {DEFAULT_CRAWL_CONCURRENCY})')
+
+    parser.add_argument('--no-delta', action='store_true',
+                       help='Disable Graph delta queries and crawl every folder on each run')
 
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Enable verbose (DEBUG) logging')
@@ -558,13 +1069,7 @@ def main():
 
     # Set logging level based on verbose flag
     if args.verbose:
-        logger.remove()
-        logger.add(
-            sys.stdout,
-            format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>",
-            level="DEBUG",
-            colorize=True
-        )
+        configure_logging("DEBUG")
         logger.info("DEBUG logging enabled")
 
     # Get credentials from environment
@@ -580,10 +1085,20 @@ def main():
     try:
         backup = OptimizedSharePointBackup(
             CLIENT_ID, CLIENT_SECRET, TENANT_ID,
-            args.backup_dir, args.db_path
+            args.backup_dir, args.db_path,
+            use_delta=not args.no_delta,
+            download_workers=args.download_workers,
+            max_concurrent_downloads=args.max_downloads,
+            range_parts=args.range_parts,
+            use_blob_store=args.dedup_store,
+            chunk_dedup=args.chunk_dedup,
+            crawl_concurrency=args.crawl_concurrency
         )
 
-        backup.backup_all_sites(args.type, args.workers)
+        try:
+            backup.backup_all_sites(args.type, args.workers)
+        finally:
+            backup.db.close()
 
     except Exception as e:
         logger.error(f"Backup failed: {str(e)}")
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Bounded Stage Pipeline
+Worker threads connected by bounded queues. Each stage takes items from its
+queue and hands its results to the next one; a full queue blocks the stage
+before it, so a slow stage slows the chain down instead of letting items pile
+up in memory. Every stage keeps throughput and queue-depth counters.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Queue capacity used when a stage does not set one
+DEFAULT_QUEUE_SIZE = 100
+
+# Tells a worker that no more items will arrive
+_DONE = object()
+
+
+class StageMetrics:
+    """Throughput and queue-depth counters of one stage (thread-safe)."""
+
+    def __init__(self, name: str, workers: int = 1):
+        """
+        Args:
+            name: Stage name shown in summaries
+            workers: Worker threads of the stage
+        """
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.bytes = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.max_queue_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Mark the start of the stage's wall-clock time."""
+        self._started = time.monotonic()
+
+    def stop(self):
+        """Mark the end of the stage's wall-clock time."""
+        if self._started is not None:
+            self.wall_seconds += time.monotonic() - self._started
+            self._started = None
+
+    def record(self, busy_seconds: float, nbytes: int = 0, error: bool = False):
+        """Count one processed item."""
+        with self._lock:
+            self.items += 1
+            self.bytes += nbytes
+            self.busy_seconds += busy_seconds
+            if error:
+                self.errors += 1
+
+    def sample_queue(self, depth: int):
+        """Record the depth of the stage's input queue."""
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            self._depth_total += depth
+            self._depth_samples += 1
+
+    @property
+    def average_queue_depth(self) -> float:
+        return self._depth_total / self._depth_samples if self._depth_samples else 0.0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.wall_seconds if self.wall_seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.wall_seconds if self.wall_seconds else 0.0
+
+    @property
+    def utilization(self) -> float:
+        """Share of the stage's worker time spent processing rather than waiting."""
+        capacity = self.wall_seconds * self.workers
+        return min(1.0, self.busy_seconds / capacity) if capacity else 0.0
+
+    def merge(self, other: 'StageMetrics'):
+        """
+        Add another run of the same stage (e.g. the next drive).
+
+        Wall time is summed, so merged rates are per-run averages.
+        """
+        with self._lock:
+            self.items += other.items
+            self.bytes += other.bytes
+            self.errors += other.errors
+            self.busy_seconds += other.busy_seconds
+            self.wall_seconds += other.wall_seconds
+            self.max_queue_depth = max(self.max_queue_depth, other.max_queue_depth)
+            self._depth_total += other._depth_total
+            self._depth_samples += other._depth_samples
+
+    def summary(self) -> str:
+        """One-line description for logs."""
+        line = f"{self.name}: {self.items:,} items, {self.items_per_second:.1f}/s"
+        if self.bytes:
+            line += f", {self.bytes_per_second / (1024 * 1024):.1f} MB/s"
+        line += f", {self.utilization:.0%} busy"
+        if self._depth_samples:
+            line += f", queue avg {self.average_queue_depth:.1f} max {self.max_queue_depth}"
+        if self.errors:
+            line += f", {self.errors} errors"
+        return line
+
+
+class _Stage:
+    def __init__(self, name: str, func: Callable[[Any], Any], workers: int, queue_size: int,
+                 measure: Optional[Callable[[Any], int]]):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.inbox: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.measure = measure
+        self.metrics = StageMetrics(name, self.workers)
+        self.live_workers = self.workers
+        self.lock = threading.Lock()
+
+
+class StagePipeline:
+    """
+    Linear chain of thread stages.
+
+    Usage:
+        pipeline = (StagePipeline()
+                    .add_stage('diff', classify)
+                    .add_stage('download', download, workers=4, queue_size=8)
+                    .add_stage('db', record))
+        metrics = pipeline.run(crawl_iterator)
+
+    A stage function receives one item; a non-None return value is passed to the
+    next stage. Exceptions are logged and counted, and the item is dropped.
+    """
+
+    def __init__(self):
+        self._stages: List[_Stage] = []
+
+    def add_stage(self, name: str, func: Callable[[Any], Any], workers: int = 1,
+                  queue_size: int = DEFAULT_QUEUE_SIZE,
+                  measure: Optional[Callable[[Any], int]] = None) -> 'StagePipeline':
+        """
+        Append a stage.
+
+        Args:
+            name: Stage name used in metrics
+            func: Processes one item; returns the item for the next stage or None
+            workers: Threads running func
+            queue_size: Capacity of the stage's input queue
+            measure: Returns the size in bytes of an input item, for byte throughput
+
+        Returns:
+            The pipeline, for chaining
+        """
+        self._stages.append(_Stage(name, func, workers, queue_size, measure))
+        return self
+
+    def _put(self, index: int, item: Any):
+        stage = self._stages[index]
+        stage.inbox.put(item)
+        stage.metrics.sample_queue(stage.inbox.qsize())
+
+    def _finish_worker(self, index: int):
+        """Called by each worker on exit; the last one closes the next stage."""
+        stage = self._stages[index]
+        with stage.lock:
+            stage.live_workers -= 1
+            last = stage.live_workers == 0
+
+        if last:
+            stage.metrics.stop()
+            if index + 1 < len(self._stages):
+                for _ in range(self._stages[index + 1].workers):
+                    self._stages[index + 1].inbox.put(_DONE)
+
+    def _work(self, index: int):
+        stage = self._stages[index]
+        has_next = index + 1 < len(self._stages)
+
+        try:
+            while True:
+                item = stage.inbox.get()
+                if item is _DONE:
+                    break
+
+                started = time.monotonic()
+                error = False
+                try:
+                    result = stage.func(item)
+                except Exception as e:
+                    logger.warning(f"Pipeline stage '{stage.name}' failed: {e}")
+                    result = None
+                    error = True
+
+                nbytes = stage.measure(item) if stage.measure else 0
+                stage.metrics.record(time.monotonic() - started, nbytes, error)
+
+                if result is not None and has_next:
+                    self._put(index + 1, result)
+        finally:
+            self._finish_worker(index)
+
+    def run(self, source: Iterable[Any], source_name: str = 'source',
+            source_measure: Optional[Callable[[Any], int]] = None) -> List[StageMetrics]:
+        """
+        Feed every item of source through the stages and wait until all are done.
+
+        The source is consumed on the calling thread; its metrics count the time
+        spent waiting for the next item as busy time.
+
+        Returns:
+            Metrics of the source followed by each stage, in order
+        """
+        if not self._stages:
+            raise ValueError("StagePipeline has no stages")
+
+        source_metrics = StageMetrics(source_name)
+        threads = []
+        for index, stage in enumerate(self._stages):
+            stage.metrics.start()
+            stage.live_workers = stage.workers
+            for worker in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index,),
+                                          name=f"{stage.name}-{worker}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        source_metrics.start()
+        try:
+            iterator = iter(source)
+            while True:
+                started = time.monotonic()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                source_metrics.record(time.monotonic() - started,
+                                      source_measure(item) if source_measure else 0)
+                self._put(0, item)
+        finally:
+            source_metrics.stop()
+            for _ in range(self._stages[0].workers):
+                self._stages[0].inbox.put(_DONE)
+            for thread in threads:
+                thread.join()
+
+        return [source_metrics] + [stage.metrics for stage in self._stages]
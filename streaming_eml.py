@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Streaming EML Writer
+Writes multipart/mixed EML files part by part so attachments are streamed from the
+HTTP response through a base64 encoder straight to disk, hashed on the way.
+Peak memory is one download chunk regardless of attachment size.
+"""
+
+import base64
+import hashlib
+import os
+import secrets
+from dataclasses import dataclass
+from email.message import Message
+from email.mime.base import MIMEBase
+from pathlib import Path
+from typing import Iterable, Optional
+
+# Attachments are read from the network in chunks of this size
+CHUNK_SIZE = 64 * 1024
+
+# base64 turns 57 input bytes into one 76-character line (RFC 2045)
+_B64_LINE_INPUT = 57
+
+
+@dataclass
+class StreamedAttachment:
+    """Result of streaming one attachment."""
+    size: int
+    sha256: str
+    content: Optional[bytes] = None  # Only kept when size <= capture_limit
+
+
+class _Capture:
+    """Hash (and optionally keep) a byte stream."""
+
+    def __init__(self, capture_limit: int):
+        self.capture_limit = capture_limit
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.buffer: Optional[bytearray] = bytearray() if capture_limit > 0 else None
+
+    def update(self, chunk: bytes):
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        if self.buffer is not None:
+            if self.size <= self.capture_limit:
+                self.buffer.extend(chunk)
+            else:
+                self.buffer = None  # Too large to keep; stop buffering
+
+    def result(self) -> StreamedAttachment:
+        content = bytes(self.buffer) if self.buffer is not None else None
+        return StreamedAttachment(self.size, self.sha256.hexdigest(), content)
+
+
+def hash_stream(chunks: Iterable[bytes], capture_limit: int = 0) -> StreamedAttachment:
+    """
+    Consume a byte stream without writing it anywhere.
+
+    Args:
+        chunks: Iterable of byte chunks (e.g. response.iter_content())
+        capture_limit: Keep the content in memory if it is at most this many bytes
+
+    Returns:
+        StreamedAttachment with size, SHA-256 and optionally the content
+    """
+    capture = _Capture(capture_limit)
+    for chunk in chunks:
+        if chunk:
+            capture.update(chunk)
+    return capture.result()
+
+
+class StreamingEmlWriter:
+    """
+    Write an EML file incrementally.
+
+    Usage:
+        with StreamingEmlWriter(path, envelope) as writer:
+            writer.write_body(body_part)
+            writer.add_attachment(name, content_type, response.iter_content(CHUNK_SIZE))
+
+    The file is written to a temporary name and only moved into place when the
+    block exits without an exception.
+    """
+
+    def __init__(self, file_path: Path, envelope: Message):
+        """
+        Args:
+            file_path: Final EML path
+            envelope: Multipart message carrying only the top-level headers (no parts)
+        """
+        self.file_path = Path(file_path)
+        self.tmp_path = self.file_path.with_name(self.file_path.name + '.tmp')
+        self.envelope = envelope
+        self.policy = envelope.policy
+        self.linesep = self.policy.linesep.encode('ascii')
+        self.boundary = '===============' + secrets.token_hex(16) + '=='
+        self.envelope.set_boundary(self.boundary)
+        self._parts = 0
+        self._file = None
+
+    def __enter__(self) -> 'StreamingEmlWriter':
+        self._file = open(self.tmp_path, 'wb')
+        self._write_headers(self.envelope)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._file.write(self.linesep + b'--' + self.boundary.encode('ascii') + b'--' + self.linesep)
+        finally:
+            self._file.close()
+
+        if exc_type is None:
+            os.replace(self.tmp_path, self.file_path)
+        else:
+            self.tmp_path.unlink(missing_ok=True)
+        return False
+
+    def _write_headers(self, message: Message):
+        for name, value in message.items():
+            self._file.write(self.policy.fold_binary(name, value))
+        self._file.write(self.linesep)
+
+    def _start_part(self):
+        # The generator puts a blank line before every boundary except the first
+        delimiter = b'--' + self.boundary.encode('ascii') + self.linesep
+        self._file.write(delimiter if self._parts == 0 else self.linesep + delimiter)
+        self._parts += 1
+
+    def write_body(self, body_part: Message):
+        """Write a small, fully built part (e.g. the MIMEText body)."""
+        self._start_part()
+        self._file.write(body_part.as_bytes(policy=self.policy))
+
+    def add_attachment(self, filename: str, content_type: str, chunks: Iterable[bytes],
+                       capture_limit: int = 0) -> StreamedAttachment:
+        """
+        Stream one attachment into the file as a base64 part.
+
+        If the stream fails part-way, the partial part is removed from the file and
+        the exception is re-raised, so the caller can skip the attachment.
+
+        Args:
+            filename: Attachment file name
+            content_type: MIME type (defaults to application/octet-stream)
+            chunks: Iterable of raw byte chunks
+            capture_limit: Also keep the content in memory if it is at most this many bytes
+
+        Returns:
+            StreamedAttachment with size, SHA-256 and optionally the content
+        """
+        maintype, subtype = content_type.split('/', 1) if content_type and '/' in content_type else (content_type, '')
+        part = MIMEBase(maintype or 'application', subtype or 'octet-stream')
+        part.add_header('Content-Disposition', 'attachment', filename=filename)
+        part['Content-Transfer-Encoding'] = 'base64'
+
+        start = self._file.tell()
+        parts_before = self._parts
+        capture = _Capture(capture_limit)
+        pending = b''
+
+        try:
+            self._start_part()
+            self._write_headers(part)
+
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                capture.update(chunk)
+
+                pending += chunk
+                usable = len(pending) - len(pending) % _B64_LINE_INPUT
+                if usable:
+                    self._write_base64(pending[:usable])
+                    pending = pending[usable:]
+
+            if pending:
+                self._write_base64(pending)
+
+        except Exception:
+            self._file.seek(start)
+            self._file.truncate()
+            self._parts = parts_before
+            raise
+
+        return capture.result()
+
+    def _write_base64(self, data: bytes):
+        encoded = base64.encodebytes(data)
+        if self.linesep != b'\n':
+            encoded = encoded.replace(b'\n', self.linesep)
+        self._file.write(encoded)
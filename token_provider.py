@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Shared Access Token Provider
+One OAuth token per (tenant, client, scope) for the whole process, shared by all
+worker threads and backup engines. A background thread renews the token shortly
+before its expires_in runs out, so requests never wait on a refresh, and
+concurrent 401s collapse into a single token request.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+import requests
+from loguru import logger
+
+GRAPH_SCOPE = 'https://graph.microsoft.com/.default'
+
+# Renew this long before the token expires
+REFRESH_MARGIN = 300
+
+# Lifetime assumed when the token response has no expires_in
+DEFAULT_EXPIRES_IN = 3600
+
+# Callers refresh the token themselves once it is this close to expiry
+# (i.e. when the background refresh keeps failing)
+EXPIRY_SLACK = 60
+
+# Wait between failed background refreshes
+RETRY_INTERVAL = 30
+
+# Returns the token endpoint response ({'access_token': ..., 'expires_in': ...})
+# or just the access token
+TokenFetcher = Callable[[], Union[str, Dict[str, Any]]]
+
+
+def client_credentials_fetcher(tenant_id: str, client_id: str, client_secret: str,
+                               scope: str = GRAPH_SCOPE, session: Optional[requests.Session] = None,
+                               timeout: float = 30) -> TokenFetcher:
+    """
+    Build a fetcher for the OAuth client credentials flow.
+
+    Args:
+        session: Session to post with (defaults to a plain requests.post)
+        timeout: Request timeout in seconds
+
+    Returns:
+        Callable returning the token endpoint's JSON response
+    """
+    token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
+    token_data = {
+        'grant_type': 'client_credentials',
+        'client_id': client_id,
+        'client_secret': client_secret,
+        'scope': scope
+    }
+
+    def fetch() -> Dict[str, Any]:
+        response = (session or requests).post(token_url, data=token_data, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    return fetch
+
+
+class TokenProvider:
+    """
+    Thread-safe access token cache with background renewal.
+
+    get_token() returns the cached token without locking. A daemon thread renews
+    it REFRESH_MARGIN seconds before expiry; invalidate() replaces a token the
+    server rejected, unless another caller already did.
+    """
+
+    def __init__(self, fetch: TokenFetcher, name: str = 'access token',
+                 refresh_margin: float = REFRESH_MARGIN):
+        """
+        Initialize token provider.
+
+        Args:
+            fetch: Requests a new token (see TokenFetcher)
+            name: Description used in log messages
+            refresh_margin: Seconds before expiry at which the token is renewed
+        """
+        self.name = name
+        self.refresh_margin = refresh_margin
+        self._fetch = fetch
+
+        self._token: Optional[str] = None
+        self._refresh_at = 0.0
+        self._stale_at = 0.0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        self.stats = {'fetches': 0, 'failures': 0, 'coalesced': 0}
+
+    def _refresh_locked(self) -> str:
+        """Fetch a new token; the caller holds the lock."""
+        result = self._fetch()
+        if isinstance(result, str):
+            token, expires_in = result, DEFAULT_EXPIRES_IN
+        else:
+            token = result.get('access_token')
+            if not token:
+                error = result.get('error_description', result.get('error', 'no access_token in response'))
+                raise Exception(f"Authentication failed: {error}")
+            expires_in = float(result.get('expires_in') or DEFAULT_EXPIRES_IN)
+
+        # Short-lived tokens are renewed halfway through their lifetime
+        now = time.monotonic()
+        self._token = token
+        self._refresh_at = now + max(expires_in - self.refresh_margin, expires_in / 2)
+        self._stale_at = now + expires_in - min(EXPIRY_SLACK, expires_in / 4)
+        self.stats['fetches'] += 1
+        self._changed.notify_all()
+        logger.debug(f"Obtained {self.name}, expires in {expires_in:.0f}s")
+        return token
+
+    def _start_refresher(self):
+        """Start the background refresh thread (caller holds the lock)."""
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run_refresher,
+                                            name=f"token-refresh-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run_refresher(self):
+        with self._changed:
+            while not self._closed:
+                delay = self._refresh_at - time.monotonic()
+                if delay > 0:
+                    self._changed.wait(delay)
+                    continue
+
+                try:
+                    logger.info(f"Refreshing {self.name}...")
+                    self._refresh_locked()
+                except Exception as e:
+                    self.stats['failures'] += 1
+                    logger.warning(f"Refreshing {self.name} failed: {e}; retrying in {RETRY_INTERVAL}s")
+                    self._changed.wait(RETRY_INTERVAL)
+
+    def get_token(self) -> str:
+        """Current access token; fetched on first use or if background renewal fell behind."""
+        token = self._token
+        if token is not None and time.monotonic() < self._stale_at:
+            return token
+
+        with self._lock:
+            if self._token is None or time.monotonic() >= self._stale_at:
+                self._refresh_locked()
+            self._start_refresher()
+            return self._token
+
+    def authorization(self) -> str:
+        """Authorization header value for the current token."""
+        return f'Bearer {self.get_token()}'
+
+    def invalidate(self, rejected_token: Optional[str] = None) -> str:
+        """
+        Replace a token the server rejected (HTTP 401).
+
+        Args:
+            rejected_token: Token sent with the failed request; if the provider
+                already holds a different one, it is returned without a new fetch.
+                None always fetches.
+
+        Returns:
+            The token to retry with
+        """
+        with self._lock:
+            if rejected_token is not None and self._token is not None and rejected_token != self._token:
+                self.stats['coalesced'] += 1
+                return self._token
+
+            logger.warning(f"{self.name} rejected, refreshing...")
+            token = self._refresh_locked()
+            self._start_refresher()
+            return token
+
+    def close(self):
+        """Stop background renewal."""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+
+_providers: Dict[Tuple[str, str, str], TokenProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_token_provider(tenant_id: str, client_id: str, client_secret: str, scope: str = GRAPH_SCOPE,
+                       fetch: Optional[TokenFetcher] = None, name: Optional[str] = None) -> TokenProvider:
+    """
+    Get the process-wide token provider of an app registration and scope.
+
+    Engines using the same credentials (e.g. SharePoint and Exchange against
+    Graph) share one token and one refresh thread.
+
+    Args:
+        scope: OAuth scope, e.g. 'https://org.crm.dynamics.com/.default'
+        fetch: Token fetcher used if the provider does not exist yet
+            (defaults to client_credentials_fetcher)
+        name: Description used in log messages
+
+    Returns:
+        Shared TokenProvider
+    """
+    key = (tenant_id, client_id, scope)
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            fetch = fetch or client_credentials_fetcher(tenant_id, client_id, client_secret, scope)
+            provider = TokenProvider(fetch, name=name or f"token for {scope}")
+            _providers[key] = provider
+        return provider